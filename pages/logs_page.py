@@ -1,4 +1,5 @@
 import streamlit as st
+from services.response_cache import ResponseCache
 from services.usage_logger import UsageLogger
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
@@ -28,6 +29,19 @@ def render_logs_page():
     with col3:
         st.metric("סה״כ טוקנים", f"{stats['total_tokens']:,}")
     
+    # Gemini response cache
+    cache_stats = ResponseCache().stats()
+    st.subheader("מטמון תשובות Gemini")
+    cols = st.columns(4)
+    with cols[0]:
+        st.metric("פגיעות", cache_stats["hits"])
+    with cols[1]:
+        st.metric("החטאות", cache_stats["misses"])
+    with cols[2]:
+        st.metric("תשובות שמורות", cache_stats["entries"])
+    with cols[3]:
+        st.metric("גודל", f"{cache_stats['bytes'] / 1024:,.0f} KB")
+    
     # Display per-model stats
     if "per_model" in stats:
         st.subheader("שימוש לפי מודל")
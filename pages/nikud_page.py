@@ -1,9 +1,42 @@
 import streamlit as st
 import tempfile
 import os
-from services.nikud_service import NikudService
+import re
+from services.nikud_service import NikudService, SectionProgress
 from services.usage_logger import streamlit_logger
 
+PREVIEW_CHARS = 300
+_SPAN_VALUE = re.compile(r'"\d+"\s*:\s*"([^"]*)')
+_BOLD_TAG = re.compile(r'</?b>')
+
+def progress_preview(text: str) -> str:
+    """The end of a (partial) answer in readable form: span answers as their values, no tags"""
+    values = _SPAN_VALUE.findall(text)
+    if values:
+        text = " · ".join(values)
+    text = _BOLD_TAG.sub('', text).replace('\n', ' ')
+    return text[-PREVIEW_CHARS:]
+
+class SectionProgressView:
+    """Overall progress bar and one line per section, updated from NikudService.on_progress"""
+
+    def __init__(self):
+        self.bar = st.progress(0.0, text="מתאים מקטעים...")
+        self.container = st.container()
+        self.rows = {}
+        self.done = set()
+
+    def __call__(self, event: SectionProgress):
+        if event.index not in self.rows:
+            self.rows[event.index] = self.container.empty()
+        if event.done:
+            icon = "✅"
+            self.done.add(event.index)
+            self.bar.progress(len(self.done) / event.total, text=f"{len(self.done)} מתוך {event.total} מקטעים")
+        else:
+            icon = "✍️" if event.text else "⏳"
+        self.rows[event.index].text(f"{icon} {event.header}: {progress_preview(event.text)}")
+
 def process_files(service: NikudService, source_file, target_file):
     """Process the uploaded files with proper temp file handling"""
     # Create temp files with unique names
@@ -36,12 +69,18 @@ def process_files(service: NikudService, source_file, target_file):
             except Exception as e:
                 st.error(f"Error cleaning up temp file {path}: {str(e)}")
 
+ENGINE_LABELS = {
+    "hybrid": "משולב - מקומי, ו-Gemini רק לחלקים קשים",
+    "local": "מקומי בלבד (ללא Gemini)",
+    "gemini": "Gemini בלבד",
+}
+
 def render_nikud_page():
     st.title("ניקוד אוטומטי")
     
     # Initialize session state
     if 'nikud_service' not in st.session_state:
-        st.session_state.nikud_service = NikudService()
+        st.session_state.nikud_service = NikudService(engine="hybrid")
     if 'processed_file' not in st.session_state:
         st.session_state.processed_file = None
     
@@ -52,15 +91,24 @@ def render_nikud_page():
         # File upload with session state
         source_file = st.file_uploader("קובץ מקור (עם ניקוד)", type=["docx"], key="source_file")
         target_file = st.file_uploader("קובץ יעד (ללא ניקוד)", type=["docx"], key="target_file")
+        st.session_state.nikud_service.engine = st.radio(
+            "מנוע ניקוד",
+            options=list(ENGINE_LABELS),
+            format_func=ENGINE_LABELS.get,
+            key="nikud_engine",
+        )
         
         if source_file and target_file:
             if st.button("התחל ניקוד", use_container_width=True, key="process_button"):
-                with st.spinner('מעבד קבצים...'):
-                    try:
-                        output_data = process_files(st.session_state.nikud_service, source_file, target_file)
-                        st.session_state.processed_file = output_data
-                    except Exception as e:
-                        st.error(f"שגיאה בעיבוד הקבצים: {str(e)}")
+                service = st.session_state.nikud_service
+                service.on_progress = SectionProgressView()
+                try:
+                    output_data = process_files(service, source_file, target_file)
+                    st.session_state.processed_file = output_data
+                except Exception as e:
+                    st.error(f"שגיאה בעיבוד הקבצים: {str(e)}")
+                finally:
+                    service.on_progress = None
             
             # Show download button if we have processed file
             if st.session_state.processed_file is not None:
@@ -1,41 +1,113 @@
+import random
 import re
-from typing import List, Dict, Tuple, Optional
+import zlib
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator, Union
 import logging
+from rapidfuzz import fuzz
+from .hebrew import HEBREW_WORD, skeleton, strip_nikud
+from .rich_text import BOLD, RichText
 from .usage_logger import streamlit_logger as st_log
 
+# Section header: a line of only 1-3 Hebrew letters (surrounding spaces allowed)
+HEADER_LETTERS = re.compile(r'[\u0590-\u05FF]{1,3}')
+HEADER_LINE = re.compile(r'^[^\S\n]*[\u0590-\u05FF]{1,3}[^\S\n]*$', re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile('[.!?]')
+
+# Section matching: MinHash blocking on the first sentence, scoring on the first words of the content
+MATCH_WORDS = 60
+MINHASH_BAND_ROWS = 2  # 16 bands of 2 rows: pairs with bigram Jaccard ~0.5 almost always collide
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EC7)
+MINHASH_PARAMS = tuple((_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(MERSENNE_PRIME)) for _ in range(32))
+
+# Chunking of oversized sections: cut points in order of preference, and the source window margin
+CHUNK_BREAKS = (re.compile(r'\n'), re.compile(r'[.!?][^\S\n]*'), re.compile(r'\s+'))
+SOURCE_WINDOW_MARGIN = 0.1
+
 class Section:
-    def __init__(self, header: str, content: str):
+    """
+    A header and a (start, end) slice of a shared document buffer.
+
+    content is sliced on access; main_content and first_sentence are extracted the first
+    time either is read and cached. When the document is a RichText, rich gives the
+    section with its formatting spans.
+    """
+    __slots__ = ('header', '_buffer', '_start', '_end', '_main', '_rich')
+
+    def __init__(self, header: str, content: Union[str, RichText], start: int = 0, end: Optional[int] = None):
         self.header = header
-        self.content = content
-        self.main_content: Optional[str] = None
-        self.first_sentence: Optional[str] = None
-        self._extract_main_content()
-        
-    def _extract_main_content(self):
+        self._rich = content if isinstance(content, RichText) else None
+        self._buffer = content.text if self._rich is not None else content
+        self._start = start
+        self._end = len(self._buffer) if end is None else end
+        self._main: Optional[Tuple[Optional[str], Optional[str]]] = None
+
+    @property
+    def start(self) -> int:
+        """Offset of the content in the document buffer"""
+        return self._start
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    @property
+    def content(self) -> str:
+        if self._start == 0 and self._end == len(self._buffer):
+            return self._buffer
+        return self._buffer[self._start:self._end]
+
+    @property
+    def rich(self) -> RichText:
+        """The content with its spans (no spans if the document was plain text)"""
+        if self._rich is None:
+            return RichText(self.content)
+        if self._start == 0 and self._end == len(self._buffer):
+            return self._rich
+        return self._rich.slice(self._start, self._end)
+
+    @property
+    def main_content(self) -> Optional[str]:
+        if self._main is None:
+            self._main = self._extract_main_content()
+        return self._main[0]
+
+    @property
+    def first_sentence(self) -> Optional[str]:
+        if self._main is None:
+            self._main = self._extract_main_content()
+        return self._main[1]
+
+    def _paragraphs(self) -> Iterator[str]:
+        """Paragraphs split on one or more blank lines, read straight from the buffer"""
+        position = self._start
+        for match in PARAGRAPH_BREAK.finditer(self._buffer, self._start, self._end):
+            yield self._buffer[position:match.start()]
+            position = match.end()
+        yield self._buffer[position:self._end]
+
+    def _extract_main_content(self) -> Tuple[Optional[str], Optional[str]]:
         """Extract main content - first substantial paragraph (200+ chars) and its following paragraphs"""
-        paragraphs = re.split(r'\n\s*\n', self.content)  # Split on one or more blank lines
-        
-        # Find first substantial paragraph (200+ chars)
         main_content = []
+        first_sentence = None
         found_main = False
         
-        for para in paragraphs:
+        for para in self._paragraphs():
             para = para.strip()
             if not found_main:
                 if len(para) >= 200:  # Changed from 100 to 200
                     found_main = True
                     main_content.append(para)
                     # Extract first sentence immediately when we find the main paragraph
-                    sentences = re.split('[.!?]', para)
-                    if sentences:
-                        self.first_sentence = sentences[0].strip()
+                    end = SENTENCE_END.search(para)
+                    first_sentence = (para[:end.start()] if end else para).strip()
             else:
                 if not para:  # Stop at first empty paragraph after main content
                     break
                 main_content.append(para)
                 
-        if main_content:
-            self.main_content = '\n\n'.join(main_content)
+        return ('\n\n'.join(main_content) if main_content else None), first_sentence
 
 class DocumentProcessor:
     def __init__(self):
@@ -43,62 +115,84 @@ class DocumentProcessor:
         
     def _is_hebrew_letter_line(self, line: str) -> bool:
         """Check if line contains only 1-3 Hebrew letters"""
-        # Remove whitespace
-        line = line.strip()
-        # Check if contains only Hebrew letters
-        hebrew_pattern = re.compile(r'^[\u0590-\u05FF]{1,3}$')
-        return bool(hebrew_pattern.match(line))
+        return HEADER_LETTERS.fullmatch(line.strip()) is not None
 
-    def split_to_sections(self, text: str) -> List[Section]:
-        """Split document into sections based on Hebrew letter delimiters"""
-        sections = []
-        current_header = ""
-        current_content = []
-        
-        st_log.log("מפצל את המסמך לחלקים...", "��")
-        
-        # Split while preserving all newlines
-        lines = text.split('\n')
-        for i, line in enumerate(lines):
+    def iter_sections(self, text: Union[str, RichText, Iterable[str]]) -> Iterator[Section]:
+        """
+        Yield sections in a single forward scan.
+
+        text is either the whole document (plain or RichText) or an iterable of lines (with or
+        without their trailing newline, e.g. an open file). Content before the first header gets
+        the header "", and headers with no lines before the next header produce no section.
+        In a RichText, a line with any bold in it is not a header (as when bold was inline
+        <b></b> tags), so bold one-word lines stay in their section.
+        """
+        bold_spans: Iterator[Tuple[int, int]] = iter(())
+        if isinstance(text, RichText):
+            document, text = text, text.text
+            bold_spans = document.iter_spans(BOLD)
+        elif isinstance(text, str):
+            document = text
+        else:
+            yield from self._iter_line_sections(text)
+            return
+
+        bold_end = -1  # end of the bold span being compared with the header lines
+        bold_start = -1
+        header = ""
+        content_start = 0
+        for match in HEADER_LINE.finditer(text):
+            # Spans and matches are both in document order
+            while bold_end <= match.start():
+                bold_start, bold_end = next(bold_spans, (len(text) + 1, len(text) + 1))
+            if bold_start < match.end():
+                continue
+            # The header line is preceded by a newline unless it is the first line
+            if match.start() > content_start:
+                yield Section(header, document, content_start, match.start() - 1)
+            header = match.group()
+            content_start = match.end() + 1
+
+        if content_start <= len(text):
+            yield Section(header, document, content_start, len(text))
+
+    def _iter_line_sections(self, lines: Iterable[str]) -> Iterator[Section]:
+        header = ""
+        content: List[str] = []
+        ends_with_newline = True  # like str.split('\n'), a trailing newline leaves one empty last line
+        for line in lines:
+            ends_with_newline = line.endswith('\n')
+            if ends_with_newline:
+                line = line[:-1]
             if self._is_hebrew_letter_line(line):
-                # Save previous section if exists
-                if current_content:
-                    # Join with original newlines
-                    content = ""
-                    for j, content_line in enumerate(current_content):
-                        content += content_line
-                        # Add original number of newlines after each line
-                        if j < len(current_content) - 1:
-                            next_non_empty = next((l for l in lines[i:] if l.strip()), None)
-                            newlines = 1
-                            if not next_non_empty:
-                                newlines = 2
-                            content += '\n' * newlines
-                    sections.append(Section(current_header, content))
-                    st_log.log(f"נמצא חלק: {line}", "📎")
-                current_header = line
-                current_content = []
+                if content:
+                    yield Section(header, '\n'.join(content))
+                header = line
+                content = []
             else:
-                current_content.append(line)
-                
-        # Add last section
-        if current_content:
-            content = ""
-            for j, line in enumerate(current_content):
-                content += line
-                if j < len(current_content) - 1:
-                    content += '\n'
-            sections.append(Section(current_header, content))
-            
+                content.append(line)
+
+        if ends_with_newline:
+            content.append("")
+        if content:
+            yield Section(header, '\n'.join(content))
+
+    def split_to_sections(self, text: Union[str, RichText, Iterable[str]]) -> List[Section]:
+        """Split document into sections based on Hebrew letter delimiters"""
+        st_log.log("מפצל את המסמך לחלקים...", "✂️")
+
+        sections = []
+        for section in self.iter_sections(text):
+            self.logger.debug(f"Section: {section.header}")
+            sections.append(section)
+
         st_log.log(f"נמצאו {len(sections)} חלקים", "✅")
         return sections
 
     def normalize_text(self, text: str) -> str:
         """Normalize text by removing nikud and optionally removing אהוי"""
-        # Remove nikud
-        text = re.sub(r'[\u05B0-\u05BC\u05C1-\u05C2\u05C4-\u05C5\u05C7]', '', text)
-        # Keep spaces
-        return text
+        # Remove nikud (translate table, keeps spaces)
+        return strip_nikud(text)
 
     def _calculate_similarity(self, text1: str, text2: str) -> float:
         """Calculate similarity between two texts using character ratio"""
@@ -106,61 +200,153 @@ class DocumentProcessor:
         shorter = min(len(text1), len(text2))
         return shorter / longer if longer > 0 else 0
 
+    def _match_words(self, text: str) -> List[str]:
+        """Words of text without nikud and ו/י, so vocalized and plain spellings compare equal"""
+        return [skeleton(word) for word in HEBREW_WORD.findall(strip_nikud(text))]
+
+    def _minhash(self, words: List[str]) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of the word bigrams (single words for one-word text)"""
+        shingles = [' '.join(words[i:i + 2]) for i in range(max(len(words) - 1, 1))] if words else []
+        hashes = {zlib.crc32(shingle.encode('utf-8')) for shingle in shingles}
+        if not hashes:
+            return None
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in MINHASH_PARAMS)
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        """LSH bands: sections sharing any band become candidates"""
+        for band in range(0, len(signature), MINHASH_BAND_ROWS):
+            yield band, signature[band:band + MINHASH_BAND_ROWS]
+
     def find_matching_sections(self, source_sections: List[Section], 
                              target_sections: List[Section],
-                             similarity_threshold: float = 0.9) -> List[Tuple[Section, Section]]:
-        """Find matching sections between source and target by comparing first sentences of main content"""
-        matches = []
-        
+                             similarity_threshold: float = 0.8) -> List[Tuple[Section, Section]]:
+        """
+        Match source and target sections one-to-one.
+
+        Candidates are blocked by MinHash bands of the first sentence, scored by rapidfuzz
+        ratio over the beginning of the main content, and assigned greedily from the best
+        score down; equal scores prefer the pair closest in section order.
+        """
         st_log.log("מחפש התאמות בין חלקי המסמכים...", "🔍")
-        
-        for source_section in source_sections:
+
+        # Index target sections by first-sentence bands
+        buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        target_keys: Dict[int, str] = {}
+        for j, target_section in enumerate(target_sections):
+            if not target_section.first_sentence:  # Skip if no substantial paragraph found
+                continue
+            signature = self._minhash(self._match_words(target_section.first_sentence))
+            if signature is None:
+                continue
+            target_keys[j] = ' '.join(self._match_words(target_section.main_content)[:MATCH_WORDS])
+            for band_key in self._band_keys(signature):
+                buckets.setdefault(band_key, []).append(j)
+
+        # Score only the candidates of each source section
+        scored = []
+        for i, source_section in enumerate(source_sections):
             if not source_section.first_sentence:  # Skip if no substantial paragraph found
                 continue
-                
-            source_normalized = self.normalize_text(source_section.first_sentence)
-            
-            best_match = None
-            best_score = 0
-            
-            for target_section in target_sections:
-                if not target_section.first_sentence:  # Skip if no substantial paragraph found
-                    continue
-                    
-                target_normalized = self.normalize_text(target_section.first_sentence)
-                
-                # Calculate similarity based on first sentences
-                score = self._calculate_similarity(source_normalized, target_normalized)
-                
-                if score > best_score and score >= similarity_threshold:
-                    best_score = score
-                    best_match = target_section
-            
-            if best_match:
-                matches.append((source_section, best_match))
-                st_log.log(f"נמצאה התאמה: {source_section.header} ↔️ {best_match.header} ({best_score:.0%})", "✨")
+            signature = self._minhash(self._match_words(source_section.first_sentence))
+            if signature is None:
+                continue
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(buckets.get(band_key, ()))
+
+            source_key = ' '.join(self._match_words(source_section.main_content)[:MATCH_WORDS])
+            for j in candidates:
+                score = fuzz.ratio(source_key, target_keys[j], score_cutoff=similarity_threshold * 100) / 100
+                if score:
+                    scored.append((-score, abs(i - j), i, j))
+
+        # One-to-one assignment, best pairs first
+        matched_sources, matched_targets = {}, set()
+        for neg_score, _, i, j in sorted(scored):
+            if i in matched_sources or j in matched_targets:
+                continue
+            matched_sources[i] = (j, -neg_score)
+            matched_targets.add(j)
+
+        matches = []
+        for i in sorted(matched_sources):
+            j, score = matched_sources[i]
+            matches.append((source_sections[i], target_sections[j]))
+            st_log.log(f"נמצאה התאמה: {source_sections[i].header} ↔️ {target_sections[j].header} ({score:.0%})", "✨")
         
         st_log.log(f"נמצאו {len(matches)} התאמות", "✅")
         return matches
 
-    def _count_bold_parts(self, text: str) -> int:
-        """Count number of bold parts in text (marked with <b></b>)"""
-        return len(re.findall(r'<b>.*?</b>', text))
-
     def prepare_for_nikud(self, source_section: Section, target_section: Section) -> Dict:
-        """Prepare content for sending to Gemini for nikud"""
-        bold_count = self._count_bold_parts(target_section.content)
-        st_log.log(f"מזהה חלקים מודגשים בחלק {target_section.header}... זוהו {bold_count} חלקים", "��")
+        """Prepare content for sending to Gemini for nikud (the target is tagged with <b></b> here, at the LLM boundary)"""
+        target = target_section.rich
+        st_log.log(f"מזהה חלקים מודגשים בחלק {target_section.header}... זוהו {target.span_count} חלקים", "🔍")
+        target_content = target.to_tagged()
         
         # Debug logs
         st_log.log("=== תוכן מקור ===", "📄")
         st_log.log(source_section.main_content[:200] + "...", "📝")
         st_log.log("=== תוכן יעד ===", "📄")
-        st_log.log(target_section.content[:200] + "...", "📝")
+        st_log.log(target_content[:200] + "...", "📝")
         
         return {
             "source_content": source_section.main_content,
-            "target_content": target_section.content,
+            "target_content": target_content,
             "source_header": source_section.header,
             "target_header": target_section.header
-        } 
\ No newline at end of file
+        } 
+
+    def prepare_spans_for_nikud(self, source_section: Section, target_section: Section) -> Dict:
+        """
+        Minimal payload for Gemini: the distinct bold spans of the target section (in order,
+        only those with Hebrew words) instead of the whole tagged section
+        """
+        target = target_section.rich
+        spans = list(dict.fromkeys(
+            target.text[start:end] for start, end in target.iter_spans(BOLD)
+            if HEBREW_WORD.search(target.text, start, end)
+        ))
+        st_log.log(f"זוהו {len(spans)} קטעים מודגשים שונים בחלק {target_section.header}", "🔍")
+        
+        return {
+            "source_content": source_section.main_content,
+            "spans": spans,
+            "source_header": source_section.header,
+            "target_header": target_section.header
+        }
+
+    def split_for_budget(self, text: str, max_chars: int) -> List[Tuple[int, int]]:
+        """
+        Cut text into consecutive (start, end) ranges of at most max_chars, at the last
+        paragraph break in each window, else the last sentence end, else the last space
+        (a hard cut only for a single longer word)
+        """
+        ranges = []
+        start = 0
+        while len(text) - start > max_chars:
+            limit = start + max_chars
+            end = limit
+            for pattern in CHUNK_BREAKS:
+                cuts = [match.end() for match in pattern.finditer(text, start + 1, limit)]
+                if cuts:
+                    end = cuts[-1]
+                    break
+            ranges.append((start, end))
+            start = end
+        ranges.append((start, len(text)))
+        return ranges
+
+    def source_window(self, source: str, start_fraction: float, end_fraction: float,
+                      margin: float = SOURCE_WINDOW_MARGIN) -> str:
+        """
+        The part of source that corresponds to a chunk covering start_fraction..end_fraction of its
+        section (commentary follows the source in order), widened by margin of the source on
+        each side and snapped outward to whitespace
+        """
+        start = max(0, int((start_fraction - margin) * len(source)))
+        end = min(len(source), int((end_fraction + margin) * len(source)) + 1)
+        while start > 0 and not source[start - 1].isspace():
+            start -= 1
+        while end < len(source) and not source[end].isspace():
+            end += 1
+        return source[start:end]
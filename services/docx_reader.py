@@ -0,0 +1,216 @@
+"""
+Streaming DOCX reader.
+
+Reads word/document.xml straight from the zip with lxml iterparse and produces the
+RichText NikudService works on, without building the python-docx object model.
+Body paragraphs are cleared as soon as they are read, so memory stays bounded by the
+largest paragraph (or table) instead of the document.
+
+The text matches python-docx 1.0.1: only direct w:p children of w:body are paragraphs,
+only their direct w:r children are runs, and run text is built from w:t, w:tab, w:ptab,
+w:br, w:cr and w:noBreakHyphen the way Run.text does.
+"""
+import zipfile
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from lxml import etree
+
+from .rich_text import BOLD, RichText, coalesce_bold_runs
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W + 'body'
+W_P = W + 'p'
+W_R = W + 'r'
+W_T = W + 't'
+W_BR = W + 'br'
+W_TBL = W + 'tbl'
+W_SDT = W + 'sdt'
+W_PPR = W + 'pPr'
+W_RPR = W + 'rPr'
+W_B = W + 'b'
+W_VAL = W + 'val'
+
+DOCUMENT_PART = 'word/document.xml'
+STYLES_PART = 'word/styles.xml'
+
+# Run content elements with fixed text (w:t and w:br are handled in child_text)
+_RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+_ON = ('1', 'true', 'on')
+
+
+def _bold_value(rpr) -> Optional[bool]:
+    """w:rPr/w:b as python-docx reads it: None when absent, True unless w:val is off"""
+    if rpr is None:
+        return None
+    b = rpr.find(W_B)
+    if b is None:
+        return None
+    val = b.get(W_VAL)
+    return val is None or val in _ON
+
+
+def child_text(child) -> str:
+    """Text of one run child (w:t, w:tab, w:br, ...), like python-docx; '' for non-text children"""
+    tag = child.tag
+    if tag == W_T:
+        return child.text or ''
+    if tag == W_BR:
+        return '\n' if child.get(W + 'type', 'textWrapping') == 'textWrapping' else ''
+    return _RUN_TEXT.get(tag, '')
+
+
+def run_text(run) -> str:
+    """Text of a w:r element, like python-docx Run.text"""
+    return ''.join([child_text(child) for child in run])
+
+
+class BoldStyles:
+    """Bold resolved through styles.xml: character style, then paragraph style, then doc defaults"""
+
+    def __init__(self, styles_xml: Optional[bytes] = None):
+        self._direct: Dict[str, Optional[bool]] = {}
+        self._based_on: Dict[str, str] = {}
+        self._resolved: Dict[str, Optional[bool]] = {}
+        self.default_paragraph_style: Optional[str] = None
+        self.default_bold: Optional[bool] = None
+        if styles_xml:
+            self._load(etree.fromstring(styles_xml))
+
+    def _load(self, root):
+        self.default_bold = _bold_value(root.find(f'{W}docDefaults/{W}rPrDefault/{W_RPR}'))
+        for style in root.iter(W + 'style'):
+            style_id = style.get(W + 'styleId')
+            if style_id is None:
+                continue
+            self._direct[style_id] = _bold_value(style.find(W_RPR))
+            based_on = style.find(W + 'basedOn')
+            if based_on is not None:
+                self._based_on[style_id] = based_on.get(W_VAL)
+            if style.get(W + 'type') == 'paragraph' and style.get(W + 'default') in _ON:
+                self.default_paragraph_style = style_id
+
+    def style_bold(self, style_id: Optional[str]) -> Optional[bool]:
+        """Bold of a style following its basedOn chain; None if no style in the chain sets it"""
+        if style_id is None:
+            return None
+        if style_id not in self._resolved:
+            seen = set()
+            value = None
+            current = style_id
+            while current is not None and current not in seen:
+                seen.add(current)
+                value = self._direct.get(current)
+                if value is not None:
+                    break
+                current = self._based_on.get(current)
+            self._resolved[style_id] = value
+        return self._resolved[style_id]
+
+    def paragraph_style(self, paragraph) -> Optional[str]:
+        ppr = paragraph.find(W_PPR)
+        style = ppr.find(W + 'pStyle') if ppr is not None else None
+        return style.get(W_VAL) if style is not None else self.default_paragraph_style
+
+    def run_bold(self, rpr, paragraph_style: Optional[str]) -> bool:
+        value = _bold_value(rpr)
+        if value is None and rpr is not None:
+            run_style = rpr.find(W + 'rStyle')
+            if run_style is not None:
+                value = self.style_bold(run_style.get(W_VAL))
+        if value is None:
+            value = self.style_bold(paragraph_style)
+        if value is None:
+            value = self.default_bold
+        return bool(value)
+
+
+def paragraph_text(paragraph, styles: Optional[BoldStyles] = None) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Text of one w:p and its bold spans, with the runs merged by coalesce_bold_runs.
+
+    Returns:
+        Tuple[str, List[Tuple[int, int]]]: (paragraph text, (start, end) of each bold part)
+    """
+    paragraph_style = styles.paragraph_style(paragraph) if styles is not None else None
+    runs = []
+    for run in paragraph.iterchildren(W_R):
+        rpr = run.find(W_RPR)
+        bold = styles.run_bold(rpr, paragraph_style) if styles is not None else bool(_bold_value(rpr))
+        runs.append((run_text(run), bold))
+
+    parts = []
+    bold_spans = []
+    length = 0
+    for text, bold in coalesce_bold_runs(runs):
+        if bold:
+            bold_spans.append((length, length + len(text)))
+        parts.append(text)
+        length += len(text)
+    return ''.join(parts), bold_spans
+
+
+def read_rich_text(file_path: str, inherit_styles: bool = False) -> RichText:
+    """
+    Read a DOCX file into a RichText: one line per paragraph, bold parts as BOLD spans.
+
+    Args:
+        file_path: path to the .docx file
+        inherit_styles: also resolve bold that comes from run/paragraph styles and doc
+                        defaults. Off by default, matching python-docx run.bold (direct
+                        formatting only), which leaves e.g. headings bold by style untagged
+    """
+    return read_paragraphs(file_path, inherit_styles)[0]
+
+
+def read_paragraphs(file_path: str, inherit_styles: bool = False) -> Tuple[RichText, List[int]]:
+    """
+    read_rich_text, plus where each body paragraph starts. Soft line breaks (w:br, w:cr)
+    are '\n' in the text as well, so a paragraph can span several lines.
+
+    Returns:
+        Tuple[RichText, List[int]]: (the text, start offset of each body paragraph in it)
+    """
+    lines = []
+    starts = []
+    spans = array('I')
+    offset = 0
+
+    with zipfile.ZipFile(file_path) as archive:
+        styles = None
+        if inherit_styles:
+            names = set(archive.namelist())
+            styles = BoldStyles(archive.read(STYLES_PART) if STYLES_PART in names else None)
+
+        with archive.open(DOCUMENT_PART) as document:
+            for _, element in etree.iterparse(document, events=('end',), tag=(W_P, W_TBL, W_SDT)):
+                parent = element.getparent()
+                if parent is None or parent.tag != W_BODY:
+                    continue  # paragraphs inside tables and content controls are not body paragraphs
+
+                if element.tag == W_P:
+                    text, bold_spans = paragraph_text(element, styles)
+                    for start, end in bold_spans:
+                        spans.extend((offset + start, offset + end, BOLD))
+                    lines.append(text)
+                    starts.append(offset)
+                    offset += len(text) + 1
+
+                # Drop the finished body child and everything before it
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    lines.append('')
+    return RichText('\n'.join(lines), spans), starts
+
+
+def read_tagged_text(file_path: str, inherit_styles: bool = False) -> Tuple[str, int]:
+    """
+    The document as text with bold parts marked by <b></b>, one line per paragraph.
+
+    Returns:
+        Tuple[str, int]: (tagged text, number of bold parts)
+    """
+    rich = read_rich_text(file_path, inherit_styles)
+    return rich.to_tagged(), rich.span_count
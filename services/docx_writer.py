@@ -0,0 +1,94 @@
+"""
+In-place DOCX patch writer.
+
+Instead of rebuilding the document, the original word/document.xml is patched: only the
+w:t text nodes whose text changed are rewritten, and every other zip member is copied
+with its original bytes and zip metadata. Formatting, styles, headers, footnotes and
+everything else the original document had survive untouched.
+
+A paragraph is only patched when its new text differs from the old one by marks (nikud,
+meteg, rafe, cantillation) alone, so the patch can never move text between runs.
+"""
+import logging
+import zipfile
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+from .docx_reader import DOCUMENT_PART, W_BODY, W_P, W_R, W_T, child_text
+from .nikud_splicer import char_chunks
+
+logger = logging.getLogger(__name__)
+
+
+def _run_pieces(run) -> List[tuple]:
+    """(w:t element or None, text) for every text-bearing child of a run, in order"""
+    pieces = []
+    for child in run:
+        text = child_text(child)
+        if child.tag == W_T:
+            pieces.append((child, text))
+        elif text:
+            pieces.append((None, text))
+    return pieces
+
+
+def patch_paragraph(paragraph, new_text: str) -> bool:
+    """
+    Write new_text into the w:t nodes of a w:p element.
+
+    Returns:
+        bool: False (nothing written) if new_text differs from the paragraph text by more than marks
+    """
+    runs = [_run_pieces(run) for run in paragraph.iterchildren(W_R)]
+    old_text = ''.join(text for pieces in runs for _, text in pieces)
+    chunks = char_chunks(old_text, new_text)
+    if chunks is None:
+        return False
+
+    position = 0
+    for pieces in runs:
+        for element, text in pieces:
+            end = position + len(text)
+            if element is not None:
+                patched = ''.join(chunks[position:end])
+                if patched != text:
+                    element.text = patched
+            position = end
+    return True
+
+
+def patch_docx(template_path: str, output_path: str, paragraphs: Dict[int, str]) -> List[int]:
+    """
+    Copy template_path to output_path with the text of some body paragraphs replaced.
+
+    Args:
+        template_path: original .docx
+        output_path: where to write the patched copy
+        paragraphs: body paragraph index -> new plain text of that paragraph (soft line breaks as '\n')
+
+    Returns:
+        List[int]: indexes of paragraphs that were not patched because their text changed
+        beyond marks
+    """
+    skipped = []
+    with zipfile.ZipFile(template_path) as source:
+        document_xml: Optional[bytes] = None
+        if paragraphs:
+            root = etree.fromstring(source.read(DOCUMENT_PART))
+            body = root.find(W_BODY)
+            for index, paragraph in enumerate(body.iterchildren(W_P)):
+                if index in paragraphs and not patch_paragraph(paragraph, paragraphs[index]):
+                    skipped.append(index)
+            document_xml = etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+        with zipfile.ZipFile(output_path, 'w') as target:
+            for info in source.infolist():
+                if info.filename == DOCUMENT_PART and document_xml is not None:
+                    target.writestr(info, document_xml)
+                else:
+                    target.writestr(info, source.read(info))
+
+    if skipped:
+        logger.warning(f"{len(skipped)} paragraphs changed beyond nikud and were left as they were")
+    return skipped
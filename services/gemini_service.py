@@ -1,11 +1,63 @@
-import os
-import google.generativeai as genai
-from typing import Dict
+import json
+import re
+from typing import AsyncIterator, Callable, Dict, Optional
 import logging
 import sys
-import streamlit as st
+from .llm_backend import GeminiBackend, LLMBackend, Prompt, Usage
+from .response_cache import DEFAULT_CACHE_PATH, ResponseCache
 from .usage_logger import streamlit_logger as st_log
 
+# Fixed few-shot example, sent before every section when few_shot is on (the same prefix on every call)
+FEW_SHOT_EXAMPLE = {
+    "source_content": "בְּרֵאשִׁית בָּרָא אֱלֹהִים אֵת הַשָּׁמַיִם וְאֵת הָאָרֶץ",
+    "target_content": "פרק א\nפירוש על <b>בראשית</b> ועל <b>ברא</b> בתורה\nהסבר נוסף כאן...",
+    "response": "פרק א\nפירוש על <b>בְּרֵאשִׁית</b> ועל <b>בָּרָא</b> בתורה\nהסבר נוסף כאן...",
+}
+
+# System instruction for minimal payloads: numbered bold spans in, JSON id -> vocalized span out
+SPAN_SYSTEM_INSTRUCTION = """אתה מערכת טכנית לניקוד טקסט עברי. תפקידך הוא אך ורק:
+1. לקבל טקסט מקור מנוקד
+2. לקבל רשימה ממוספרת של קטעים לא מנוקדים מתוך פירוש על המקור
+3. להחזיר אובייקט JSON בלבד, שמפתחותיו מספרי הקטעים וערכיו הקטעים עם ניקוד כפי שהוא במקור
+
+חשוב מאוד:
+- העתק כל קטע אות באות, כולל רווחים וסימני פיסוק, והוסף ניקוד בלבד
+- קטע שאינך יודע לנקד - השמט אותו מהתשובה
+- אל תחזיר שום טקסט מלבד ה-JSON
+
+דוגמה:
+[מקור]
+בְּרֵאשִׁית בָּרָא אֱלֹהִים
+
+[קטעים]
+1. בראשית
+2. ברא אלהים
+
+[פלט]
+{"1": "בְּרֵאשִׁית", "2": "בָּרָא אֱלֹהִים"}"""
+
+_JSON_OBJECT = re.compile(r'\{.*\}', re.S)
+
+def parse_span_response(text: str) -> Optional[Dict[int, str]]:
+    """
+    Span ids -> vocalized spans from a minimal-payload response. Tolerates code fences and
+    text around the JSON object; entries that are not id -> string are skipped.
+
+    Returns:
+        Optional[Dict[int, str]]: None if there is no parsable JSON object
+    """
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group())
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {int(key): value for key, value in data.items()
+            if str(key).strip().isdigit() and isinstance(value, str)}
+
 def setup_logger():
     """Setup detailed logging to both file and console"""
     logger = logging.getLogger('GeminiService')
@@ -31,25 +83,22 @@ def setup_logger():
     return logger
 
 class GeminiService:
-    def __init__(self):
+    def __init__(self, few_shot: bool = False, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                 backend: Optional[LLMBackend] = None):
+        """
+        Every section is an independent request with only the system instruction and that
+        section's payload (no chat history).
+
+        Args:
+            few_shot: put FEW_SHOT_EXAMPLE before each section as a user/assistant exchange
+            cache_path: SQLite response cache (None to always call the backend)
+            backend: the LLM to ask (default GeminiBackend; see services.llm_backend)
+        """
         self.logger = setup_logger()
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
         
         st_log.log("מאתחל את שירות Gemini...", "🔄")
-        
-        # Configure Gemini
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "text/plain",
-        }
-        
-        self.model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config=generation_config,
-            system_instruction="""אתה מערכת טכנית לניקוד טקסט עברי. תפקידך הוא אך ורק:
+        self.backend = backend or GeminiBackend()
+        self.system_instruction = """אתה מערכת טכנית לניקוד טקסט עברי. תפקידך הוא אך ורק:
 1. לקבל טקסט מקור מנוקד (החלק העיקרי בלבד)
 2. לקבל סקשן שלם של טקסט יעד (כולל כותרת וכל התוכן)
 3. להחזיר את הסקשן במלואו, בדיוק כפי שהוא, עם שני שינויים בלבד:
@@ -76,15 +125,35 @@ class GeminiService:
 פרק א
 פירוש על <b>בְּרֵאשִׁית</b> ועל <b>בָּרָא</b> בתורה
 הסבר נוסף כאן..."""
-        )
         
-        self.chat_session = self.model.start_chat()
+        self.few_shot_prefix = []
+        if few_shot:
+            self.few_shot_prefix = [
+                {"role": "user", "content": self._build_prompt(FEW_SHOT_EXAMPLE)},
+                {"role": "assistant", "content": FEW_SHOT_EXAMPLE["response"]},
+            ]
+        self.usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+        self.cache = ResponseCache(cache_path) if cache_path else None
         st_log.log("שירות Gemini מוכן", "✅")
 
-    def add_nikud(self, content: Dict) -> str:
-        """Process content through Gemini to add nikud"""
-        st_log.log(f"מעבד חלק: {content['target_header']}", "📝")
-        
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name
+
+    @property
+    def max_output_tokens(self) -> int:
+        return self.backend.max_output_tokens
+
+    async def count_tokens_async(self, text: str) -> int:
+        """Tokens the backend counts for text (a count_tokens request, not a generation)"""
+        return await self.backend.count_tokens(text)
+
+    async def aclose(self) -> None:
+        """Close the backend's async client for the running event loop"""
+        await self.backend.aclose()
+
+    def _build_prompt(self, content: Dict) -> str:
+        """Prompt for one matched section (see DocumentProcessor.prepare_for_nikud)"""
         prompt = f"""[טקסט מקור (עם ניקוד) - החלק העיקרי]:
 {content['source_content']}
 
@@ -97,16 +166,139 @@ class GeminiService:
 3. השאר את כל שאר הטקסט בדיוק כפי שהוא
 4. שמור על כל תגיות ה-HTML במקומן המדויק
 5. החזר את הסקשן המלא בדיוק כפי שהוא, עם ניקוד רק בחלקים המודגשים"""
+        return prompt
 
+    def _contents(self, content: Dict) -> Prompt:
+        """Request contents for one section: its prompt, after the few-shot prefix if any"""
+        prompt = self._build_prompt(content)
+        
         # Log full prompt with clear separators
         self.logger.info("\n" + "="*50 + "\nFULL GEMINI PROMPT:\n" + "="*50 + "\n" + prompt)
+        if not self.few_shot_prefix:
+            return prompt
+        return self.few_shot_prefix + [{"role": "user", "content": prompt}]
+
+    def _build_span_prompt(self, content: Dict) -> str:
+        """Prompt for the bold spans of one section (see DocumentProcessor.prepare_spans_for_nikud)"""
+        spans = "\n".join(f"{i}. {span}" for i, span in enumerate(content['spans'], 1))
+        prompt = f"""[טקסט מקור (עם ניקוד)]:
+{content['source_content']}
+
+[קטעים לניקוד]:
+{spans}"""
         
-        st_log.log("שולח בקשה ל-Gemini...", "🔄")
-        response = self.chat_session.send_message(prompt)
-        
+        # Log full prompt with clear separators
+        self.logger.info("\n" + "="*50 + "\nFULL GEMINI PROMPT:\n" + "="*50 + "\n" + prompt)
+        return prompt
+
+    def _cache_key(self, content: Dict) -> str:
+        """Everything that determines the response to a section (headers are only for the logs)"""
+        payload = {key: value for key, value in content.items() if not key.endswith('_header')}
+        config = self.backend.generation_config
+        if 'spans' in content:
+            return ResponseCache.key(self.model_name, config, "json", SPAN_SYSTEM_INSTRUCTION, payload)
+        return ResponseCache.key(self.model_name, config, self.system_instruction, self.few_shot_prefix, payload)
+
+    def cached_response(self, content: Dict) -> Optional[str]:
+        """The cached response for this section, if the same request was answered before"""
+        if self.cache is None:
+            return None
+        response = self.cache.get(self._cache_key(content))
+        if response is not None:
+            st_log.log(f"תשובה מהמטמון לחלק: {content['target_header']}", "📦")
+        return response
+
+    def _store_response(self, content: Dict, response: str) -> None:
+        if self.cache is not None:
+            self.cache.put(self._cache_key(content), response)
+
+    def discard_cached(self, content: Dict) -> None:
+        """Forget the cached response for this section (it failed validation)"""
+        if self.cache is not None:
+            self.cache.delete(self._cache_key(content))
+
+    def _log_response(self, text: str, usage: Usage) -> str:
         # Log full response with clear separators
-        self.logger.info("\n" + "="*50 + "\nFULL GEMINI RESPONSE:\n" + "="*50 + "\n" + response.text)
+        self.logger.info("\n" + "="*50 + "\nFULL GEMINI RESPONSE:\n" + "="*50 + "\n" + text)
         
-        st_log.log(f"התקבלה תשובה מ-Gemini", "✨")
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += usage.prompt_tokens
+        self.usage["output_tokens"] += usage.output_tokens
+        self.logger.info(f"Tokens: {usage.prompt_tokens} prompt, {usage.output_tokens} output")
+        st_log.log(f"התקבלה תשובה מ-{self.model_name} ({usage.prompt_tokens} טוקנים בקלט, "
+                   f"{usage.output_tokens} בפלט)", "✨")
+        return text
+
+    def add_nikud(self, content: Dict) -> str:
+        """Process content through Gemini to add nikud"""
+        cached = self.cached_response(content)
+        if cached is not None:
+            return cached
+        st_log.log(f"מעבד חלק: {content['target_header']}", "📝")
+        contents = self._contents(content)
+        
+        st_log.log("שולח בקשה ל-Gemini...", "🔄")
+        completion = self.backend.generate(contents, self.system_instruction)
+        text = self._log_response(completion.text, completion.usage)
+        self._store_response(content, text)
+        return text
+
+    async def stream_async(self, content: Dict, check_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Gemini's answer to a section payload (prepare_for_nikud) or a span payload
+        (prepare_spans_for_nikud), yielded in pieces as it is generated. A cached answer
+        comes as one piece; the full answer is cached once the stream ends.
+
+        Args:
+            check_cache: False if the caller already looked the section up with cached_response
+        """
+        cached = self.cached_response(content) if check_cache else None
+        if cached is not None:
+            yield cached
+            return
+        if 'spans' in content:
+            st_log.log(f"מעבד {len(content['spans'])} קטעים מודגשים בחלק: {content['target_header']}", "📝")
+            stream = self.backend.stream(self._build_span_prompt(content), SPAN_SYSTEM_INSTRUCTION, json_output=True)
+        else:
+            st_log.log(f"מעבד חלק: {content['target_header']}", "📝")
+            stream = self.backend.stream(self._contents(content), self.system_instruction)
         
-        return response.text 
\ No newline at end of file
+        st_log.log("שולח בקשה ל-Gemini...", "🔄")
+        pieces = []
+        usage = Usage()
+        async for piece in stream:
+            if piece.text:
+                pieces.append(piece.text)
+                yield piece.text
+            if piece.usage is not None:
+                usage = piece.usage
+        text = self._log_response(''.join(pieces), usage)
+        self._store_response(content, text)
+
+    async def _collect(self, content: Dict, check_cache: bool,
+                       on_partial: Optional[Callable[[str], None]]) -> str:
+        """The whole streamed answer; on_partial gets the text so far after every piece"""
+        pieces = []
+        async for piece in self.stream_async(content, check_cache):
+            pieces.append(piece)
+            if on_partial is not None:
+                on_partial(''.join(pieces))
+        return ''.join(pieces)
+
+    async def add_nikud_async(self, content: Dict, check_cache: bool = True,
+                              on_partial: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Process content through Gemini without blocking the event loop.
+        Requests share no state, so calls can run concurrently. Content with "spans" is the
+        minimal payload: only the numbered bold spans and the source go out, and the answer
+        is JSON id -> vocalized span (parse with parse_span_response), so output grows with
+        the bold text rather than with the section.
+
+        Args:
+            check_cache: False if the caller already looked the section up with cached_response
+            on_partial: called with the answer so far as it streams in
+        """
+        return await self._collect(content, check_cache, on_partial)
+
+    # The payload kind is read from content, so span payloads take the same path
+    vocalize_spans_async = add_nikud_async
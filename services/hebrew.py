@@ -0,0 +1,112 @@
+"""
+Shared Hebrew normalization.
+
+Nikud is stripped with precomputed str.translate tables instead of per-call regex
+substitution. strip_with_offsets also returns an array('I') that maps every position
+of the normalized text back to its position in the original text, so a position found
+by comparing stripped text can be reported in the original (see response_validator).
+"""
+import hashlib
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# Vowel points incl. dagesh (U+05B0–U+05BC), shin/sin dots, upper/lower dots, qamats qatan
+NIKUD = ''.join(chr(c) for c in range(0x05B0, 0x05BD)) + '\u05C1\u05C2\u05C4\u05C5\u05C7'
+METEG = '\u05BD'
+RAFE = '\u05BF'
+CANTILLATION = ''.join(chr(c) for c in range(0x0591, 0x05B0))  # טעמי המקרא
+MARKS = frozenset(NIKUD + METEG + RAFE + CANTILLATION)  # כל הסימנים שנצמדים לאות
+
+MATRES = '\u05D5\u05D9'  # ו, י
+MATRES_TABLE = str.maketrans('', '', MATRES)
+
+HEBREW_WORD = re.compile(r'[\u0590-\u05FF]+')
+_HAS_NIKUD = re.compile(f'[{NIKUD}]')
+_PRESENTATION_FORMS = range(0xFB1D, 0xFB50)
+
+FORMS = (None, 'NFC', 'NFD')
+
+
+@lru_cache(maxsize=None)
+def _table(cantillation: bool, meteg: bool, rafe: bool, form: Optional[str]) -> Dict[int, Optional[str]]:
+    """translate table for one combination of options (built once per combination)"""
+    if form not in FORMS:
+        raise ValueError(f"Unknown normalization form: {form}")
+
+    removed = NIKUD + (CANTILLATION if cantillation else '') + (METEG if meteg else '') + (RAFE if rafe else '')
+    table: Dict[int, Optional[str]] = {ord(c): None for c in removed}
+
+    if form is not None:
+        # Hebrew presentation forms (e.g. U+FB2C) decompose to letter + marks under both
+        # NFC and NFD; map them to the decomposed letter with the removed marks dropped
+        for code in _PRESENTATION_FORMS:
+            decomposed = unicodedata.normalize(form, chr(code))
+            if decomposed != chr(code):
+                table[code] = ''.join(c for c in decomposed if c not in removed)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _special_chars(cantillation: bool, meteg: bool, rafe: bool, form: Optional[str]) -> re.Pattern:
+    """Regex matching runs of characters the table deletes or expands"""
+    chars = ''.join(chr(code) for code in _table(cantillation, meteg, rafe, form))
+    return re.compile(f'[{re.escape(chars)}]+')
+
+
+def strip_nikud(text: str, cantillation: bool = False, meteg: bool = True,
+                rafe: bool = True, form: Optional[str] = None) -> str:
+    """Remove nikud (and optionally cantillation, meteg, rafe) from text"""
+    return text.translate(_table(cantillation, meteg, rafe, form))
+
+
+def strip_with_offsets(text: str, cantillation: bool = False, meteg: bool = True,
+                       rafe: bool = True, form: Optional[str] = None) -> Tuple[str, array]:
+    """
+    Strip nikud and return an offset map.
+
+    Returns:
+        Tuple[str, array]: (normalized text, offsets) where offsets[i] is the position in
+        text of normalized character i; offsets has one extra entry equal to len(text)
+    """
+    table = _table(cantillation, meteg, rafe, form)
+    parts = []
+    offsets = array('I')
+    position = 0
+
+    # Plain segments are copied and mapped in bulk; only special characters are handled one by one
+    for match in _special_chars(cantillation, meteg, rafe, form).finditer(text):
+        start, end = match.span()
+        if start > position:
+            parts.append(text[position:start])
+            offsets.extend(range(position, start))
+        if form is not None:
+            for i in range(start, end):
+                replacement = table[ord(text[i])]
+                if replacement:
+                    parts.append(replacement)
+                    offsets.extend([i] * len(replacement))
+        position = end
+
+    parts.append(text[position:])
+    offsets.extend(range(position, len(text) + 1))
+    return ''.join(parts), offsets
+
+
+@lru_cache(maxsize=None)
+def normalization_digest() -> str:
+    """Digest of the default strip_nikud table and the skeleton table, for caches of normalized words"""
+    tables = (sorted(_table(False, True, True, None).items()), sorted(MATRES_TABLE.items()))
+    return hashlib.sha1(repr(tables).encode('utf-8')).hexdigest()
+
+
+def has_nikud(text: str) -> bool:
+    """True if text contains at least one vowel point"""
+    return _HAS_NIKUD.search(text) is not None
+
+
+def skeleton(word: str) -> str:
+    """Word without ו/י, so full and defective spelling (הקודש / הקדש) share a key"""
+    return word.translate(MATRES_TABLE)
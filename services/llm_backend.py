@@ -0,0 +1,347 @@
+"""
+LLM backends behind one interface.
+
+The services talk to a backend (generate, stream, count_tokens, usage) instead of calling
+google.generativeai or anthropic directly:
+- GeminiBackend and AnthropicBackend are the network adapters;
+- ReplayBackend serves responses recorded in a JSON-lines file, with synthetic latency, so
+  the whole pipeline can be tested and benchmarked offline and reproducibly. Given a backend
+  to record from, it forwards requests it has no recording for and appends their responses.
+
+A prompt is either a string (one user message) or a list of {"role": "user" | "assistant",
+"content": str} messages.
+
+Async clients (grpc.aio, httpx) are bound to the event loop they first run on, so the
+adapters make one per running loop and close it in aclose(): a caller that runs each job
+with asyncio.run gets a fresh client every time instead of one tied to a closed loop.
+"""
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Union
+
+import anthropic
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import client as genai_client
+
+from .response_cache import ResponseCache
+
+Prompt = Union[str, List[Dict[str, str]]]
+
+# Errors worth retrying: quota, overload, server-side failures and timeouts
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+    anthropic.APIConnectionError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+# Rough token estimate for backends that cannot count (pointed Hebrew is token-dense)
+ESTIMATED_CHARS_PER_TOKEN = 3
+REPLAY_CHUNK_CHARS = 40
+
+
+@dataclass(frozen=True)
+class Usage:
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass(frozen=True)
+class Completion:
+    """Generated text; usage is set on a generate result and on the last piece of a stream"""
+    text: str
+    usage: Optional[Usage] = None
+
+
+class LLMBackend(Protocol):
+    model_name: str
+    generation_config: Dict  # with model_name, everything besides the prompt that shapes a response
+    max_output_tokens: int
+    usage: Dict[str, int]  # requests, prompt_tokens, output_tokens since the backend was created
+
+    def generate(self, prompt: Prompt, system: str = "", json_output: bool = False) -> Completion:
+        """The whole response to one stateless request"""
+        ...
+
+    def stream(self, prompt: Prompt, system: str = "", json_output: bool = False) -> AsyncIterator[Completion]:
+        """The response in pieces as it is generated; the last piece carries the usage"""
+        ...
+
+    async def count_tokens(self, text: str) -> int:
+        ...
+
+    async def aclose(self) -> None:
+        """Close the async client of the running event loop (before the loop closes)"""
+        ...
+
+
+class _UsageCounter:
+    def _reset_usage(self):
+        self.usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def _count(self, usage: Usage) -> Usage:
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += usage.prompt_tokens
+        self.usage["output_tokens"] += usage.output_tokens
+        return usage
+
+
+def _messages(prompt: Prompt) -> List[Dict[str, str]]:
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+
+class GeminiBackend(_UsageCounter):
+    DEFAULT_GENERATION_CONFIG = {
+        "temperature": 1,
+        "top_p": 0.95,
+        "top_k": 40,
+        "max_output_tokens": 8192,
+        "response_mime_type": "text/plain",
+    }
+
+    def __init__(self, model_name: str = "gemini-2.0-flash", generation_config: Optional[Dict] = None,
+                 api_key: Optional[str] = None):
+        """
+        Args:
+            api_key: defaults to GEMINI_API_KEY from the Streamlit secrets
+        """
+        if api_key is None:
+            import streamlit as st
+            api_key = st.secrets["GEMINI_API_KEY"]
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or self.DEFAULT_GENERATION_CONFIG)
+        self._models: Dict[tuple, genai.GenerativeModel] = {}
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_client = None
+        self._reset_usage()
+
+    @property
+    def max_output_tokens(self) -> int:
+        return self.generation_config["max_output_tokens"]
+
+    def _model(self, system: str, json_output: bool) -> genai.GenerativeModel:
+        # One GenerativeModel per system instruction and output type
+        key = (system, json_output)
+        if key not in self._models:
+            config = self.generation_config
+            if json_output:
+                config = {**config, "response_mime_type": "application/json"}
+            self._models[key] = genai.GenerativeModel(model_name=self.model_name, generation_config=config,
+                                                      system_instruction=system or None)
+        return self._models[key]
+
+    def _async_model(self, system: str, json_output: bool) -> genai.GenerativeModel:
+        """
+        _model with an async client made for the running loop. genai otherwise caches one
+        process-wide async client, which fails once the loop it first ran on is closed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = genai_client._client_manager.make_client("generative_async")
+            self._async_loop = loop
+        model = self._model(system, json_output)
+        model._async_client = self._async_client
+        return model
+
+    @staticmethod
+    def _contents(prompt: Prompt) -> Union[str, List[Dict]]:
+        if isinstance(prompt, str):
+            return prompt
+        return [{"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+                for message in prompt]
+
+    @staticmethod
+    def _usage(metadata) -> Usage:
+        return Usage(metadata.prompt_token_count, metadata.candidates_token_count)
+
+    def generate(self, prompt: Prompt, system: str = "", json_output: bool = False) -> Completion:
+        response = self._model(system, json_output).generate_content(self._contents(prompt))
+        return Completion(response.text, self._count(self._usage(response.usage_metadata)))
+
+    async def stream(self, prompt: Prompt, system: str = "", json_output: bool = False) -> AsyncIterator[Completion]:
+        model = self._async_model(system, json_output)
+        response = await model.generate_content_async(self._contents(prompt), stream=True)
+        async for chunk in response:
+            yield Completion(chunk.text)
+        yield Completion("", self._count(self._usage(response.usage_metadata)))
+
+    async def count_tokens(self, text: str) -> int:
+        return (await self._async_model("", False).count_tokens_async(text)).total_tokens
+
+    async def aclose(self) -> None:
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.transport.close()
+        self._async_client = self._async_loop = None
+
+
+class AnthropicBackend(_UsageCounter):
+    def __init__(self, model_name: str = "claude-sonnet-4-6", max_tokens: int = 4096,
+                 api_key: Optional[str] = None):
+        """
+        Args:
+            api_key: defaults to ANTHROPIC_API_KEY from the Streamlit secrets
+        """
+        if api_key is None:
+            import streamlit as st
+            api_key = st.secrets["ANTHROPIC_API_KEY"]
+        self.api_key = api_key
+        self.client = anthropic.Anthropic(api_key=api_key)
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_client: Optional[anthropic.AsyncAnthropic] = None
+        self.model_name = model_name
+        self.generation_config = {"max_tokens": max_tokens}
+        self._reset_usage()
+
+    @property
+    def max_output_tokens(self) -> int:
+        return self.generation_config["max_tokens"]
+
+    def _request(self, prompt: Prompt, system: str) -> Dict:
+        # No JSON response mode in the Messages API: json_output relies on the prompt asking for JSON
+        request = {"model": self.model_name, "messages": _messages(prompt), **self.generation_config}
+        if system:
+            request["system"] = system
+        return request
+
+    @staticmethod
+    def _usage(usage) -> Usage:
+        return Usage(usage.input_tokens, usage.output_tokens)
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """The async client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = anthropic.AsyncAnthropic(api_key=self.api_key)
+            self._async_loop = loop
+        return self._async_client
+
+    def generate(self, prompt: Prompt, system: str = "", json_output: bool = False) -> Completion:
+        message = self.client.messages.create(**self._request(prompt, system))
+        text = ''.join(block.text for block in message.content if block.type == "text")
+        return Completion(text, self._count(self._usage(message.usage)))
+
+    async def stream(self, prompt: Prompt, system: str = "", json_output: bool = False) -> AsyncIterator[Completion]:
+        async with self.async_client.messages.stream(**self._request(prompt, system)) as stream:
+            async for text in stream.text_stream:
+                yield Completion(text)
+            message = await stream.get_final_message()
+        yield Completion("", self._count(self._usage(message.usage)))
+
+    async def count_tokens(self, text: str) -> int:
+        result = await self.async_client.messages.count_tokens(model=self.model_name, messages=_messages(text))
+        return result.input_tokens
+
+    async def aclose(self) -> None:
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.close()
+        self._async_client = self._async_loop = None
+
+
+class ReplayBackend(_UsageCounter):
+    def __init__(self, path: str, record_from: Optional[LLMBackend] = None, latency: float = 0.0,
+                 seconds_per_chunk: float = 0.0, chunk_chars: int = REPLAY_CHUNK_CHARS,
+                 model_name: str = "replay", max_output_tokens: int = 8192):
+        """
+        Args:
+            path: JSON-lines recordings, one {"key", "text", "prompt_tokens", "output_tokens"} per line
+            record_from: backend for requests with no recording (None - they raise LookupError)
+            latency: seconds before the first piece of a replayed response
+            seconds_per_chunk: seconds between replayed pieces of chunk_chars characters
+            model_name, max_output_tokens: as reported to callers (record_from's when given)
+        """
+        self.path = Path(path)
+        self.record_from = record_from
+        self.latency = latency
+        self.seconds_per_chunk = seconds_per_chunk
+        self.chunk_chars = chunk_chars
+        self.model_name = record_from.model_name if record_from else model_name
+        self.generation_config = record_from.generation_config if record_from else {}
+        self.max_output_tokens = record_from.max_output_tokens if record_from else max_output_tokens
+        self._lock = threading.Lock()
+        self.recordings: Dict[str, Completion] = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.recordings[record["key"]] = Completion(
+                            record["text"], Usage(record["prompt_tokens"], record["output_tokens"]))
+        self._reset_usage()
+
+    @staticmethod
+    def key(prompt: Prompt, system: str, json_output: bool) -> str:
+        """Recordings are keyed by request content only, so they replay under any model name"""
+        return ResponseCache.key(_messages(prompt), system, json_output)
+
+    def _record(self, key: str, completion: Completion) -> None:
+        self.recordings[key] = completion
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": key, "text": completion.text,
+                                    "prompt_tokens": completion.usage.prompt_tokens,
+                                    "output_tokens": completion.usage.output_tokens},
+                                   ensure_ascii=False) + "\n")
+
+    def _recording(self, key: str) -> Completion:
+        if key not in self.recordings:
+            raise LookupError(f"No recorded response in {self.path} for request {key[:12]}")
+        return self.recordings[key]
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+
+    def generate(self, prompt: Prompt, system: str = "", json_output: bool = False) -> Completion:
+        key = self.key(prompt, system, json_output)
+        if key not in self.recordings and self.record_from is not None:
+            completion = self.record_from.generate(prompt, system, json_output)
+            self._record(key, completion)
+        else:
+            completion = self._recording(key)
+            time.sleep(self.latency + self.seconds_per_chunk * (len(self._chunks(completion.text)) - 1))
+        self._count(completion.usage)
+        return completion
+
+    async def stream(self, prompt: Prompt, system: str = "", json_output: bool = False) -> AsyncIterator[Completion]:
+        key = self.key(prompt, system, json_output)
+        if key not in self.recordings and self.record_from is not None:
+            pieces = []
+            async for piece in self.record_from.stream(prompt, system, json_output):
+                pieces.append(piece.text)
+                if piece.usage is None:
+                    yield piece
+                else:
+                    self._record(key, Completion(''.join(pieces), piece.usage))
+                    yield Completion(piece.text, self._count(piece.usage))
+            return
+
+        completion = self._recording(key)
+        await asyncio.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(completion.text)):
+            if i:
+                await asyncio.sleep(self.seconds_per_chunk)
+            yield Completion(chunk)
+        yield Completion("", self._count(completion.usage))
+
+    async def count_tokens(self, text: str) -> int:
+        if self.record_from is not None:
+            return await self.record_from.count_tokens(text)
+        return len(text) // ESTIMATED_CHARS_PER_TOKEN
+
+    async def aclose(self) -> None:
+        if self.record_from is not None:
+            await self.record_from.aclose()
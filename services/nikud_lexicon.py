@@ -0,0 +1,264 @@
+"""
+Persistent nikud lexicon: stripped word -> vocalized forms with frequencies.
+
+The lexicon is harvested from every vocalized source that is processed and kept in
+a memory-mappable file, so loading it costs one mmap regardless of its size:
+
+    header      '<8sIIII'  magic, entry count, keys size, values size, sources size
+    key_offsets (n + 1) x uint32, native byte order
+    val_offsets (n + 1) x uint32, native byte order
+    keys        UTF-8 keys, sorted by their bytes
+    values      per key: "form<US>count<RS>form<US>count...", most frequent first
+    sources     newline separated digests of the harvested sources
+
+Lookups binary-search the mapped key offsets; nothing is parsed up front. harvest holds
+an exclusive lock on "<path>.lock" from reading the lexicon until the merged file replaces
+it, so concurrent sessions add their sources instead of overwriting each other's.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, harvests are not serialized
+    fcntl = None
+
+from .hebrew import HEBREW_WORD, has_nikud, strip_nikud
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NKLEX\x00\x01\x00'
+HEADER = struct.Struct('<8sIIII')
+UNIT_SEP = '\x1f'
+RECORD_SEP = '\x1e'
+
+DEFAULT_LEXICON_PATH = 'data/nikud_lexicon.bin'
+
+
+def source_digest(words: Iterable[str]) -> str:
+    """Digest identifying a harvested source by its vocalized words"""
+    digest = hashlib.sha1()
+    for word in words:
+        digest.update(word.encode('utf-8'))
+        digest.update(b' ')
+    return digest.hexdigest()
+
+
+class NikudLexicon:
+    """Read-only, memory-mapped view of a lexicon file"""
+
+    def __init__(self, path: str = DEFAULT_LEXICON_PATH):
+        self.path = path
+        self._mmap = None
+        self._count = 0
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            self._open()
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, keys_size, values_size, sources_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a nikud lexicon: {self.path}")
+
+        view = memoryview(self._mmap)
+        table_size = 4 * (count + 1)
+        pos = HEADER.size
+        self._count = count
+        self._key_offsets = view[pos:pos + table_size].cast('I')
+        pos += table_size
+        self._value_offsets = view[pos:pos + table_size].cast('I')
+        pos += table_size
+        self._keys = view[pos:pos + keys_size]
+        pos += keys_size
+        self._values = view[pos:pos + values_size]
+        pos += values_size
+        self._sources = view[pos:pos + sources_size]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._keys[self._key_offsets[i]:self._key_offsets[i + 1]])
+
+    def _find(self, word: str) -> int:
+        """Binary search for a stripped word; -1 if missing"""
+        key = word.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == key:
+            return lo
+        return -1
+
+    def forms(self, word: str) -> List[Tuple[str, int]]:
+        """All vocalized forms of a stripped word with their frequencies, most frequent first"""
+        i = self._find(word)
+        if i < 0:
+            return []
+        raw = bytes(self._values[self._value_offsets[i]:self._value_offsets[i + 1]]).decode('utf-8')
+        forms = []
+        for record in raw.split(RECORD_SEP):
+            form, count = record.split(UNIT_SEP)
+            forms.append((form, int(count)))
+        return forms
+
+    def lookup(self, word: str) -> Optional[str]:
+        """Most frequent vocalized form of a word (nikud in the word is ignored)"""
+        forms = self.forms(strip_nikud(word))
+        return forms[0][0] if forms else None
+
+    def entries(self) -> Iterable[Tuple[str, List[Tuple[str, int]]]]:
+        """Iterate over (stripped word, forms) in key order"""
+        for i in range(self._count):
+            word = self._key(i).decode('utf-8')
+            yield word, self.forms(word)
+
+    def sources(self) -> List[str]:
+        """Digests of the sources already harvested into this lexicon"""
+        if self._mmap is None:
+            return []
+        return bytes(self._sources).decode('ascii').split()
+
+    def close(self):
+        if self._mmap is not None:
+            self._key_offsets.release()
+            self._value_offsets.release()
+            self._keys.release()
+            self._values.release()
+            self._sources.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+class LexiconBuilder:
+    """Accumulates vocalized words in memory and writes a lexicon file"""
+
+    def __init__(self):
+        self.counts: Dict[str, Counter] = {}
+        self.sources: List[str] = []
+
+    def merge(self, lexicon: NikudLexicon) -> 'LexiconBuilder':
+        """Start from the entries of an existing lexicon"""
+        for word, forms in lexicon.entries():
+            self.counts.setdefault(word, Counter()).update(dict(forms))
+        self.sources.extend(lexicon.sources())
+        return self
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """Count every vocalized word under its stripped key"""
+        for word in words:
+            if has_nikud(word):
+                self.counts.setdefault(strip_nikud(word), Counter())[word] += 1
+
+    def add_text(self, text: str) -> None:
+        self.add_words(HEBREW_WORD.findall(text))
+
+    def write(self, path: str) -> None:
+        """Write the lexicon atomically, so mapped readers never see a partial file"""
+        keys = sorted((word.encode('utf-8'), word) for word in self.counts)
+        key_offsets = array('I', [0])
+        value_offsets = array('I', [0])
+        key_parts = []
+        value_parts = []
+        for encoded, word in keys:
+            key_parts.append(encoded)
+            key_offsets.append(key_offsets[-1] + len(encoded))
+            value = RECORD_SEP.join(f"{form}{UNIT_SEP}{count}"
+                                    for form, count in self.counts[word].most_common()).encode('utf-8')
+            value_parts.append(value)
+            value_offsets.append(value_offsets[-1] + len(value))
+
+        keys_blob = b''.join(key_parts)
+        values_blob = b''.join(value_parts)
+        sources_blob = '\n'.join(self.sources).encode('ascii')
+
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own in the same directory, so writers never share one
+        tmp = tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + '.',
+                                          suffix='.tmp', delete=False)
+        try:
+            with tmp as f:
+                f.write(HEADER.pack(MAGIC, len(keys), len(keys_blob), len(values_blob), len(sources_blob)))
+                f.write(key_offsets.tobytes())
+                f.write(value_offsets.tobytes())
+                f.write(keys_blob)
+                f.write(values_blob)
+                f.write(sources_blob)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """Exclusive lock on "<path>.lock" for a read-merge-replace of the lexicon at path"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def harvest(path: str, nikud_words: Iterable[str]) -> bool:
+    """
+    Add a vocalized source to the lexicon at path, once per source.
+
+    Returns:
+        bool: True if the lexicon was updated, False if the source was already harvested
+    """
+    nikud_words = list(nikud_words)
+    digest = source_digest(nikud_words)
+
+    with _locked(path):
+        lexicon = NikudLexicon(path)
+        try:
+            if digest in lexicon.sources():
+                return False
+            builder = LexiconBuilder().merge(lexicon)
+        finally:
+            lexicon.close()
+
+        builder.add_words(nikud_words)
+        builder.sources.append(digest)
+        builder.write(path)
+    logger.info(f"Lexicon {path}: {len(builder.counts)} entries")
+    return True
+
+
+def _read_source(file_path: str) -> str:
+    if file_path.endswith('.docx'):
+        from docx import Document
+        return '\n'.join(p.text for p in Document(file_path).paragraphs)
+    with open(file_path, encoding='utf-8') as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m services.nikud_lexicon <lexicon_path> <source.docx|source.txt>...")
+        sys.exit(1)
+
+    for source_file in sys.argv[2:]:
+        updated = harvest(sys.argv[1], HEBREW_WORD.findall(_read_source(source_file)))
+        print(f"{'✓' if updated else '-'} {source_file}")
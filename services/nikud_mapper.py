@@ -1,21 +1,80 @@
 import re
-from typing import Dict, List, Optional, Tuple
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from docx import Document
 from docx.shared import RGBColor
-from rapidfuzz import fuzz
+import numpy as np
+from rapidfuzz import fuzz, process
 import logging
 from difflib import SequenceMatcher, Match
 
+from .hebrew import HEBREW_WORD, MATRES, has_nikud, skeleton, strip_nikud
+from .nikud_lexicon import NikudLexicon, harvest
+from .nikud_splicer import letter_groups, splice_runs, splice_words
+from .rich_text import BOLD, RichText
+from .source_index import SourceIndex
+from .word_alignment import filter_regions, monotonic_alignment
+
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
+HOLAM = '\u05B9'
+QUBUTS = '\u05BB'
+DAGESH = '\u05BC'
+
+MODES = ('window', 'align')
+
+# מצב תהליך עובד במאגר התהליכים - נטען פעם אחת לכל תהליך דרך ה-initializer
+_worker_mapper: Optional['NikudMapper'] = None
+_worker_index: Optional[SourceIndex] = None
+
+def _init_worker(mapper: 'NikudMapper', index: SourceIndex) -> None:
+    global _worker_mapper, _worker_index
+    mapper.workers = 1  # כל תהליך עובד על ליבה אחת
+    _worker_mapper = mapper
+    _worker_index = index
+
+def _map_paragraph(paragraph_text: str) -> List[int]:
+    words = HEBREW_WORD.findall(paragraph_text)
+    return _worker_mapper._map_words(_worker_index, paragraph_text, words)
+
 class NikudMapper:
-    def __init__(self, bold_only: bool = False):
+    def __init__(self, bold_only: bool = False, shingle_size: int = 3,
+                 max_anchor_hits: int = 64, max_gap: int = 3, mode: str = 'window',
+                 persist_index: bool = False, workers: int = -1,
+                 lexicon_path: Optional[str] = None, processes: int = 1,
+                 chunk_size: int = 8, parallel_min_paragraphs: int = 64,
+                 banded: bool = True, band_size: int = 2000):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
         self.bold_only = bold_only
-        self.nikud_patterns = {
-            'nikud': r'[\u05B0-\u05BC\u05C1-\u05C2\u05C4-\u05C5\u05C7]',
-            'hebrew': r'[\u0590-\u05FF]'
-        }
+        self.mode = mode  # window - חלון חפיפה אחד לכל פסקה, align - יישור מונוטוני של כל המסמך
+        self.shingle_size = shingle_size  # מספר מילים בכל עוגן
+        self.max_anchor_hits = max_anchor_hits  # עוגנים נפוצים מדי (מילות קישור) לא משמשים לחיפוש
+        self.max_gap = max_gap  # מספר אי-התאמות רצופות שמותר לדלג עליהן בהרחבת עוגן
+        self.min_size = 20  # מינימום מילים לחפיפה
+        self.max_window = 300  # גודל חלון מקסימלי
+        self.similarity_threshold = 85  # סף דמיון מופחת
+        self.persist_index = persist_index  # שמירת אינדקס המקור לדיסק ליד קובץ המקור
+        self.workers = workers  # ליבות לדירוג עמום ב-cdist (‎-1 = כל הליבות)
+        self.lexicon_path = lexicon_path  # מילון ניקוד לגיבוי למילים שלא נמצאה להן חפיפה
+        self.processes = processes  # תהליכים לחיפוש חפיפות בפסקאות (1 = סדרתי)
+        self.chunk_size = chunk_size  # פסקאות לכל משימה במאגר התהליכים
+        self.parallel_min_paragraphs = parallel_min_paragraphs  # מתחת לזה הפעלת המאגר לא משתלמת
+        self.banded = banded  # חיפוש ברצועה סביב סמן המקור של הפסקה הקודמת (בעיבוד סדרתי)
+        self.band_size = band_size  # רוחב הרצועה ההתחלתית במילות מקור
+        self._lexicon: Optional[NikudLexicon] = None
+        self._anchor_cache: Optional[Tuple[List[str], SourceIndex]] = None
+        self._text_cache: Optional[Tuple[str, SourceIndex]] = None
+
+    def __getstate__(self) -> Dict:
+        """המטמונים והמילון הממופה לא עוברים לתהליכים אחרים"""
+        state = self.__dict__.copy()
+        state.update(_lexicon=None, _anchor_cache=None, _text_cache=None)
+        return state
         
     def _create_virtual_copy(self, text: str) -> Tuple[List[str], List[str]]:
         """
@@ -27,64 +86,351 @@ class NikudMapper:
         nikud_words = []  # מילים מנוקדות
         clean_words = []  # מילים ללא ניקוד
         
-        for word in re.finditer(f"{self.nikud_patterns['hebrew']}+", text):
+        for word in HEBREW_WORD.finditer(text):
             if self._has_nikud(word.group()):
                 nikud_words.append(word.group())
                 clean_words.append(self._strip_nikud(word.group()))
         
         return nikud_words, clean_words
 
-    def _find_overlap(self, source_words: List[str], target_text: str) -> Tuple[int, int, int, int]:
-        """מציאת חפיפה בין הטקסטים"""
-        target_words = re.findall(f"{self.nikud_patterns['hebrew']}+", target_text)
-        
-        if not target_words:
-            return 0, 0, 0, 0
-        
-        # מציאת כל החפיפות האפשריות
+    def _skeleton(self, word: str) -> str:
+        """שלד המילה - ללא ו/י, כך ש'הקודש' ו'הקדש' מקבלות אותו מפתח"""
+        return skeleton(word)
+
+    def _shingle_hash(self, keys: List[str], start: int) -> int:
+        """גיבוב יציב (לא תלוי PYTHONHASHSEED) של k מילים החל מ-start"""
+        return zlib.crc32(' '.join(keys[start:start + self.shingle_size]).encode('utf-8'))
+
+    def build_index(self, source_text: str) -> SourceIndex:
+        """בניית אינדקס המקור פעם אחת: מילים מנוקדות, מילים ללא ניקוד, מיקומים ועוגנים"""
+        nikud_words = []
+        clean_words = []
+        offsets = array('I')
+
+        for word in HEBREW_WORD.finditer(source_text):
+            if self._has_nikud(word.group()):
+                nikud_words.append(word.group())
+                clean_words.append(self._strip_nikud(word.group()))
+                offsets.extend(word.span())
+
+        return self._make_index(nikud_words, clean_words, offsets)
+
+    def _make_index(self, nikud_words: List[str], clean_words: List[str], offsets: array) -> SourceIndex:
+        """
+        בניית אינדקס עוגנים: גיבוב של כל רצף של k מילים (שלד) במקור → רשימת מיקומים,
+        ומזהה מספרי לכל שלד לצורך יישור
+        """
+        keys = [self._skeleton(word) for word in clean_words]
+
+        anchors: Dict[int, List[int]] = {}
+        for i in range(len(keys) - self.shingle_size + 1):
+            anchors.setdefault(self._shingle_hash(keys, i), []).append(i)
+
+        vocabulary: Dict[str, int] = {}
+        word_ids = array('I', (vocabulary.setdefault(key, len(vocabulary)) for key in keys))
+
+        return SourceIndex(
+            nikud_words=tuple(nikud_words),
+            clean_words=tuple(clean_words),
+            keys=tuple(keys),
+            offsets=offsets,
+            anchors={h: tuple(positions) for h, positions in anchors.items()},
+            vocabulary=vocabulary,
+            word_ids=word_ids,
+            shingle_size=self.shingle_size
+        )
+
+    def _get_index(self, source: Union[str, List[str], SourceIndex]) -> SourceIndex:
+        """
+        החזרת אינדקס המקור - נבנה פעם אחת לכל טקסט מקור או רשימת מילות מקור
+        """
+        if isinstance(source, SourceIndex):
+            return source
+
+        if isinstance(source, str):
+            if self._text_cache is None or self._text_cache[0] != source:
+                self._text_cache = (source, self.build_index(source))
+            return self._text_cache[1]
+
+        # רשימת מילים ללא ניקוד (ממשק ישן)
+        if self._anchor_cache is None or self._anchor_cache[0] is not source:
+            self._anchor_cache = (source, self._make_index(source, source, array('I')))
+        return self._anchor_cache[1]
+
+    def load_source_index(self, source_path: str, source_text: Optional[str] = None) -> SourceIndex:
+        """
+        טעינת אינדקס המקור מהדיסק (אם persist_index ועדכני), אחרת בנייה ושמירה
+
+        Args:
+            source_path: נתיב לקובץ המקור
+            source_text: טקסט המקור. אם לא צוין, נקרא מהקובץ רק כשצריך לבנות אינדקס
+        """
+        if self.persist_index:
+            index = SourceIndex.load(source_path, self.shingle_size)
+            if index is not None:
+                logger.info(f"אינדקס מקור נטען: {SourceIndex.cache_path(source_path)}")
+                return index
+
+        if source_text is None:
+            source_text = '\n'.join(p.text for p in Document(source_path).paragraphs)
+        index = self.build_index(source_text)
+
+        if self.persist_index:
+            index.save(source_path)
+            logger.info(f"אינדקס מקור נשמר: {SourceIndex.cache_path(source_path)}")
+
+        self._harvest(index.nikud_words)
+        return index
+
+    def harvest_source(self, source_text: str) -> None:
+        """הוספת המילים המנוקדות של טקסט מקור למילון בלי לבנות אינדקס (אותו מקור, אותן מילים כמו באינדקס)"""
+        self._harvest([word for word in HEBREW_WORD.findall(source_text) if self._has_nikud(word)])
+
+    @property
+    def lexicon(self) -> Optional[NikudLexicon]:
+        """מילון הניקוד (ממופה לזיכרון, נפתח בפעם הראשונה שצריך)"""
+        if self._lexicon is None and self.lexicon_path:
+            self._lexicon = NikudLexicon(self.lexicon_path)
+        return self._lexicon
+
+    def _harvest(self, nikud_words: Sequence[str]) -> None:
+        """הוספת המילים המנוקדות של המקור למילון (פעם אחת לכל מקור)"""
+        if not self.lexicon_path:
+            return
+        if harvest(self.lexicon_path, nikud_words):
+            logger.info(f"מילון הניקוד עודכן: {self.lexicon_path}")
+            if self._lexicon is not None:
+                self._lexicon.close()
+                self._lexicon = None
+
+    def _extend_anchor(self, source_keys: List[str], target_keys: List[str],
+                       i: int, j: int) -> Tuple[int, int]:
+        """
+        הרחבת עוגן לאורך האלכסון (i - j קבוע) לשני הכיוונים,
+        תוך דילוג על עד max_gap אי-התאמות רצופות
+
+        Returns:
+            Tuple[int, int]: (תחילת החפיפה ביעד, סוף החפיפה ביעד)
+        """
+        diagonal = i - j
+
+        # הרחבה אחורה
+        start = j
+        misses = 0
+        t = j - 1
+        while t >= 0 and t + diagonal >= 0 and misses <= self.max_gap:
+            if source_keys[t + diagonal] == target_keys[t]:
+                start = t
+                misses = 0
+            else:
+                misses += 1
+            t -= 1
+
+        # הרחבה קדימה
+        end = j + self.shingle_size
+        misses = 0
+        t = end
+        while t < len(target_keys) and t + diagonal < len(source_keys) and misses <= self.max_gap:
+            if source_keys[t + diagonal] == target_keys[t]:
+                end = t + 1
+                misses = 0
+            else:
+                misses += 1
+            t += 1
+
+        return start, end
+
+    def _score_overlap(self, size: int, ratio, j, target_len: int, max_size: int):
+        """חישוב ציון לחפיפה (עובד גם על מערכי numpy של דמיון ומיקום)"""
+        position_score = 1 - (j / target_len)  # העדפה להתחלה
+        size_score = size / max_size  # העדפה לחפיפות ארוכות
+        ratio_score = ratio / 100  # דמיון טקסטואלי
+
+        return (
+            size_score * 0.5 +     # 50% משקל לאורך
+            ratio_score * 0.4 +    # 40% משקל לדמיון
+            position_score * 0.1    # 10% משקל למיקום
+        )
+
+    def _find_anchor_overlap(self, index: SourceIndex, target_words: List[str],
+                             band: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int, int, int]]:
+        """
+        מציאת חפיפה מתוך פגיעות עוגנים: הרחבה לאורך האלכסון ואימות בדמיון.
+        עם band - רק עוגנים שמיקומם במקור בטווח (lo, hi)
+        """
+        source_words = index.clean_words
+        source_keys = index.keys
+        target_keys = [self._skeleton(word) for word in target_words]
+        max_size = min(self.max_window, len(target_words))
+
+        best_match = None
+        best_score = 0
+        covered: Dict[int, int] = {}  # אלכסון → סוף הטווח שכבר נבדק ביעד
+
+        for j in range(len(target_keys) - self.shingle_size + 1):
+            positions = index.anchors.get(self._shingle_hash(target_keys, j))
+            if positions and band is not None:
+                positions = positions[bisect_left(positions, band[0]):bisect_left(positions, band[1])]
+            if not positions or len(positions) > self.max_anchor_hits:
+                continue
+
+            for i in positions:
+                diagonal = i - j
+                if covered.get(diagonal, -1) > j:
+                    continue
+
+                start_t, end_t = self._extend_anchor(source_keys, target_keys, i, j)
+                covered[diagonal] = end_t
+
+                size = min(end_t - start_t, max_size)
+                if size < self.min_size:
+                    continue
+                end_t = start_t + size
+                start_s = start_t + diagonal
+
+                # אימות החפיפה בדמיון טקסטואלי
+                ratio = fuzz.ratio(' '.join(source_words[start_s:start_s + size]),
+                                   ' '.join(target_words[start_t:end_t]))
+                if ratio < self.similarity_threshold:
+                    continue
+
+                score = self._score_overlap(size, ratio, start_t, len(target_words), max_size)
+                if score > best_score:
+                    best_score = score
+                    best_match = (start_s, start_s + size, start_t, end_t)
+
+                    # מפסיקים אם מצאנו חפיפה מספיק טובה
+                    if score > 0.85:
+                        return best_match
+
+        return best_match
+
+    def _scan_windows(self, source_words: List[str], target_words: List[str],
+                      regions: Optional[List[Tuple[int, int]]] = None) -> Optional[Tuple[int, int, int, int]]:
+        """
+        חיפוש חפיפה בחלונות קבועים - גיבוי כשאין עוגן מאומת.
+        כל החלונות באותו גודל נאספים לרשימות ומדורגים יחד ב-cdist (מקבילי לפי workers).
+        עם regions - רק חלונות מקור שכולם בתוך אחד הטווחים (באותה רשת של קפיצות כמו בכל המקור)
+        """
         best_match = None
         best_score = 0
-        min_size = 20  # מינימום מילים לחפיפה
         window_step = 10  # קפיצות של 10 מילים
-        similarity_threshold = 85  # סף דמיון מופחת
-        
-        # חיפוש חפיפות בחלונות
-        max_size = min(300, len(target_words))  # הגבלת גודל חלון
-        
-        for size in range(min_size, max_size + 1, window_step):
-            for j in range(0, len(target_words) - size + 1, window_step):
-                target_slice = ' '.join(target_words[j:j+size])
-                
-                # חיפוש בטקסט המקור
-                for i in range(0, len(source_words) - size + 1, window_step):
-                    source_slice = ' '.join(source_words[i:i+size])
-                    
-                    # חישוב דמיון
-                    ratio = fuzz.ratio(source_slice, target_slice)
-                    if ratio < similarity_threshold:
-                        continue
-                    
-                    # חישוב ציון
-                    position_score = 1 - (j / len(target_words))  # העדפה להתחלה
-                    size_score = size / max_size  # העדפה לחפיפות ארוכות
-                    ratio_score = ratio / 100  # דמיון טקסטואלי
-                    
-                    score = (
-                        size_score * 0.5 +     # 50% משקל לאורך
-                        ratio_score * 0.4 +    # 40% משקל לדמיון
-                        position_score * 0.1    # 10% משקל למיקום
-                    )
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_match = (i, i+size, j, j+size)
-                        
-                        # מפסיקים אם מצאנו חפיפה מספיק טובה
-                        if score > 0.85:
-                            return best_match
-        
+        max_size = min(self.max_window, len(target_words))
+
+        for size in range(self.min_size, max_size + 1, window_step):
+            target_starts = range(0, len(target_words) - size + 1, window_step)
+            if regions is None:
+                source_starts = range(0, len(source_words) - size + 1, window_step)
+            else:
+                source_starts = [i for lo, hi in regions
+                                 for i in range(-(-lo // window_step) * window_step, hi - size + 1, window_step)]
+            if not target_starts or not source_starts:
+                continue
+
+            target_slices = [' '.join(target_words[j:j+size]) for j in target_starts]
+            source_slices = [' '.join(source_words[i:i+size]) for i in source_starts]
+
+            # חישוב דמיון לכל הזוגות בבת אחת: שורות - חלונות יעד, עמודות - חלונות מקור
+            ratios = process.cdist(target_slices, source_slices, scorer=fuzz.ratio,
+                                   score_cutoff=self.similarity_threshold, workers=self.workers)
+            if not ratios.any():
+                continue
+
+            # חישוב ציון לפי אותו שקלול של אורך, דמיון ומיקום
+            positions = np.asarray(target_starts, dtype=np.float64)[:, None]
+            scores = self._score_overlap(size, ratios, positions, len(target_words), max_size)
+            scores[ratios < self.similarity_threshold] = 0
+
+            # argmax מחזיר את הראשון בסדר הסריקה (יעד ואז מקור) כמו הלולאה המקורית
+            row, col = np.unravel_index(np.argmax(scores), scores.shape)
+            if scores[row, col] > best_score:
+                best_score = float(scores[row, col])
+                i, j = source_starts[col], target_starts[row]
+                best_match = (i, i+size, j, j+size)
+
+                # מפסיקים אם מצאנו חפיפה מספיק טובה
+                if best_score > 0.85:
+                    return best_match
+
+        return best_match
+
+    def _find_overlap(self, source: Union[List[str], SourceIndex], target_text: str,
+                      band: Optional[Tuple[int, int]] = None, fuzzy: bool = True) -> Tuple[int, int, int, int]:
+        """
+        מציאת חפיפה בין הטקסטים (source - מילות מקור ללא ניקוד או אינדקס מקור)
+
+        Args:
+            band: טווח מילות מקור (lo, hi) לחיפוש. אם לא צוין - כל המקור
+            fuzzy: האם לסרוק חלונות בדמיון עמום כשאין עוגן מאומת
+        """
+        target_words = [
+            self._strip_nikud(word)
+            for word in HEBREW_WORD.findall(target_text)
+        ]
+
+        # טקסט קצר מהחפיפה המינימלית - אין מה לחפש
+        if min(self.max_window, len(target_words)) < self.min_size:
+            return 0, 0, 0, 0
+
+        index = self._get_index(source)
+        best_match = self._find_anchor_overlap(index, target_words, band)
+        if best_match is None and fuzzy:
+            lo, hi = band or (0, len(index))
+            best_match = self._scan_windows(index.clean_words[lo:hi], target_words)
+            if best_match is not None:
+                start_s, end_s, start_t, end_t = best_match
+                best_match = (start_s + lo, end_s + lo, start_t, end_t)
+
         return best_match or (0, 0, 0, 0)
 
+    def _find_overlap_near(self, index: SourceIndex, target_text: str, cursor: int) -> Tuple[int, int, int, int]:
+        """
+        חיפוש ברצועה סביב סמן המקור: קודם רצועה צרה, והרחבה פי 4 רק כשהחיפוש נכשל.
+        חיפוש העוגנים מתרחב עד כל המקור; הסריקה העמומה נעשית קודם ברצועה ההתחלתית,
+        ואחר כך רק סביב פגיעות עוגנים מחוץ לה - כך פסקה רחוקה מהסמן לא תאבד,
+        ופסקה שאינה במקור אינה סורקת את כל המקור
+        """
+        width = self.band_size
+        first_band = None
+        while True:
+            band = (max(0, cursor - width // 4), min(len(index), cursor + width))
+            first_band = first_band or band
+            match = self._find_overlap(index, target_text, band, fuzzy=False)
+            if match != (0, 0, 0, 0) or band == (0, len(index)):
+                break
+            width *= 4
+
+        if match == (0, 0, 0, 0):
+            match = self._find_overlap(index, target_text, first_band)
+        if match == (0, 0, 0, 0) and first_band != (0, len(index)):
+            target_words = [self._strip_nikud(word) for word in HEBREW_WORD.findall(target_text)]
+            regions = self._anchor_regions(index, target_words, first_band)
+            if regions and min(self.max_window, len(target_words)) >= self.min_size:
+                match = self._scan_windows(index.clean_words, target_words, regions) or match
+        return match
+
+    def _anchor_regions(self, index: SourceIndex, target_words: List[str],
+                        band: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        טווחי מקור סביב פגיעות עוגנים של היעד מחוץ ל-band (ממוזגים וממוינים).
+        חלון שדומה ליעד חולק איתו כמעט תמיד שינגל, ולכן די לסרוק שם
+        """
+        target_keys = [self._skeleton(word) for word in target_words]
+        hits = []
+        for j in range(len(target_keys) - self.shingle_size + 1):
+            positions = index.anchors.get(self._shingle_hash(target_keys, j))
+            if positions and len(positions) <= self.max_anchor_hits:
+                hits.extend(i for i in positions if not band[0] <= i < band[1])
+
+        regions: List[Tuple[int, int]] = []
+        for i in sorted(hits):
+            lo, hi = max(0, i - self.max_window), min(len(index), i + self.max_window)
+            if regions and lo <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], hi)
+            else:
+                regions.append((lo, hi))
+        return regions
+
     def _calc_context_score(self, source_words: List[str], target_words: List[str], match: Match) -> float:
         """חישוב ציון הקשר לחפיפה"""
         # בדיקת מילים לפני ואחרי החפיפה
@@ -102,59 +448,160 @@ class NikudMapper:
         
         return (before_ratio + after_ratio) / 2
 
-    def _align_cursors(self, source_words: List[str], target_words: List[str], 
-                      start_source: int, start_target: int) -> Tuple[int, int]:
-        """יישור סמנים לתחילת החפיפה"""
-        source_cursor = start_source
-        target_cursor = start_target
-        
-        source_word = source_words[source_cursor]
-        target_word = target_words[target_cursor]
-        
-        logger.info(
-            f"מיקום סמן מקור: {source_cursor} מו��ה על המילה - {source_word}\n"
-            f"מיקום סמן יעד: {target_cursor} מורה על המילה - {target_word}"
-        )
-        
-        return source_cursor, target_cursor
-
-    def add_nikud_to_text(self, source_text: str, target_text: str) -> str:
-        """הוספת ניקוד לטקסט"""
-        # יצירת עותק וירטואלי
-        source_nikud, source_clean = self._create_virtual_copy(source_text)
-        target_words = re.findall(f"{self.nikud_patterns['hebrew']}+", target_text)
-        
-        # מציאת חפיפה
-        start_s, end_s, start_t, end_t = self._find_overlap(source_clean, target_text)
-        
-        # אם לא נמצאה חפיפה, מחזירים את הטקסט המקורי
+    def _align_cursors(self, index: SourceIndex, match: Tuple[int, int, int, int], cursor: int) -> int:
+        """קידום סמן המקור לסוף החפיפה שנמצאה (ללא חפיפה - הסמן נשאר במקומו)"""
+        start_s, end_s, start_t, end_t = match
         if start_s == end_s == start_t == end_t == 0:
-            return target_text
-        
-        # עיבוד הטקסט לפי החפיפה שנמצאה
+            return cursor
+
+        logger.debug(f"מיקום סמן מקור: {end_s} (חפיפה {start_s}-{end_s} מתוך {len(index)} מילים)")
+        return end_s
+
+    def align_words(self, source: Union[List[str], SourceIndex], target_words: List[str]) -> List[int]:
+        """
+        יישור מונוטוני של כל מילות היעד מול מילות המקור במעבר אחד (Hunt–Szymanski על מזהי מילים)
+
+        Returns:
+            List[int]: לכל מילת יעד - אינדקס מילת המקור המתאימה, או -1
+        """
+        index = self._get_index(source)
+        # מילה שאינה במקור מקבלת מזהה שאינו קיים במקור ולכן אינה מותאמת
+        target_ids = [index.vocabulary.get(self._skeleton(self._strip_nikud(word)), -1) for word in target_words]
+        pairs = filter_regions(monotonic_alignment(index.word_ids, target_ids), max_gap=self.max_gap)
+
+        mapping = [-1] * len(target_words)
+        for source_idx, target_idx in pairs:
+            mapping[target_idx] = source_idx
+        return mapping
+
+    def _transfer_nikud(self, vocalized: str, target_word: str) -> str:
+        """
+        העתקת הניקוד ממילת המקור לאותיות מילת היעד.
+        הכתיב של היעד נשמר: אם/י/ו נוספות ביעד (כתיב מלא) מקבלות חולם/שורוק לפי המקור.
+        אם האותיות לא מתיישרות - מחזירים את מילת היעד כפי שהיא.
+        """
+        letters = self._strip_nikud(target_word)
+        if self._strip_nikud(vocalized) == letters:
+            return vocalized
+
+        # פירוק מילת המקור לאותיות עם סימני הניקוד שלהן
+        groups = letter_groups(vocalized)
+
         result = []
-        
-        # מילים לפני החפיפה
-        result.extend(target_words[:start_t])
-        
-        # מילים בתוצאה החפיפה
+        g = 0
+        for letter in letters:
+            while g < len(groups) and groups[g][0] != letter and groups[g][0] in MATRES:
+                g += 1  # אם קריאה שקיימת רק במקור
+            if g < len(groups) and groups[g][0] == letter:
+                result.append(groups[g])
+                g += 1
+            elif letter in MATRES and result:
+                # אם קריאה שקיימת רק ביעד - חולם/קובוץ של האות הקודמת עוברים אליה
+                if letter == '\u05D5' and HOLAM in result[-1]:
+                    result[-1] = result[-1].replace(HOLAM, '')
+                    result.append(letter + HOLAM)
+                elif letter == '\u05D5' and QUBUTS in result[-1]:
+                    result[-1] = result[-1].replace(QUBUTS, '')
+                    result.append(letter + DAGESH)
+                else:
+                    result.append(letter)
+            else:
+                return target_word
+
+        if any(group[0] not in MATRES for group in groups[g:]):
+            return target_word
+        return ''.join(result)
+
+    def _map_words(self, index: SourceIndex, text: str, words: List[str]) -> List[int]:
+        """
+        מיפוי מילות הטקסט למילות המקור לפי המצב: יישור מלא, או חלון החפיפה הטוב ביותר
+
+        Returns:
+            List[int]: לכל מילה - אינדקס מילת המקור, או -1
+        """
+        if self.mode == 'align':
+            return self.align_words(index, words)
+        return self._overlap_mapping(len(words), self._find_overlap(index, text))
+
+    def _overlap_mapping(self, word_count: int, match: Tuple[int, int, int, int]) -> List[int]:
+        """מיפוי מילים מתוך חלון חפיפה"""
+        mapping = [-1] * word_count
+        start_s, end_s, start_t, end_t = match
         for i in range(start_t, end_t):
-            source_idx = start_s + (i - start_t)
-            result.append(source_nikud[source_idx])
-        
-        # מילים אחרי החפיפה
-        result.extend(target_words[end_t:])
-        
-        return ' '.join(result)
+            mapping[i] = start_s + (i - start_t)
+        return mapping
+
+    def _vocalize(self, index: SourceIndex, words: List[str], mapping: List[int]) -> List[Optional[str]]:
+        """
+        המילה המנוקדת לכל מילה: לפי המקור אם מופתה, אחרת לפי מילון הניקוד (אם הוגדר), אחרת None
+        """
+        lexicon = self.lexicon
+        result = []
+        for word, source_idx in zip(words, mapping):
+            if source_idx >= 0:
+                result.append(self._transfer_nikud(index.nikud_words[source_idx], word))
+            elif lexicon is not None:
+                result.append(lexicon.lookup(word))
+            else:
+                result.append(None)
+        return result
+
+    def add_nikud_to_text(self, source: Union[str, SourceIndex], target_text: str) -> str:
+        """
+        הוספת ניקוד לטקסט (source - טקסט המקור או אינדקס מקור שנבנה מראש).
+        המילים המנוקדות נכתבות במקומן בטקסט המקורי - פיסוק, מספרים ורווחים נשמרים
+        """
+        # עותק וירטואלי - נבנה פעם אחת לכל מקור
+        index = self._get_index(source)
+        matches = list(HEBREW_WORD.finditer(target_text))
+        words = [match.group() for match in matches]
+
+        mapping = self._map_words(index, target_text, words)
+        return splice_words(target_text, [match.span() for match in matches],
+                            self._vocalize(index, words, mapping))
+
+    def add_nikud_to_spans(self, source: Union[str, SourceIndex], target: RichText,
+                           flags: int = BOLD) -> Tuple[RichText, float]:
+        """
+        הוספת ניקוד רק למילים שבתוך מקטעים מסומנים (ברירת מחדל - מודגשים) של טקסט עשיר.
+        כל מילות הטקסט ממופות מול המקור (ההקשר עוזר ליישור), אבל רק מילים שנוגעות במקטע מנוקדות;
+        המקטעים זזים יחד עם האותיות שלהם
+
+        Returns:
+            Tuple[RichText, float]: (הטקסט המנוקד, חלק המילים במקטעים שקיבלו ניקוד)
+        """
+        index = self._get_index(source)
+        matches = list(HEBREW_WORD.finditer(target.text))
+        words = [match.group() for match in matches]
+        replacements = self._vocalize(index, words, self._map_words(index, target.text, words))
+
+        spans = list(target.iter_spans(flags))
+        marked = 0
+        vocalized = 0
+        k = 0
+        for i, match in enumerate(matches):
+            start, end = match.span()
+            while k < len(spans) and spans[k][1] <= start:
+                k += 1
+            if k == len(spans) or spans[k][0] >= end:  # המילה מחוץ לכל מקטע
+                replacements[i] = None
+                continue
+            marked += 1
+            # מילה ש-_transfer_nikud השאיר כמות שהיא (אותיות שלא התיישרו) לא קיבלה ניקוד
+            replacement = replacements[i]
+            vocalized += replacement is not None and replacement != words[i] and self._has_nikud(replacement)
+
+        coverage = vocalized / marked if marked else 1.0
+        return target.splice([match.span() for match in matches], replacements), coverage
 
     def _has_nikud(self, text: str) -> bool:
-        return bool(re.search(self.nikud_patterns['nikud'], text))
+        return has_nikud(text)
 
     def _has_hebrew(self, text: str) -> bool:
-        return bool(re.search(self.nikud_patterns['hebrew'], text))
+        return HEBREW_WORD.search(text) is not None
 
     def _strip_nikud(self, text: str) -> str:
-        return re.sub(self.nikud_patterns['nikud'], '', text)
+        return strip_nikud(text)
 
     def _is_bold(self, word: str) -> bool:
         # TODO: לממש בדיקת הדגשה לפי המסמך
@@ -171,34 +618,91 @@ class NikudMapper:
         """
         logger.info(f"מעבד קבצים:\nמקור: {source_path or input_path}\nלט: {input_path}")
         
-        # קריאת קובץ המקור והכנת המילים המנוקדות
-        source_doc = Document(source_path or input_path)
-        source_text = '\n'.join(p.text for p in source_doc.paragraphs)
-        source_nikud, source_clean = self._create_virtual_copy(source_text)
+        # קריאת קובץ המקור והכנת אינדקס המקור - פעם אחת לכל המסמך
+        source_index = self.load_source_index(source_path or input_path)
         
         # קריאת קובץ היעד
         target_doc = Document(input_path)
-        
-        # עיבוד כל פסקה
-        for paragraph in target_doc.paragraphs:
-            # מציאת חפיפה לכל הפסקה
-            paragraph_text = paragraph.text
-            if not self._has_hebrew(paragraph_text):
-                continue
-            
-            start_s, end_s, start_t, end_t = self._find_overlap(source_clean, paragraph_text)
-            
-            # עיבוד הריצות בפסקה
-            for run in paragraph.runs:
-                if run.bold or not self.bold_only:
-                    original_text = run.text
-                    if self._has_hebrew(original_text):
-                        run.text = self.add_nikud_to_text(source_text, original_text)
+
+        if self.mode == 'align':
+            self._align_document(target_doc, source_index)
+        else:
+            # עיבוד כל פסקה - חיפוש חפיפה אחד ומעבר אחד על הריצות
+            paragraphs = []
+            for paragraph in target_doc.paragraphs:
+                run_texts = [run.text for run in paragraph.runs]
+                paragraph_text = ''.join(run_texts)
+                if self._has_hebrew(paragraph_text):
+                    paragraphs.append((paragraph, run_texts, paragraph_text))
+
+            mappings = self._map_paragraphs(source_index, [text for _, _, text in paragraphs])
+
+            # החלת התוצאות לפי סדר המסמך
+            for (paragraph, run_texts, paragraph_text), mapping in zip(paragraphs, mappings):
+                matches = list(HEBREW_WORD.finditer(paragraph_text))
+                words = [match.group() for match in matches]
+                self._splice_paragraph(paragraph, run_texts, matches,
+                                       self._vocalize(source_index, words, mapping))
         
         # שמירת הקובץ
         target_doc.save(output_path)
         logger.info(f"הקובץ נשמר: {output_path}")
 
+    def _map_paragraphs(self, source_index: SourceIndex, texts: List[str]) -> List[List[int]]:
+        """
+        מיפוי מילות כל הפסקאות. עם processes > 1 ומספיק פסקאות - במאגר תהליכים,
+        כשאינדקס המקור נשלח לכל תהליך פעם אחת ב-initializer. התוצאות חוזרות לפי הסדר.
+        בעיבוד סדרתי עם banded - חיפוש ברצועה סביב סמן המקור (במאגר כל פסקה נחפשת בכל המקור)
+        """
+        if self.processes <= 1 or len(texts) < self.parallel_min_paragraphs:
+            if not self.banded:
+                return [self._map_words(source_index, text, HEBREW_WORD.findall(text)) for text in texts]
+
+            # הפסקאות בדרך כלל עוקבות אחרי המקור - כל פסקה נחפשת קודם סביב סוף החפיפה הקודמת
+            mappings = []
+            cursor = 0
+            for text in texts:
+                match = self._find_overlap_near(source_index, text, cursor)
+                cursor = self._align_cursors(source_index, match, cursor)
+                mappings.append(self._overlap_mapping(len(HEBREW_WORD.findall(text)), match))
+            return mappings
+
+        logger.info(f"ממפה {len(texts)} פסקאות ב-{self.processes} תהליכים")
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                 initargs=(self, source_index)) as executor:
+            return list(executor.map(_map_paragraph, texts, chunksize=self.chunk_size))
+
+    def _splice_paragraph(self, paragraph, run_texts: List[str], matches: List[re.Match],
+                          replacements: List[Optional[str]]) -> None:
+        """כתיבת המילים המנוקדות לריצות הפסקה לפי מיקומים (מילה שחוצה ריצות מטופלת בכל ריצה)"""
+        runs = paragraph.runs
+        writable = [bool(run.bold) or not self.bold_only for run in runs]
+        new_texts = splice_runs(run_texts, [match.span() for match in matches], replacements, writable)
+        for run, old_text, new_text in zip(runs, run_texts, new_texts):
+            if new_text != old_text:
+                run.text = new_text
+
+    def _align_document(self, target_doc: Document, source_index: SourceIndex) -> None:
+        """יישור כל מילות המסמך מול המקור במעבר אחד והחלת הניקוד על הריצות"""
+        paragraphs = []
+        target_words = []
+        for paragraph in target_doc.paragraphs:
+            run_texts = [run.text for run in paragraph.runs]
+            matches = list(HEBREW_WORD.finditer(''.join(run_texts)))
+            paragraphs.append((paragraph, run_texts, matches))
+            target_words.extend(match.group() for match in matches)
+
+        mapping = self.align_words(source_index, target_words)
+        logger.info(f"יושרו {sum(idx >= 0 for idx in mapping)} מתוך {len(target_words)} מילים")
+
+        offset = 0
+        for paragraph, run_texts, matches in paragraphs:
+            if matches:
+                words = target_words[offset:offset + len(matches)]
+                replacements = self._vocalize(source_index, words, mapping[offset:offset + len(matches)])
+                self._splice_paragraph(paragraph, run_texts, matches, replacements)
+            offset += len(matches)
+
     def test_known_dataset(self) -> None:
         """בדיקת המנקד על דאטה סט ידוע"""
         # דוגמה מוכרת עם ניקוד - עם שוליים נוספים
@@ -1,125 +1,149 @@
+import asyncio
 import logging
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, Dict
-from docx import Document
-import re
+from typing import Callable, Tuple, Dict, List, Optional
 
-from .document_processor import DocumentProcessor
-from .gemini_service import GeminiService
+from .document_processor import DocumentProcessor, Section
+from .docx_reader import read_paragraphs
+from .docx_writer import patch_docx
+from .gemini_service import GeminiService, parse_span_response
+from .hebrew import strip_nikud
+from .llm_backend import TRANSIENT_ERRORS, LLMBackend
+from .nikud_lexicon import DEFAULT_LEXICON_PATH
+from .nikud_mapper import NikudMapper
+from .rate_limiter import RateLimiter, with_retries
+from .response_cache import DEFAULT_CACHE_PATH
+from .response_validator import validate_section_response, validate_span_response
+from .rich_text import BOLD, RichText
 from .usage_logger import streamlit_logger as st_log
 
+ENGINES = ("local", "gemini", "hybrid")
+PAYLOADS = ("spans", "section")
+# The vocalized answer takes up to ~3x the tokens of the same text without nikud (with margin)
+NIKUD_TOKEN_FACTOR = 3
+
+@dataclass
+class SectionProgress:
+    """One progress report for a matched section (see NikudService.on_progress)"""
+    index: int  # place among the matched sections
+    total: int  # number of matched sections
+    header: str
+    text: str = ""  # Gemini's answer so far, or the section's final text when done
+    done: bool = False
+
 class NikudService:
-    def __init__(self):
+    def __init__(self, engine: str = "gemini", coverage_threshold: float = 0.9,
+                 lexicon_path: Optional[str] = DEFAULT_LEXICON_PATH, concurrency: int = 4,
+                 requests_per_minute: Optional[int] = 15, max_retries: int = 3, retry_delay: float = 2.0,
+                 few_shot: bool = False, payload: str = "spans", validation_retries: int = 2,
+                 retry_budget: int = 10, backend: Optional[LLMBackend] = None,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH):
+        """
+        Args:
+            engine: "local" - copy nikud with the NikudMapper alignment, no network calls;
+                    "gemini" - send every matched section to Gemini;
+                    "hybrid" - local first, Gemini only for sections below coverage_threshold
+            coverage_threshold: share of bold words the local engine must vocalize in hybrid mode
+            lexicon_path: nikud lexicon for bold words that do not appear in the source (None to disable)
+            concurrency: Gemini requests in flight at once
+            requests_per_minute: Gemini request quota (None for no limit)
+            max_retries: retries per section on transient Gemini errors (quota, overload, timeouts)
+            retry_delay: first retry delay in seconds, doubled on every further retry
+            few_shot: send Gemini a fixed worked example before each section (section payload)
+            payload: "spans" - send Gemini only the distinct bold spans and splice its vocalized
+                     spans back locally; "section" - have Gemini retype the whole tagged section
+            validation_retries: new requests for a payload whose answer fails validation
+            retry_budget: validation retries allowed in one process_files run, across all sections
+            backend: LLM behind GeminiService (default GeminiBackend; a ReplayBackend runs offline)
+            cache_path: GeminiService response cache (None to disable, e.g. when benchmarking)
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        if payload not in PAYLOADS:
+            raise ValueError(f"Unknown payload: {payload}")
         self.logger = logging.getLogger(__name__)
         self.doc_processor = DocumentProcessor()
+        self.engine = engine
+        self.coverage_threshold = coverage_threshold
+        self.mapper = NikudMapper(mode='align', lexicon_path=lexicon_path)
         self._gemini = None
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.few_shot = few_shot
+        self.payload = payload
+        self.validation_retries = validation_retries
+        self.retry_budget = retry_budget
+        self._retries_left = retry_budget
+        self.backend = backend
+        self.cache_path = cache_path
+        # Called from the event loop with a SectionProgress: every section once queued, on every
+        # streamed piece of a Gemini answer, and once done
+        self.on_progress: Optional[Callable[[SectionProgress], None]] = None
 
     @property
     def gemini(self):
         if self._gemini is None:
-            self._gemini = GeminiService()
+            self._gemini = GeminiService(few_shot=self.few_shot, cache_path=self.cache_path, backend=self.backend)
         return self._gemini
         
-    def _read_docx(self, file_path: str) -> Tuple[str, Document]:
-        """Read DOCX file and extract text while preserving bold formatting"""
-        doc = Document(file_path)
-        text = ""
-        bold_count = 0
-        
+    def _read_docx(self, file_path: str) -> Tuple[RichText, List[int]]:
+        """Read DOCX file into text plus bold spans, and the start offset of every body paragraph"""
         st_log.log(f"קורא קובץ: {file_path}", "📖")
-        
-        for para in doc.paragraphs:
-            para_text = ""
-            current_bold_text = ""
-            last_was_bold = False
-            
-            for run in para.runs:
-                if run.bold:
-                    if not last_was_bold:  # Start of bold section
-                        current_bold_text = run.text
-                    else:  # Continue bold section
-                        current_bold_text += run.text
-                    last_was_bold = True
-                else:
-                    if last_was_bold:  # End of bold section
-                        para_text += f"<b>{current_bold_text}</b>"
-                        current_bold_text = ""
-                        bold_count += 1
-                    para_text += run.text
-                    last_was_bold = False
-            
-            # Handle any remaining bold text at end of paragraph
-            if last_was_bold and current_bold_text:
-                para_text += f"<b>{current_bold_text}</b>"
-                bold_count += 1
-            
-            text += para_text + "\n"
-        
-        st_log.log(f"זוהו {bold_count} קטעים מודגשים", "🔍")
-        return text, doc
+        text, paragraph_starts = read_paragraphs(file_path)
+        st_log.log(f"זוהו {text.span_count} קטעים מודגשים", "🔍")
+        return text, paragraph_starts
     
-    def _write_docx(self, content: str, template_doc: Document, output_path: str):
-        """Write content back to DOCX preserving all formatting"""
-        doc = Document()
-        
-        # Copy styles from template
-        doc.styles._element = template_doc.styles._element
-        
-        # Set RTL at document level using XML
-        doc._body._element.set('bidi', '1')
-        
-        # Process content and write to doc
-        paragraphs = content.split('\n')
-        for para_text in paragraphs:
-            if not para_text.strip():
-                continue
-                
-            para = doc.add_paragraph()
-            # Set RTL and right alignment
-            para.paragraph_format.alignment = 2  # WD_ALIGN_PARAGRAPH.RIGHT
-            para.style = template_doc.paragraphs[0].style if template_doc.paragraphs else None
-            
-            # Set paragraph direction
-            pPr = para._p.get_or_add_pPr()
-            pPr.set('bidi', '1')
-            
-            # Split by bold markers - using non-greedy match for nested tags
-            parts = re.split(r'(<b>.*?</b>)', para_text)
-            
-            for part in parts:
-                if part.startswith('<b>') and part.endswith('</b>'):
-                    # Bold text - extract content between tags
-                    text = re.search(r'<b>(.*?)</b>', part).group(1)
-                    run = para.add_run(text)
-                    run.bold = True
-                    
-                    # Set run direction
-                    rPr = run._r.get_or_add_rPr()
-                    rPr.set('rtl', '1')
-                else:
-                    # Regular text
-                    if part.strip():
-                        run = para.add_run(part)
-                        # Set run direction
-                        rPr = run._r.get_or_add_rPr()
-                        rPr.set('rtl', '1')
+    def _write_docx(self, template_path: str, original: RichText, paragraph_starts: List[int],
+                    content: RichText, output_path: str):
+        """Write content into a copy of the template, patching only the paragraphs that changed"""
+        # content has the lines of original; body paragraph k is the lines from paragraph_starts[k]
+        # up to the next paragraph (more than one line when it has soft line breaks)
+        old_lines = original.text.split('\n')
+        new_lines = content.text.split('\n')
+        paragraphs = {}
+        line = 0
+        for index, (start, end) in enumerate(zip(paragraph_starts, paragraph_starts[1:] + [len(original.text)])):
+            count = original.text.count('\n', start, end)
+            old_text = '\n'.join(old_lines[line:line + count])
+            new_text = '\n'.join(new_lines[line:line + count])
+            if new_text != old_text:
+                paragraphs[index] = new_text
+            line += count
         
-        # Save with error handling
         try:
-            doc.save(output_path)
+            skipped = patch_docx(template_path, output_path, paragraphs)
+            if skipped:
+                st_log.log(f"{len(skipped)} פסקאות השתנו מעבר לניקוד ונשארו כמו במקור", "⚠️")
             st_log.log(f"המסמך נשמר בהצלחה: {output_path}", "💾")
         except Exception as e:
             st_log.log(f"שגיאה בשמירת המסמך: {str(e)}", "❌")
             raise
 
     def process_files(self, source_path: str, target_path: str, output_path: str):
-        """Process source and target files to add nikud"""
+        """Process source and target files to add nikud (in a new event loop; safe to call repeatedly)"""
+        asyncio.run(self._process_files_and_close(source_path, target_path, output_path))
+
+    async def _process_files_and_close(self, source_path: str, target_path: str, output_path: str):
+        try:
+            await self.process_files_async(source_path, target_path, output_path)
+        finally:
+            # The backend's async client belongs to this loop, which asyncio.run is about to close
+            if self._gemini is not None:
+                await self._gemini.aclose()
+
+    async def process_files_async(self, source_path: str, target_path: str, output_path: str):
+        """Process source and target files to add nikud, with up to `concurrency` sections at Gemini at once"""
         st_log.log("מתחיל תהליך הוספת ניקוד", "🚀")
+        usage_before = self._gemini_usage()
+        self._retries_left = self.retry_budget
         
         # Read files
         st_log.log("קורא קבצים...", "📂")
-        source_text, source_doc = self._read_docx(source_path)
-        target_text, target_doc = self._read_docx(target_path)
+        source_text, _ = self._read_docx(source_path)
+        target_text, target_paragraphs = self._read_docx(target_path)
         
         # Split to sections
         source_sections = self.doc_processor.split_to_sections(source_text)
@@ -127,27 +151,254 @@ class NikudService:
         
         # Find matching sections
         matches = self.doc_processor.find_matching_sections(source_sections, target_sections)
+
+        if self.engine != "gemini":
+            # The whole source goes into the lexicon, for bold words outside the matched source section;
+            # alignment only needs the index of each matched section (see local_nikud)
+            self.mapper.harvest_source(source_text.text)
         
-        # Process each match with Gemini
+        # Process each match locally and/or with Gemini
         st_log.log("מעבד חלקים...", "⚙️")
-        processed_sections = {}
-        for source_section, target_section in matches:
-            content = self.doc_processor.prepare_for_nikud(source_section, target_section)
-            processed_content = self.gemini.add_nikud(content)
-            processed_sections[target_section.header] = processed_content
+        semaphore = asyncio.Semaphore(self.concurrency)
+        reporters = [self._section_reporter(index, len(matches), target_section.header)
+                     for index, (_, target_section) in enumerate(matches)]
+        for report in reporters:
+            report("", False)
+        results = await asyncio.gather(*(
+            self._process_section(source_section, target_section, semaphore, report)
+            for (source_section, target_section), report in zip(matches, reporters)
+        ))
+        processed_sections = [(target_section, result) for (_, target_section), result in zip(matches, results)]
             
-        # Reconstruct document
+        # Reconstruct document: processed sections go back at their offsets, everything else is kept
         st_log.log("מרכיב מחדש את המסמך...", "🔄")
-        final_content = []
-        for section in target_sections:
-            if section.header in processed_sections:
-                final_content.append(processed_sections[section.header])
-            else:
-                final_content.append(section.content)
+        parts = []
+        position = 0
+        for section, processed_content in sorted(processed_sections, key=lambda item: item[0].start):
+            if processed_content.text.count('\n') != section.content.count('\n'):
+                st_log.log(f"מספר השורות בחלק {section.header} השתנה - החלק נשאר ללא שינוי", "⚠️")
+                continue
+            parts.append(target_text.slice(position, section.start))
+            parts.append(processed_content)
+            position = section.end
+        parts.append(target_text.slice(position, len(target_text)))
                 
         # Write output
-        self._write_docx('\n'.join(final_content), target_doc, output_path)
+        self._write_docx(target_path, target_text, target_paragraphs, RichText.concat(parts), output_path)
         st_log.log("המסמך נשמר בהצלחה", "💾")
+        
+        usage = {key: value - usage_before.get(key, 0) for key, value in self._gemini_usage().items()}
+        if usage.get("requests"):
+            st_log.log(f"Gemini: {usage['requests']} בקשות, {usage['prompt_tokens']} טוקנים בקלט, "
+                       f"{usage['output_tokens']} בפלט", "📊")
+
+    def _gemini_usage(self) -> Dict[str, int]:
+        """Gemini request and token totals so far (empty before the first Gemini call)"""
+        return dict(getattr(self._gemini, "usage", {}))
+
+    def _match_edges(self, original: str, processed: str) -> str:
+        """Give processed content the leading/trailing newlines of the original (LLMs trim or add them)"""
+        leading = len(original) - len(original.lstrip('\n'))
+        trailing = len(original) - len(original.rstrip('\n'))
+        return '\n' * leading + processed.strip('\n') + '\n' * trailing
+
+    def _section_reporter(self, index: int, total: int, header: str) -> Callable[[str, bool], None]:
+        """report(text, done) for one section, forwarded to on_progress if set"""
+        def report(text: str, done: bool):
+            if self.on_progress is not None:
+                self.on_progress(SectionProgress(index, total, header, text, done))
+        return report
+
+    async def _process_section(self, source_section: Section, target_section: Section,
+                               semaphore: asyncio.Semaphore,
+                               report: Optional[Callable[[str, bool], None]] = None) -> RichText:
+        """Vocalize the bold parts of one target section with the configured engine"""
+        report = report or (lambda text, done: None)
+        result = await self._vocalize_section(source_section, target_section, semaphore, report)
+        report(result.text, True)
+        return result
+
+    async def _vocalize_section(self, source_section: Section, target_section: Section,
+                                semaphore: asyncio.Semaphore, report: Callable[[str, bool], None]) -> RichText:
+        processed_content = target_section.rich
+        if self.engine != "gemini":
+            processed_content, coverage = self.local_nikud(source_section.content, target_section.rich)
+            st_log.log(f"ניקוד מקומי בחלק {target_section.header}: {coverage:.0%} מהמילים המודגשות", "🧮")
+            if self.engine == "local" or coverage >= self.coverage_threshold:
+                return processed_content
+            st_log.log(f"כיסוי נמוך מ-{self.coverage_threshold:.0%} - שולח ל-Gemini", "↗️")
+
+        if self.payload == "spans":
+            content = self.doc_processor.prepare_spans_for_nikud(source_section, target_section)
+            if not content['spans']:
+                return processed_content
+        else:
+            content = self.doc_processor.prepare_for_nikud(source_section, target_section)
+
+        chunks = await self._chunk_content(content, target_section)
+        if len(chunks) > 1:
+            st_log.log(f"חלק {target_section.header} ארוך מתשובה אחת של Gemini - מחולק ל-{len(chunks)} חלקים", "✂️")
+        # Streamed answers of all chunks, in order, are reported as the section's text so far
+        partials = [""] * len(chunks)
+
+        def chunk_partial(k: int) -> Callable[[str], None]:
+            def on_partial(text: str):
+                partials[k] = text
+                report("".join(partials), False)
+            return on_partial
+
+        responses = await asyncio.gather(*(
+            self._validated_request(chunk, target_section.header, semaphore, chunk_partial(k))
+            for k, (chunk, _) in enumerate(chunks)
+        ))
+
+        if self.payload == "spans":
+            # Chunk span ids are 1-based within the chunk; chunks hold consecutive runs of the spans
+            vocalized = {}
+            offset = 0
+            for (chunk, _), response in zip(chunks, responses):
+                if response is not None:
+                    vocalized.update((offset + i, text) for i, text in parse_span_response(response).items()
+                                     if 0 < i <= len(chunk['spans']))
+                offset += len(chunk['spans'])
+            return self._splice_spans(processed_content, content['spans'], vocalized)
+
+        if any(response is None for response in responses):
+            # Out of retries: this section keeps the local result (or stays as it was), the rest go on
+            return processed_content
+        text = target_section.content
+        return RichText.concat(
+            RichText.from_tagged(self._match_edges(text[start:end], response))
+            for (_, (start, end)), response in zip(chunks, responses)
+        )
+
+    def _validate(self, content: Dict, response: str) -> Optional[str]:
+        """What is wrong with Gemini's answer to a payload, or None if it only adds marks"""
+        if 'spans' in content:
+            return validate_span_response(content['spans'], response)
+        return validate_section_response(content['target_content'], response)
+
+    async def _validated_request(self, content: Dict, header: str, semaphore: asyncio.Semaphore,
+                                 on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        A valid Gemini answer to one payload, or None. An invalid answer is dropped from the cache
+        and the payload alone is asked again, up to validation_retries times within the run's
+        retry budget; other payloads keep their answers.
+        """
+        response = await self._request(content, header, semaphore, on_partial=on_partial)
+        attempt = 0
+        while response is not None:
+            problem = self._validate(content, response)
+            if problem is None:
+                return response
+            self.gemini.discard_cached(content)
+            st_log.log(f"תשובה לא תקינה מ-Gemini בחלק {header}: {problem}", "⚠️")
+            if attempt >= self.validation_retries or self._retries_left <= 0:
+                st_log.log(f"החלק {header} נשאר ללא ניקוד מ-Gemini", "❌")
+                return None
+            attempt += 1
+            self._retries_left -= 1
+            response = await self._request(content, header, semaphore, check_cache=False, on_partial=on_partial)
+        return None
+
+    async def _request(self, content: Dict, header: str, semaphore: asyncio.Semaphore,
+                       check_cache: bool = True, on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Gemini's answer to one payload, from the cache or a request (None when out of retries)"""
+        # Cached payloads take no concurrency slot and no request quota
+        response = self.gemini.cached_response(content) if check_cache else None
+        if response is not None:
+            return response
+        try:
+            async with semaphore:
+                return await with_retries(lambda: self._ask_gemini(content, on_partial), TRANSIENT_ERRORS,
+                                          self.max_retries, self.retry_delay)
+        except TRANSIENT_ERRORS as e:
+            st_log.log(f"Gemini נכשל בחלק {header}: {str(e)}", "❌")
+            return None
+
+    async def _chunk_content(self, content: Dict, target_section: Section) -> List[Tuple[Dict, Tuple[int, int]]]:
+        """
+        Split a payload whose answer could exceed Gemini's max_output_tokens.
+
+        Returns:
+            List[Tuple[Dict, Tuple[int, int]]]: (payload, section range it covers) for each chunk;
+            each chunk carries the window of the source that matches its place in the section
+        """
+        text = target_section.content
+        spans_payload = self.payload == "spans"
+        answer = '\n'.join(content['spans']) if spans_payload else content['target_content']
+        max_chars = await self._answer_budget(answer)
+        if max_chars is None:
+            return [(content, (0, len(text)))]
+
+        if spans_payload:
+            groups = [[]]
+            size = 0
+            for span in content['spans']:
+                if groups[-1] and size + len(span) > max_chars:
+                    groups.append([])
+                    size = 0
+                groups[-1].append(span)
+                size += len(span) + 1
+            payloads = [{**content, "spans": group} for group in groups]
+            ranges = []
+            for group in groups:
+                start = max(text.find(group[0]), 0)
+                ranges.append((start, max(text.find(group[-1]) + len(group[-1]), start)))
+        else:
+            ranges = self.doc_processor.split_for_budget(text, max_chars)
+            payloads = [{**content, "target_content": target_section.rich.slice(start, end).to_tagged()}
+                        for start, end in ranges]
+
+        source = content['source_content']
+        return [
+            ({**payload, "source_content": self.doc_processor.source_window(source, start / len(text), end / len(text))},
+             (start, end))
+            for payload, (start, end) in zip(payloads, ranges)
+        ]
+
+    async def _answer_budget(self, answer: str) -> Optional[int]:
+        """
+        Characters of answer per request for the vocalized answer to fit max_output_tokens, or
+        None if it fits whole. Tokens are counted only when the length alone cannot tell.
+        """
+        limit = self.gemini.max_output_tokens // NIKUD_TOKEN_FACTOR
+        if len(answer) <= limit:  # Hebrew tokens are at least a character long
+            return None
+        tokens = await with_retries(lambda: self.gemini.count_tokens_async(answer), TRANSIENT_ERRORS,
+                                    self.max_retries, self.retry_delay)
+        if tokens <= limit:
+            return None
+        return max(1, len(answer) * limit // tokens)
+
+    async def _ask_gemini(self, content: Dict, on_partial: Optional[Callable[[str], None]] = None) -> str:
+        """One streamed Gemini request, within the requests-per-minute quota"""
+        await self.rate_limiter.acquire()
+        if self.payload == "spans":
+            return await self.gemini.vocalize_spans_async(content, check_cache=False, on_partial=on_partial)
+        return await self.gemini.add_nikud_async(content, check_cache=False, on_partial=on_partial)
+
+    def _splice_spans(self, target: RichText, spans: List[str], vocalized: Dict[int, str]) -> RichText:
+        """
+        Write Gemini's vocalized spans (1-based ids into spans) over every occurrence of each span.
+        A vocalized span whose letters differ from the span is ignored, so only marks can change;
+        spans Gemini left out keep whatever nikud target already has (e.g. from the local engine).
+        """
+        by_text = {strip_nikud(spans[i - 1]): text for i, text in vocalized.items() if 0 < i <= len(spans)}
+        bold_spans = list(target.iter_spans(BOLD))
+        replacements = [by_text.get(strip_nikud(target.text[start:end])) for start, end in bold_spans]
+        st_log.log(f"Gemini ניקד {len(by_text)} מתוך {len(spans)} קטעים", "🧩")
+        return target.splice(bold_spans, replacements)
+
+    def local_nikud(self, source_content: str, target: RichText) -> Tuple[RichText, float]:
+        """
+        Copy nikud from the source onto the bold spans of the target with the NikudMapper alignment
+
+        Returns:
+            Tuple[RichText, float]: (target with vocalized bold spans, share of bold words that
+            received marks)
+        """
+        return self.mapper.add_nikud_to_spans(self.mapper.build_index(source_content), target)
 
     def add_nikud(self, text: str) -> str:
         """
@@ -165,10 +416,7 @@ class NikudService:
         """
         Remove nikud from Hebrew text
         """
-        # Unicode ranges for nikud marks
-        nikud_pattern = r'[\u05B0-\u05BC\u05C1-\u05C2\u05C4-\u05C5\u05C7]'
-        import re
-        return re.sub(nikud_pattern, '', text)
+        return strip_nikud(text)
 
     def test(self) -> Dict[str, bool]:
         """
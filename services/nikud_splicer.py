@@ -0,0 +1,126 @@
+"""
+Offset-based nikud splicing.
+
+Vocalized words are written straight into the original string at the character
+offsets of the words they replace, in one linear pass. Everything outside the
+replaced words (punctuation, numbers, spacing, Latin text) is copied unchanged.
+A replacement is only applied when its letters equal the letters of the original
+word, so splicing can add or change nikud but never changes the text itself.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from .hebrew import MARKS, strip_nikud
+
+
+def letter_groups(word: str) -> List[str]:
+    """Split a word into its letters, each with the marks that follow it"""
+    groups: List[str] = []
+    for char in word:
+        if groups and char in MARKS:
+            groups[-1] += char
+        else:
+            groups.append(char)
+    return groups
+
+
+def char_chunks(original: str, replacement: str) -> Optional[List[str]]:
+    """
+    Output chunk for every character of original: a letter becomes the matching letter
+    of replacement with its marks, an existing mark becomes ''.
+
+    Returns None if the letters of both words differ.
+    """
+    groups = letter_groups(replacement)
+    chunks: List[str] = []
+    k = 0
+    for char in original:
+        if char in MARKS:
+            chunks.append('')
+            continue
+        if k >= len(groups) or groups[k][0] != char:
+            return None
+        chunks.append(groups[k])
+        k += 1
+    return chunks if k == len(groups) else None
+
+
+def splice_words(text: str, spans: Sequence[Tuple[int, int]],
+                 replacements: Sequence[Optional[str]]) -> str:
+    """
+    Replace the words at spans (sorted, non-overlapping) with their replacements.
+
+    None, or a replacement whose letters differ from the original word, leaves the
+    word unchanged.
+    """
+    parts = []
+    position = 0
+    for (start, end), replacement in zip(spans, replacements):
+        if replacement is None:
+            continue
+        original = text[start:end]
+        # Letters compared without every mark in MARKS (incl. cantillation), as char_chunks does
+        if replacement == original or (strip_nikud(replacement, cantillation=True)
+                                       != strip_nikud(original, cantillation=True)):
+            continue
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    if not parts:
+        return text
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def splice_runs(run_texts: Sequence[str], spans: Sequence[Tuple[int, int]],
+                replacements: Sequence[Optional[str]],
+                writable: Optional[Sequence[bool]] = None) -> List[str]:
+    """
+    Splice replacements into the runs of one paragraph.
+
+    spans are offsets into the paragraph text (''.join(run_texts)), so a word split
+    across runs is vocalized in each run it touches. Runs whose writable flag is False
+    keep their text unchanged, even for the part of a word that falls inside them.
+
+    Returns:
+        List[str]: the new text of every run
+    """
+    paragraph = ''.join(run_texts)
+
+    # Per-character chunks for every replaced word, keyed by the word start
+    words = []
+    for (start, end), replacement in zip(spans, replacements):
+        if replacement is None:
+            continue
+        chunks = char_chunks(paragraph[start:end], replacement)
+        if chunks is not None:
+            words.append((start, end, chunks))
+
+    result = []
+    run_start = 0
+    w = 0
+    for r, run_text in enumerate(run_texts):
+        run_end = run_start + len(run_text)
+        if writable is not None and not writable[r]:
+            result.append(run_text)
+            run_start = run_end
+            continue
+
+        # Skip words that ended before this run
+        while w < len(words) and words[w][1] <= run_start:
+            w += 1
+
+        parts = []
+        position = run_start
+        k = w
+        while k < len(words) and words[k][0] < run_end:
+            start, end, chunks = words[k]
+            lo, hi = max(start, run_start), min(end, run_end)
+            parts.append(paragraph[position:lo])
+            parts.extend(chunks[lo - start:hi - start])
+            position = hi
+            k += 1
+        parts.append(paragraph[position:run_end])
+
+        result.append(''.join(parts))
+        run_start = run_end
+    return result
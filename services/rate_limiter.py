@@ -0,0 +1,62 @@
+"""
+Helpers for calling a rate-limited API from concurrent asyncio tasks.
+
+RateLimiter keeps the request rate under a requests-per-minute quota across all tasks,
+with_retries retries one call on transient errors with exponential backoff.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class RateLimiter:
+    """At most requests_per_minute acquisitions in any sliding window of period seconds"""
+
+    def __init__(self, requests_per_minute: Optional[int], period: float = 60.0):
+        """
+        Args:
+            requests_per_minute: quota per window (None or 0 - no limit)
+            period: window length in seconds
+        """
+        self.requests_per_minute = requests_per_minute
+        self.period = period
+        self._times = deque()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent, and count it"""
+        if not self.requests_per_minute:
+            return
+        while True:
+            now = time.monotonic()
+            while self._times and now - self._times[0] >= self.period:
+                self._times.popleft()
+            # No await between the check and the append, so concurrent tasks cannot both take the last slot
+            if len(self._times) < self.requests_per_minute:
+                self._times.append(now)
+                return
+            await asyncio.sleep(self.period - (now - self._times[0]))
+
+
+async def with_retries(call: Callable[[], Awaitable[T]], transient: Tuple[Type[BaseException], ...],
+                       retries: int = 3, base_delay: float = 2.0) -> T:
+    """
+    Await call(), retrying up to retries more times when it raises one of the transient errors.
+    Delays grow as base_delay * 2**attempt with jitter; other errors, and the last transient
+    one, are raised.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except transient as e:
+            if attempt == retries:
+                raise
+            delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"Transient error ({e!r}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,80 @@
+"""
+Content-addressed disk cache for LLM responses.
+
+Responses are stored in SQLite under the SHA-256 of everything that determines them (model,
+generation config, system instruction, prompt payload), so re-processing an unchanged
+document costs no requests. When the stored responses exceed max_bytes, the least recently
+used ones are evicted. Hit/miss counters are stored with the entries, for the logs page.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = "data/gemini_cache.sqlite"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        with self._connect() as connection, connection as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses "
+                       "(key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            db.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",)])
+
+    def _connect(self) -> closing:
+        # One connection per operation: Streamlit reruns and asyncio tasks may come from different threads
+        connection = sqlite3.connect(self.path, timeout=30)
+        return closing(connection)
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Stable hash of JSON-serializable parts"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response, or None; counts a hit or a miss"""
+        with self._connect() as connection, connection as db:
+            row = db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ("hits" if row else "misses",))
+        return row[0] if row else None
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response, evicting least recently used ones beyond max_bytes"""
+        size = len(response.encode('utf-8'))
+        with self._connect() as connection, connection as db:
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evict = []
+            for old_key, old_size in db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((old_key,))
+                total -= old_size
+            db.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def delete(self, key: str) -> None:
+        """Drop a response (e.g. one that turned out to be invalid)"""
+        with self._connect() as connection, connection as db:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, int]:
+        """hits, misses, entries and bytes stored"""
+        with self._connect() as connection:
+            counters = dict(connection.execute("SELECT name, value FROM counters"))
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0),
+                "entries": entries, "bytes": size}
@@ -0,0 +1,66 @@
+"""
+Cheap local checks of Gemini answers before they reach the document.
+
+An answer may only add marks: with nikud (and cantillation) stripped, a section answer must
+equal the tagged section it was asked to vocalize, tags included, and every span in a span
+answer must equal its span. Each check is one linear pass; a failing answer is described
+(in Hebrew, for the logs, quoting the answer where its letters first differ) so the caller
+can retry just that payload.
+"""
+from os.path import commonprefix
+import re
+from typing import List, Optional
+
+from .gemini_service import parse_span_response
+from .hebrew import strip_nikud, strip_with_offsets
+
+_TAG = re.compile(r'</?b>')
+
+
+def _letters(text: str) -> str:
+    return strip_nikud(text, cantillation=True)
+
+
+def validate_section_response(original: str, response: str) -> Optional[str]:
+    """
+    Args:
+        original: the tagged section (or chunk) that was sent
+        response: Gemini's tagged answer
+
+    Returns:
+        Optional[str]: None if the answer differs from original by marks only, else what is wrong
+    """
+    expected = _letters(original).strip('\n')
+    letters, offsets = strip_with_offsets(response, cantillation=True)
+    answer = letters.strip('\n')
+    if answer == expected:
+        return None
+    if _TAG.sub('', answer) == _TAG.sub('', expected):
+        return "מבנה תגיות ההדגשה השתנה"
+    if expected.startswith(answer):
+        return f"התשובה קטועה ({len(answer)} מתוך {len(expected)} תווים)"
+
+    # The first differing letter, back in the vocalized answer
+    mismatch = len(commonprefix([expected, answer]))
+    position = offsets[mismatch + len(letters) - len(letters.lstrip('\n'))]
+    return f"הטקסט השתנה (מתו {mismatch}: \"{response[position:position + 20]}\")"
+
+
+def validate_span_response(spans: List[str], response: str) -> Optional[str]:
+    """
+    Args:
+        spans: the spans that were sent, id i is spans[i - 1]
+        response: Gemini's JSON answer
+
+    Returns:
+        Optional[str]: None if the answer is valid JSON whose spans differ from theirs by marks
+        only (left-out spans are allowed), else what is wrong
+    """
+    vocalized = parse_span_response(response)
+    if vocalized is None:
+        return "התשובה אינה JSON תקין"
+    wrong = [i for i, text in vocalized.items()
+             if not 0 < i <= len(spans) or _letters(text) != _letters(spans[i - 1])]
+    if wrong:
+        return f"{len(wrong)} קטעים חזרו עם אותיות שונות"
+    return None
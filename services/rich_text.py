@@ -0,0 +1,201 @@
+"""
+Span-based text representation.
+
+A RichText is a plain text buffer plus a flat array('I') of (start, end, flags) spans,
+sorted and non-overlapping. The pipeline reads documents into this form, splits, matches,
+vocalizes and writes it without ever embedding markup in the text. Tagged text (<b>…</b>)
+is only produced and parsed at the LLM boundary (to_tagged / from_tagged).
+"""
+import re
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .nikud_splicer import char_chunks
+
+BOLD = 1
+
+_TAG = re.compile(r'<(/?)b>')
+
+
+def coalesce_bold_runs(runs: Iterable[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """
+    Merge formatting runs in one linear pass: consecutive runs with the same boldness become
+    one run, whitespace-only runs (bold or not) are bold only between two bold runs, and empty
+    runs are dropped.
+
+    Args:
+        runs: (text, bold) for each run, in order
+
+    Returns:
+        List[Tuple[str, bool]]: the merged runs, alternating bold and plain
+    """
+    merged: List[Tuple[List[str], bool]] = []
+    gap: List[str] = []  # whitespace after a bold run, bold if another bold run follows
+
+    for text, bold in runs:
+        if not text:
+            continue
+        if bold and not text.isspace():
+            if merged and merged[-1][1]:
+                merged[-1][0].extend(gap)
+                merged[-1][0].append(text)
+            else:
+                if gap:
+                    merged.append((gap, False))
+                merged.append(([text], True))
+            gap = []
+        elif merged and merged[-1][1] and text.isspace():
+            gap.append(text)
+        else:
+            gap.append(text)
+            if merged and not merged[-1][1]:
+                merged[-1][0].extend(gap)
+            else:
+                merged.append((gap, False))
+            gap = []
+
+    if gap:
+        if merged and not merged[-1][1]:
+            merged[-1][0].extend(gap)
+        else:
+            merged.append((gap, False))
+    return [(''.join(parts), bold) for parts, bold in merged]
+
+
+@dataclass(frozen=True)
+class RichText:
+    text: str
+    spans: array = field(default_factory=lambda: array('I'))  # start, end, flags, start, end, flags, ...
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def span_count(self) -> int:
+        return len(self.spans) // 3
+
+    def iter_spans(self, flags: int = BOLD) -> Iterator[Tuple[int, int]]:
+        """(start, end) of every span with any of flags set"""
+        spans = self.spans
+        for i in range(0, len(spans), 3):
+            if spans[i + 2] & flags:
+                yield spans[i], spans[i + 1]
+
+    def slice(self, start: int, end: int) -> 'RichText':
+        """The text between start and end, with its spans clipped and rebased"""
+        spans = self.spans
+        # First span that ends after start
+        k = bisect_right(range(self.span_count), start, key=lambda i: spans[3 * i + 1])
+        sliced = array('I')
+        for i in range(3 * k, len(spans), 3):
+            span_start, span_end = spans[i], spans[i + 1]
+            if span_start >= end:
+                break
+            span_start, span_end = max(span_start, start), min(span_end, end)
+            if span_start < span_end:
+                sliced.extend((span_start - start, span_end - start, spans[i + 2]))
+        return RichText(self.text[start:end], sliced)
+
+    @classmethod
+    def concat(cls, parts: Iterable['RichText']) -> 'RichText':
+        """Join texts; spans that meet at a boundary with the same flags become one span"""
+        texts: List[str] = []
+        spans = array('I')
+        offset = 0
+        for part in parts:
+            part_spans = part.spans
+            for i in range(0, len(part_spans), 3):
+                start, end, flags = part_spans[i] + offset, part_spans[i + 1] + offset, part_spans[i + 2]
+                if spans and spans[-2] == start and spans[-1] == flags:
+                    spans[-2] = end
+                else:
+                    spans.extend((start, end, flags))
+            texts.append(part.text)
+            offset += len(part.text)
+        return cls(''.join(texts), spans)
+
+    def to_tagged(self) -> str:
+        """Text with bold spans wrapped in <b></b> (for LLM prompts)"""
+        parts = []
+        position = 0
+        for start, end in self.iter_spans(BOLD):
+            parts.append(self.text[position:start])
+            parts.append(f"<b>{self.text[start:end]}</b>")
+            position = end
+        parts.append(self.text[position:])
+        return ''.join(parts)
+
+    @classmethod
+    def from_tagged(cls, tagged: str) -> 'RichText':
+        """Parse <b></b> markup (e.g. an LLM response); unbalanced tags are dropped"""
+        texts: List[str] = []
+        spans = array('I')
+        length = 0
+        position = 0
+        bold_start: Optional[int] = None
+        for match in _TAG.finditer(tagged):
+            texts.append(tagged[position:match.start()])
+            length += match.start() - position
+            position = match.end()
+            if not match.group(1):
+                if bold_start is None:
+                    bold_start = length
+            elif bold_start is not None:
+                if length > bold_start:
+                    spans.extend((bold_start, length, BOLD))
+                bold_start = None
+        texts.append(tagged[position:])
+        return cls(''.join(texts), spans)
+
+    def splice(self, word_spans: Sequence[Tuple[int, int]],
+               replacements: Sequence[Optional[str]]) -> 'RichText':
+        """
+        Replace words (sorted, non-overlapping spans) with vocalized forms and move the spans
+        with them. A replacement whose letters differ from the word is ignored, so only marks
+        are ever added or changed; a span boundary inside a word stays on the same letter.
+        """
+        text = self.text
+        parts: List[str] = []
+        edit_starts: List[int] = []
+        edits: List[Tuple[int, List[int], int, int]] = []  # end, new offset of each char, shift before/after
+        shift = 0
+        position = 0
+        for (start, end), replacement in zip(word_spans, replacements):
+            if replacement is None:
+                continue
+            chunks = char_chunks(text[start:end], replacement)
+            if chunks is None:
+                continue
+            parts.append(text[position:start])
+            parts.extend(chunks)
+            position = end
+
+            offsets = []
+            total = 0
+            for chunk in chunks:
+                offsets.append(total)
+                total += len(chunk)
+            edit_starts.append(start)
+            edits.append((end, offsets, shift, shift + total - (end - start)))
+            shift = edits[-1][3]
+
+        if not edits:
+            return self
+        parts.append(text[position:])
+
+        def moved(offset: int) -> int:
+            k = bisect_right(edit_starts, offset) - 1
+            if k < 0:
+                return offset
+            end, offsets, shift_before, shift_after = edits[k]
+            if offset < end:
+                return edit_starts[k] + shift_before + offsets[offset - edit_starts[k]]
+            return offset + shift_after
+
+        spans = array('I', self.spans)
+        for i in range(0, len(spans), 3):
+            spans[i] = moved(spans[i])
+            spans[i + 1] = moved(spans[i + 1])
+        return RichText(''.join(parts), spans)
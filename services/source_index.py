@@ -0,0 +1,76 @@
+import logging
+import os
+import pickle
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .hebrew import normalization_digest
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.nikud-index.pkl'
+
+
+@dataclass(frozen=True, eq=False)
+class SourceIndex:
+    """
+    Build-once view of a vocalized source text.
+
+    Holds everything NikudMapper needs to map targets against the source, so the
+    source is tokenized and stripped once per document instead of once per run.
+    Built by NikudMapper.build_index. Fields cannot be reassigned, but the dicts and
+    arrays are shared rather than copied and must not be mutated; indexes compare and
+    hash by identity.
+    """
+    nikud_words: Tuple[str, ...]      # vocalized source words
+    clean_words: Tuple[str, ...]      # the same words without nikud
+    keys: Tuple[str, ...]             # word skeletons (no ו/י) used for anchors and alignment
+    offsets: array                    # flattened (start, end) of each word in the source text
+    anchors: Dict[int, Tuple[int, ...]]  # shingle hash -> source word positions
+    vocabulary: Dict[str, int]        # skeleton -> word id
+    word_ids: array                   # word id of each source word
+    shingle_size: int
+
+    def __len__(self) -> int:
+        return len(self.clean_words)
+
+    def word_span(self, idx: int) -> Tuple[int, int]:
+        """Character offsets of source word idx in the source text"""
+        return self.offsets[2 * idx], self.offsets[2 * idx + 1]
+
+    @staticmethod
+    def cache_path(source_path: str) -> str:
+        """Path of the pickled index kept next to the source document"""
+        return source_path + INDEX_SUFFIX
+
+    @staticmethod
+    def _stamp(source_path: str, shingle_size: int) -> tuple:
+        """What a pickled index was built from: format, normalization tables, source size and mtime"""
+        stat = os.stat(source_path)
+        return INDEX_VERSION, normalization_digest(), stat.st_size, stat.st_mtime_ns, shingle_size
+
+    def save(self, source_path: str) -> None:
+        """Pickle the index next to source_path, stamped with what it was built from (see _stamp)"""
+        stamp = self._stamp(source_path, self.shingle_size)
+        with open(self.cache_path(source_path), 'wb') as f:
+            pickle.dump((stamp, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, source_path: str, shingle_size: int) -> Optional['SourceIndex']:
+        """Load the pickled index for source_path, or None if it is missing or stale"""
+        path = cls.cache_path(source_path)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                stamp, index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable source index {path}: {e}")
+            return None
+
+        if stamp != cls._stamp(source_path, shingle_size):
+            return None
+        return index
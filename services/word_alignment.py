@@ -0,0 +1,94 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def hunt_szymanski(a: Sequence[int], b: Sequence[int], a_start: int = 0, a_end: Optional[int] = None,
+                   b_start: int = 0, b_end: Optional[int] = None,
+                   max_occurrences: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Longest common subsequence of a[a_start:a_end] and b[b_start:b_end] (Hunt–Szymanski).
+
+    Runs in O((r + n) log n) where r is the number of matching pairs. Symbols that occur
+    more than max_occurrences times in the a-range are ignored, which keeps r near-linear
+    for long documents full of function words.
+
+    Returns:
+        List[Tuple[int, int]]: matched (a index, b index) pairs, increasing in both
+    """
+    a_end = len(a) if a_end is None else a_end
+    b_end = len(b) if b_end is None else b_end
+
+    occurrences: Dict[int, List[int]] = {}
+    for i in range(a_start, a_end):
+        occurrences.setdefault(a[i], []).append(i)
+    if max_occurrences is not None:
+        occurrences = {k: v for k, v in occurrences.items() if len(v) <= max_occurrences}
+
+    thresholds: List[int] = []  # thresholds[k] = smallest a index ending a common subsequence of length k+1
+    links: List[Optional[tuple]] = []  # links[k] = (a index, b index, previous link)
+    for j in range(b_start, b_end):
+        positions = occurrences.get(b[j])
+        if not positions:
+            continue
+        # Visiting positions in decreasing order keeps each b[j] to a single match per length
+        for i in reversed(positions):
+            k = bisect_left(thresholds, i)
+            previous = links[k - 1] if k > 0 else None
+            if k == len(thresholds):
+                thresholds.append(i)
+                links.append((i, j, previous))
+            elif i < thresholds[k]:
+                thresholds[k] = i
+                links[k] = (i, j, previous)
+
+    pairs = []
+    link = links[-1] if links else None
+    while link is not None:
+        pairs.append((link[0], link[1]))
+        link = link[2]
+    pairs.reverse()
+    return pairs
+
+
+def monotonic_alignment(a: Sequence[int], b: Sequence[int], max_occurrences: int = 32,
+                        max_gap_cells: int = 250_000) -> List[Tuple[int, int]]:
+    """
+    Align two word-ID sequences in order.
+
+    A first pass matches only the rarer words; every gap between consecutive matches is
+    then re-aligned with all words, where local frequencies are small.
+    """
+    anchors = hunt_szymanski(a, b, max_occurrences=max_occurrences)
+
+    pairs: List[Tuple[int, int]] = []
+    prev_a, prev_b = -1, -1
+    for next_a, next_b in anchors + [(len(a), len(b))]:
+        gap_a = next_a - prev_a - 1
+        gap_b = next_b - prev_b - 1
+        if gap_a > 0 and gap_b > 0 and gap_a * gap_b <= max_gap_cells:
+            pairs.extend(hunt_szymanski(a, b, prev_a + 1, next_a, prev_b + 1, next_b))
+        if next_a < len(a):
+            pairs.append((next_a, next_b))
+        prev_a, prev_b = next_a, next_b
+    return pairs
+
+
+def filter_regions(pairs: List[Tuple[int, int]], min_region: int = 4,
+                   max_gap: int = 3) -> List[Tuple[int, int]]:
+    """
+    Keep only matches that belong to a dense region.
+
+    Consecutive pairs are in the same region when both sides advance by at most max_gap + 1;
+    regions shorter than min_region matches are usually common words matched by chance.
+    """
+    kept: List[Tuple[int, int]] = []
+    region: List[Tuple[int, int]] = []
+    for pair in pairs:
+        if region and (pair[0] - region[-1][0] > max_gap + 1 or pair[1] - region[-1][1] > max_gap + 1):
+            if len(region) >= min_region:
+                kept.extend(region)
+            region = []
+        region.append(pair)
+    if len(region) >= min_region:
+        kept.extend(region)
+    return kept
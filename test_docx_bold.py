@@ -2,27 +2,23 @@ from docx import Document
 import sys
 import re
 
+from services.rich_text import coalesce_bold_runs
+
+def tag_runs(runs) -> str:
+    """Join (text, bold) runs into text with <b></b> around the bold ones"""
+    return ''.join(f"<b>{text}</b>" if bold else text for text, bold in runs)
+
 def clean_bold_tags(text: str) -> str:
     """Clean and optimize bold tags:
     1. Remove empty bold tags
-    2. Merge adjacent bold tags
-    3. Remove redundant spaces between merged tags
+    2. Merge adjacent bold tags (including when only spaces between them)
+    3. Normalize spaces
     """
-    # Remove empty bold tags
-    text = re.sub(r'<b>\s*</b>', '', text)
-    
-    # Initial cleanup - normalize spaces
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Merge adjacent bold tags (including when only spaces between them)
-    while True:
-        # Try to find and merge adjacent tags
-        new_text = re.sub(r'</b>(\s*)<b>', r'\1', text)
-        if new_text == text:  # No more merges possible
-            break
-        text = new_text
-    
-    return text.strip()
+    # Split into runs once and merge them in a single pass
+    pieces = re.split(r'<b>(.*?)</b>', text, flags=re.S)
+    runs = [(piece, i % 2 == 1) for i, piece in enumerate(pieces)]
+    text = tag_runs(coalesce_bold_runs(runs))
+    return re.sub(r'\s+', ' ', text).strip()
 
 def analyze_docx_bold(file_path: str):
     """Analyze bold formatting in DOCX and output HTML-style text"""
@@ -34,24 +30,16 @@ def analyze_docx_bold(file_path: str):
     print("-------------------")
     
     for i, para in enumerate(doc.paragraphs, 1):
-        para_text = ""
-        has_bold = False
-        
-        for run in para.runs:
-            if run.bold:
-                para_text += f"<b>{run.text}</b>"
-                has_bold = True
-            else:
-                para_text += run.text
+        runs = [(run.text, bool(run.bold)) for run in para.runs]
         
-        if has_bold:
-            # Clean up bold tags
-            cleaned_text = clean_bold_tags(para_text)
+        if any(bold for _, bold in runs):
+            # Clean up bold runs
+            cleaned_text = clean_bold_tags(tag_runs(runs))
             if '<b>' in cleaned_text:  # Only add if still has bold after cleanup
                 result.append(f"פסקה {i}:")
                 result.append(cleaned_text)
                 result.append("לפני ניקוי:")
-                result.append(para_text)
+                result.append(tag_runs(runs))
                 result.append("-------------------")
     
     if not result:
@@ -64,4 +52,4 @@ if __name__ == "__main__":
         print("Usage: python test_docx_bold.py <path_to_docx>")
         sys.exit(1)
         
-    analyze_docx_bold(sys.argv[1]) 
\ No newline at end of file
+    analyze_docx_bold(sys.argv[1])
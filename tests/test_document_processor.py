@@ -0,0 +1,128 @@
+import io
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+from services.document_processor import DocumentProcessor
+
+
+@pytest.fixture
+def processor():
+    return DocumentProcessor()
+
+
+def sections(result):
+    return [(section.header, section.content) for section in result]
+
+
+def test_split_to_sections(processor):
+    text = "הקדמה\nשורה\nא\nתוכן א\n\nעוד שורה\n ב \nג\nתוכן ג"
+
+    assert sections(processor.split_to_sections(text)) == [
+        ("", "הקדמה\nשורה"),
+        ("א", "תוכן א\n\nעוד שורה"),
+        # ב has no lines before the next header, so it produces no section
+        ("ג", "תוכן ג"),
+    ]
+
+
+def test_split_to_sections_edges(processor):
+    assert sections(processor.split_to_sections("")) == [("", "")]
+    assert sections(processor.split_to_sections("א")) == []
+    assert sections(processor.split_to_sections("א\n")) == [("א", "")]
+    assert sections(processor.split_to_sections("\nא\nשורה ארוכה")) == [("", ""), ("א", "שורה ארוכה")]
+
+
+def test_split_lines_matches_text(processor):
+    text = "פתיחה\nא\nשורה\n\n  בג\nשורה\n"
+
+    from_lines = processor.split_to_sections(io.StringIO(text))
+    assert sections(from_lines) == sections(processor.split_to_sections(text))
+
+
+def read_docx(name):
+    path = Path(__file__).parent.parent / name
+    return "\n".join(paragraph.text for paragraph in Document(path).paragraphs)
+
+
+def test_find_matching_sections_bundled_documents(processor):
+    source_sections = processor.split_to_sections(read_docx("temp_source.docx"))
+    target_sections = processor.split_to_sections(read_docx("temp_target.docx"))
+
+    matches = processor.find_matching_sections(source_sections, target_sections)
+
+    assert len(matches) == 10
+    assert all(source.header == target.header for source, target in matches)
+
+
+def test_find_matching_sections_one_to_one(processor):
+    paragraph = "הַקֹּדֶשׁ הָעַצְמִי הוּא הַחָכְמָה, הַהַכָּרָה לְבַדָּהּ. " * 6
+    plain = processor.normalize_text(paragraph)
+    source_text = f"א\n{paragraph}\nב\n{paragraph}"
+    target_text = f"א\n{plain}\nב\n{plain}\nג\n{plain}"
+
+    matches = processor.find_matching_sections(processor.split_to_sections(source_text),
+                                               processor.split_to_sections(target_text))
+
+    # Every target is an equally good match; section order breaks the tie
+    assert [(source.header, target.header) for source, target in matches] == [("א", "א"), ("ב", "ב")]
+
+
+def test_sections_share_buffer_and_extract_lazily(processor):
+    paragraph = "שורה ארוכה של תוכן. " * 12
+    text = f"א\nכותרת\n\n{paragraph}\n{paragraph}\n\nוזה הסוף"
+
+    section = processor.split_to_sections(text)[0]
+
+    assert not hasattr(section, "__dict__")
+    assert section._buffer is text
+    assert section._main is None
+    assert section.main_content == f"{paragraph}\n{paragraph}".strip() + "\n\nוזה הסוף"
+    assert section.first_sentence == "שורה ארוכה של תוכן"
+    assert section.content == f"כותרת\n\n{paragraph}\n{paragraph}\n\nוזה הסוף"
+
+
+def test_sections_of_rich_text_keep_spans(processor):
+    from services.rich_text import RichText
+
+    document = RichText.from_tagged("א\nפירוש על <b>בראשית</b>\nב\n<b>ברא</b> אלהים")
+
+    first, second = processor.split_to_sections(document)
+
+    assert first.content == "פירוש על בראשית"
+    assert first.rich.to_tagged() == "פירוש על <b>בראשית</b>"
+    assert second.rich.to_tagged() == "<b>ברא</b> אלהים"
+
+
+def test_bold_lines_of_rich_text_are_not_headers(processor):
+    from services.rich_text import RichText
+
+    tagged = "א\nפירוש\n<b>מאת</b>\nועוד\n<b>ב</b>\nבסוף\nג <b>ד</b>\nב\nאחרון"
+    document = RichText.from_tagged(tagged)
+
+    # The same sections as the tagged text: only the plain letter lines are headers
+    sections = processor.split_to_sections(document)
+    assert [section.header for section in sections] == ["א", "ב"]
+    assert [section.header for section in processor.split_to_sections(tagged)] == ["א", "ב"]
+    assert sections[0].rich.to_tagged() == "פירוש\n<b>מאת</b>\nועוד\n<b>ב</b>\nבסוף\nג <b>ד</b>"
+
+
+def test_split_for_budget_prefers_paragraphs_then_sentences(processor):
+    text = "פסקה ראשונה.\nמשפט אחד. משפט שני ארוך יותר. שלישי\nאחרונה"
+
+    ranges = processor.split_for_budget(text, 20)
+
+    assert [text[start:end] for start, end in ranges] == [
+        "פסקה ראשונה.\n", "משפט אחד. ", "משפט שני ארוך יותר. ", "שלישי\nאחרונה"]
+    assert processor.split_for_budget(text, len(text)) == [(0, len(text))]
+    # A single word longer than the budget is cut hard
+    assert processor.split_for_budget("אבגדהוזח", 3) == [(0, 3), (3, 6), (6, 8)]
+
+
+def test_source_window_snaps_to_words(processor):
+    source = "אחת שתיים שלוש ארבע חמש שש שבע שמונה תשע עשר"
+
+    assert processor.source_window(source, 0.45, 0.55, margin=0) == "ארבע חמש שש"
+    assert processor.source_window(source, 0.0, 0.1) == "אחת שתיים"
+    assert processor.source_window(source, 0.0, 1.0) == source
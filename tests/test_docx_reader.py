@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+from services.docx_reader import read_tagged_text
+from services.rich_text import coalesce_bold_runs
+
+ROOT = Path(__file__).parent.parent
+
+
+def python_docx_tagged_text(path):
+    """The tagged text built from the python-docx object model, runs merged the same way"""
+    lines = []
+    for para in Document(path).paragraphs:
+        runs = coalesce_bold_runs((run.text, bool(run.bold)) for run in para.runs)
+        lines.append(''.join(f"<b>{text}</b>" if bold else text for text, bold in runs) + "\n")
+    return ''.join(lines)
+
+
+@pytest.mark.parametrize("name", ["temp_source.docx", "tools/nikud/input.docx", "tools/nikud/output_nikud.docx"])
+def test_matches_python_docx(name):
+    text, bold_count = read_tagged_text(str(ROOT / name))
+
+    assert text == python_docx_tagged_text(ROOT / name)
+    assert bold_count == text.count("<b>")
+
+
+def test_bold_from_styles(tmp_path):
+    doc = Document()
+    doc.add_paragraph("כותרת", style="Heading 1")
+    para = doc.add_paragraph("פירוש על ")
+    para.add_run("בראשית").bold = True
+    para.add_run(" בתורה")
+    para.add_run(" הדגשה").style = doc.styles["Strong"]
+    path = tmp_path / "styles.docx"
+    doc.save(path)
+
+    direct, _ = read_tagged_text(str(path))
+    inherited, _ = read_tagged_text(str(path), inherit_styles=True)
+
+    assert direct == "כותרת\nפירוש על <b>בראשית</b> בתורה הדגשה\n"
+    assert inherited == "<b>כותרת</b>\nפירוש על <b>בראשית</b> בתורה<b> הדגשה</b>\n"
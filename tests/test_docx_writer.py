@@ -0,0 +1,103 @@
+import zipfile
+
+import pytest
+from docx import Document
+
+from services.docx_reader import read_paragraphs
+from services.docx_writer import patch_docx
+from services.nikud_service import NikudService
+
+SOURCE_PARAGRAPH = ("בְּרֵאשִׁית בָּרָא אֱלֹהִים אֵת הַשָּׁמַיִם וְאֵת הָאָרֶץ. "
+                    "וְהָאָרֶץ הָיְתָה תֹהוּ וָבֹהוּ וְחֹשֶׁךְ עַל פְּנֵי תְהוֹם וְרוּחַ אֱלֹהִים מְרַחֶפֶת עַל פְּנֵי הַמָּיִם. "
+                    "וַיֹּאמֶר אֱלֹהִים יְהִי אוֹר וַיְהִי אוֹר. "
+                    "וַיַּרְא אֱלֹהִים אֶת הָאוֹר כִּי טוֹב וַיַּבְדֵּל אֱלֹהִים בֵּין הָאוֹר וּבֵין הַחֹשֶׁךְ. "
+                    "וַיִּקְרָא אֱלֹהִים לָאוֹר יוֹם וְלַחֹשֶׁךְ קָרָא לָיְלָה.")
+
+
+@pytest.fixture
+def template(tmp_path):
+    doc = Document()
+    doc.add_paragraph("כותרת")
+    para = doc.add_paragraph()
+    para.add_run("פירוש על ")
+    para.add_run("ברא").bold = True
+    para.add_run("שית\t").bold = True  # a word split across runs, and a tab
+    para.add_run("ועל ")
+    para.add_run("ברא").bold = True
+    path = tmp_path / "template.docx"
+    doc.save(path)
+    return path
+
+
+def test_patch_docx_changes_only_text_nodes(template, tmp_path):
+    output = tmp_path / "output.docx"
+
+    skipped = patch_docx(str(template), str(output), {1: "פירוש על בְּרֵאשִׁית\tועל בָּרָא"})
+
+    assert skipped == []
+    runs = Document(output).paragraphs[1].runs
+    assert [run.text for run in runs] == ["פירוש על ", "בְּרֵא", "שִׁית\t", "ועל ", "בָּרָא"]
+    assert [run.bold for run in runs] == [None, True, True, None, True]
+
+    with zipfile.ZipFile(template) as before, zipfile.ZipFile(output) as after:
+        assert before.namelist() == after.namelist()
+        changed = [name for name in before.namelist() if before.read(name) != after.read(name)]
+    assert changed == ["word/document.xml"]
+
+
+def test_patch_docx_skips_changed_text(template, tmp_path):
+    output = tmp_path / "output.docx"
+
+    assert patch_docx(str(template), str(output), {1: "טקסט אחר לגמרי"}) == [1]
+    assert Document(output).paragraphs[1].text == Document(template).paragraphs[1].text
+
+
+def test_process_files_keeps_document(tmp_path):
+    source = Document()
+    source.add_paragraph("א")
+    source.add_paragraph(SOURCE_PARAGRAPH)
+    source.save(tmp_path / "source.docx")
+
+    target = Document()
+    target.add_paragraph("הקדמה לספר")
+    target.add_paragraph("א")
+    para = target.add_paragraph()
+    para.add_run("בראשית ברא אלהים").bold = True
+    para.add_run(" " + NikudService().remove_nikud(SOURCE_PARAGRAPH)[len("בראשית ברא אלהים "):])
+    target.save(tmp_path / "target.docx")
+
+    service = NikudService(engine="local", lexicon_path=None)
+    service.process_files(str(tmp_path / "source.docx"), str(tmp_path / "target.docx"), str(tmp_path / "output.docx"))
+
+    paragraphs = Document(tmp_path / "output.docx").paragraphs
+    assert [p.text for p in paragraphs[:2]] == ["הקדמה לספר", "א"]
+    runs = paragraphs[2].runs
+    assert runs[0].text == "בְּרֵאשִׁית בָּרָא אֱלֹהִים" and runs[0].bold
+    assert runs[1].text == target.paragraphs[2].runs[1].text
+
+
+def test_process_files_with_soft_line_breaks(tmp_path):
+    source = Document()
+    source.add_paragraph("א")
+    source.add_paragraph(SOURCE_PARAGRAPH)
+    source.save(tmp_path / "source.docx")
+
+    target = Document()
+    intro = target.add_paragraph("הקדמה")
+    intro.add_run().add_break()  # w:br: one paragraph, two lines of text
+    intro.add_run("לספר")
+    target.add_paragraph("א")
+    para = target.add_paragraph()
+    para.add_run("בראשית ברא אלהים").bold = True
+    para.add_run(" " + NikudService().remove_nikud(SOURCE_PARAGRAPH)[len("בראשית ברא אלהים "):])
+    target.save(tmp_path / "target.docx")
+
+    text, starts = read_paragraphs(str(tmp_path / "target.docx"))
+    assert text.text.startswith("הקדמה\nלספר\nא\n") and starts[:3] == [0, 11, 13]
+
+    service = NikudService(engine="local", lexicon_path=None)
+    service.process_files(str(tmp_path / "source.docx"), str(tmp_path / "target.docx"), str(tmp_path / "output.docx"))
+
+    paragraphs = Document(tmp_path / "output.docx").paragraphs
+    assert [p.text for p in paragraphs[:2]] == ["הקדמה\nלספר", "א"]
+    assert paragraphs[2].runs[0].text == "בְּרֵאשִׁית בָּרָא אֱלֹהִים"
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.gemini_service import FEW_SHOT_EXAMPLE, GeminiService, SPAN_SYSTEM_INSTRUCTION, parse_span_response
+from services.llm_backend import Completion, Usage
+
+
+class FakeBackend:
+    """Records every request and answers "answer", with the prompt length as its token count"""
+    model_name = "fake"
+    generation_config = {"temperature": 1}
+    max_output_tokens = 8192
+
+    def __init__(self):
+        self.requests = []
+        self.usage = {}
+
+    def _usage(self, prompt, system, json_output):
+        self.requests.append(SimpleNamespace(prompt=prompt, system=system, json_output=json_output))
+        return Usage(len(str(prompt)), 1)
+
+    def generate(self, prompt, system="", json_output=False):
+        return Completion("answer", self._usage(prompt, system, json_output))
+
+    async def stream(self, prompt, system="", json_output=False):
+        usage = self._usage(prompt, system, json_output)
+        for piece in ("ans", "wer"):
+            await asyncio.sleep(0)
+            yield Completion(piece)
+        yield Completion("", usage)
+
+    async def count_tokens(self, text):
+        return len(text)
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # gemini_service.log, data/gemini_cache.sqlite
+
+
+def gemini_service(**kwargs):
+    return GeminiService(backend=FakeBackend(), **kwargs)
+
+
+def section(header):
+    return {"source_content": f"מקור {header}", "target_content": f"{header}\nיעד <b>מילה</b>",
+            "source_header": header, "target_header": header}
+
+
+def test_requests_carry_only_their_own_section():
+    service = gemini_service(cache_path=None)
+
+    service.add_nikud(section("א"))
+    service.add_nikud(section("ב"))
+    asyncio.run(service.add_nikud_async(section("ג")))
+
+    first, second, third = [request.prompt for request in service.backend.requests]
+    assert isinstance(second, str) and "מקור ב" in second and "מקור א" not in second
+    # No history: every request is the same size as the first
+    assert len(first) == len(second) == len(third)
+    assert service.usage == {"requests": 3, "prompt_tokens": 3 * len(first), "output_tokens": 3}
+
+
+def test_few_shot_prefix_is_fixed():
+    service = gemini_service(few_shot=True, cache_path=None)
+
+    service.add_nikud(section("א"))
+    service.add_nikud(section("ב"))
+
+    first, second = [request.prompt for request in service.backend.requests]
+    assert first[:2] == second[:2] == service.few_shot_prefix
+    assert second[1] == {"role": "assistant", "content": FEW_SHOT_EXAMPLE["response"]}
+    assert len(second) == 3 and "מקור ב" in second[2]["content"]
+
+
+def test_repeated_sections_come_from_cache():
+    service = gemini_service()
+    service.add_nikud(section("א"))
+    asyncio.run(service.add_nikud_async(section("ב")))
+
+    # A new service (e.g. another session) with the same configuration reads the same cache
+    service = gemini_service()
+    assert service.add_nikud(section("א")) == "answer"
+    assert asyncio.run(service.add_nikud_async(section("ב"))) == "answer"
+    assert service.backend.requests == []
+    assert service.cache.stats()["hits"] == 2
+
+    # Any change to the request configuration is a different key
+    assert gemini_service(few_shot=True).cached_response(section("א")) is None
+
+
+def test_span_requests_are_numbered_and_cached_apart():
+    service = gemini_service()
+    content = {"source_content": "מקור", "spans": ["בראשית", "ברא אלהים"], "target_header": "א"}
+
+    asyncio.run(service.vocalize_spans_async(content))
+
+    [request] = service.backend.requests
+    assert request.prompt == "[טקסט מקור (עם ניקוד)]:\nמקור\n\n[קטעים לניקוד]:\n1. בראשית\n2. ברא אלהים"
+    assert request.system == SPAN_SYSTEM_INSTRUCTION and request.json_output
+    assert service.cached_response(content) == "answer"
+    assert service.cached_response({**content, "spans": ["בראשית"]}) is None
+
+
+def test_parse_span_response():
+    assert parse_span_response('{"1": "בְּרֵאשִׁית", "2": 3, "x": "y"}') == {1: "בְּרֵאשִׁית"}
+    assert parse_span_response('```json\n{"2": "בָּרָא"}\n```') == {2: "בָּרָא"}
+    assert parse_span_response('{}') == {}
+    assert parse_span_response('{"1": "בְּרֵאשִׁית"') is None
+    assert parse_span_response('["בָּרָא"]') is None
+
+
+def test_stream_yields_pieces_and_caches_the_whole_answer():
+    service = gemini_service()
+
+    async def run():
+        return [piece async for piece in service.stream_async(section("א"))]
+
+    assert asyncio.run(run()) == ["ans", "wer"]
+    # Cached: one piece, no request
+    assert asyncio.run(run()) == ["answer"]
+    assert len(service.backend.requests) == 1
+
+    partials = []
+    asyncio.run(service.add_nikud_async(section("ב"), on_partial=partials.append))
+    assert partials == ["ans", "answer"]
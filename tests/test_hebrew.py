@@ -0,0 +1,31 @@
+from services.hebrew import has_nikud, skeleton, strip_nikud, strip_with_offsets
+
+
+def test_strip_nikud_options():
+    word = "בְּרֵאשִׁ֖ית"  # כולל טעם טיפחא
+    assert strip_nikud(word) == "בראש֖ית"
+    assert strip_nikud(word, cantillation=True) == "בראשית"
+    assert strip_nikud("הָֽאָרֶץ") == "הארץ"
+    assert strip_nikud("הָֽאָרֶץ", meteg=False) == "הֽארץ"
+
+
+def test_presentation_forms():
+    text = "שּׁלום"  # שּׁ כתו צורת תצוגה
+    assert strip_nikud(text) == text
+    assert strip_nikud(text, form="NFD") == "שלום"
+
+
+def test_offsets_map_back_to_original():
+    text = "שָׁלוֹם, עוֹלָם!"
+    clean, offsets = strip_with_offsets(text)
+
+    assert clean == "שלום, עולם!"
+    assert len(offsets) == len(clean) + 1
+    assert offsets[-1] == len(text)
+    assert all(text[offsets[i]] == clean[i] for i in range(len(clean)))
+
+
+def test_has_nikud_and_skeleton():
+    assert has_nikud("שָׁלוֹם")
+    assert not has_nikud("שלום")
+    assert skeleton("הקודש") == skeleton("הקדש")
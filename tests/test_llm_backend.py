@@ -0,0 +1,143 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import llm_backend
+from services.llm_backend import AnthropicBackend, Completion, GeminiBackend, ReplayBackend, Usage
+
+
+class FakeModel:
+    """Records the contents of every request; answers "answer" in two streamed chunks"""
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.requests = []
+        FakeModel.instances.append(self)
+
+    def generate_content(self, contents):
+        self.requests.append(contents)
+        return SimpleNamespace(text="answer", usage_metadata=FakeStream.usage_metadata)
+
+    async def generate_content_async(self, contents, stream=False):
+        assert stream
+        self.requests.append(contents)
+        return FakeStream()
+
+
+class FakeStream:
+    """A streamed response: the answer in two chunks, usage after the last one"""
+    usage_metadata = SimpleNamespace(prompt_token_count=5, candidates_token_count=1)
+
+    async def __aiter__(self):
+        for text in ("ans", "wer"):
+            await asyncio.sleep(0)
+            yield SimpleNamespace(text=text)
+
+
+def collect(stream):
+    async def run():
+        return [piece async for piece in stream]
+    return asyncio.run(run())
+
+
+def test_gemini_backend_maps_messages_and_usage(monkeypatch):
+    FakeModel.instances = []
+    monkeypatch.setattr(llm_backend, "genai", SimpleNamespace(configure=lambda **kwargs: None,
+                                                              GenerativeModel=FakeModel))
+    closed = []
+    async_client = SimpleNamespace(transport=SimpleNamespace(close=lambda: asyncio.sleep(0, closed.append(True))))
+    monkeypatch.setattr(llm_backend, "genai_client", SimpleNamespace(
+        _client_manager=SimpleNamespace(make_client=lambda name: async_client)))
+    backend = GeminiBackend(api_key="test")
+
+    prompt = [{"role": "user", "content": "שאלה"}, {"role": "assistant", "content": "תשובה"},
+              {"role": "user", "content": "עוד"}]
+    assert backend.generate(prompt, system="הנחיה") == Completion("answer", Usage(5, 1))
+    assert collect(backend.stream("שאלה", system="הנחיה", json_output=True)) == [
+        Completion("ans"), Completion("wer"), Completion("", Usage(5, 1))]
+
+    text_model, json_model = FakeModel.instances
+    assert text_model.requests == [[{"role": "user", "parts": ["שאלה"]}, {"role": "model", "parts": ["תשובה"]},
+                                    {"role": "user", "parts": ["עוד"]}]]
+    assert json_model.kwargs["generation_config"]["response_mime_type"] == "application/json"
+    assert json_model.kwargs["system_instruction"] == "הנחיה"
+    assert json_model._async_client is async_client
+    assert backend.usage == {"requests": 2, "prompt_tokens": 10, "output_tokens": 2}
+
+
+def test_anthropic_backend_request(monkeypatch):
+    requests = []
+    message = SimpleNamespace(content=[SimpleNamespace(type="text", text="answer")],
+                              usage=SimpleNamespace(input_tokens=7, output_tokens=3))
+    client = SimpleNamespace(messages=SimpleNamespace(create=lambda **request: requests.append(request) or message))
+    monkeypatch.setattr(llm_backend.anthropic, "Anthropic", lambda api_key: client)
+    monkeypatch.setattr(llm_backend.anthropic, "AsyncAnthropic", lambda api_key: None)
+    backend = AnthropicBackend(api_key="test", max_tokens=100)
+
+    assert backend.generate("שאלה", system="הנחיה") == Completion("answer", Usage(7, 3))
+    assert requests == [{"model": backend.model_name, "max_tokens": 100, "system": "הנחיה",
+                         "messages": [{"role": "user", "content": "שאלה"}]}]
+
+
+class RecordedBackend:
+    model_name = "recorded"
+    generation_config = {}
+    max_output_tokens = 100
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, system="", json_output=False):
+        self.calls += 1
+        return Completion(f"{system}:{prompt}", Usage(2, 1))
+
+    async def stream(self, prompt, system="", json_output=False):
+        self.calls += 1
+        yield Completion(f"{system}:")
+        yield Completion(prompt)
+        yield Completion("", Usage(2, 1))
+
+    async def count_tokens(self, text):
+        return len(text)
+
+
+def test_replay_records_then_serves_offline(tmp_path):
+    path = tmp_path / "recordings.jsonl"
+    recorder = ReplayBackend(path, record_from=RecordedBackend())
+    assert recorder.generate("שאלה", system="א").text == "א:שאלה"
+    assert collect(recorder.stream("שאלה", system="ב"))[-1] == Completion("", Usage(2, 1))
+    assert recorder.record_from.calls == 2
+
+    # Another process, no network: the same requests come from the file
+    replay = ReplayBackend(path, latency=0.05, chunk_chars=2)
+    start = time.perf_counter()
+    assert replay.generate("שאלה", system="א") == Completion("א:שאלה", Usage(2, 1))
+    assert time.perf_counter() - start >= 0.05
+    pieces = collect(replay.stream("שאלה", system="ב"))
+    assert [piece.text for piece in pieces] == ["ב:", "שא", "לה", ""] and pieces[-1].usage == Usage(2, 1)
+    assert replay.usage == {"requests": 2, "prompt_tokens": 4, "output_tokens": 2}
+
+    with pytest.raises(LookupError):
+        replay.generate("שאלה", system="ב", json_output=True)
+
+
+def test_replayed_streams_overlap(tmp_path):
+    path = tmp_path / "recordings.jsonl"
+    recorder = ReplayBackend(path, record_from=RecordedBackend())
+    for i in range(4):
+        recorder.generate(f"שאלה {i}")
+    replay = ReplayBackend(path, latency=0.1)
+
+    async def answer(prompt):
+        return ''.join([piece.text async for piece in replay.stream(prompt)])
+
+    async def run():
+        return await asyncio.gather(*(answer(f"שאלה {i}") for i in range(4)))
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == [f":שאלה {i}" for i in range(4)]
+    # Synthetic latency is awaited, so concurrent requests wait together
+    assert time.perf_counter() - start < 0.3
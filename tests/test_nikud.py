@@ -1,10 +1,19 @@
+import asyncio
+import json
 import os
 import logging
 from pathlib import Path
+from types import SimpleNamespace
 import pytest
 from docx import Document
 
-from services.nikud_service import NikudService
+from google.api_core import exceptions as google_exceptions
+
+from services import llm_backend
+from services.document_processor import Section
+from services.llm_backend import GeminiBackend
+from services.nikud_service import NikudService, SectionProgress
+from services.rich_text import RichText
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -60,5 +69,293 @@ def test_process_files(service, test_files):
     # Verify bold formatting preserved
     assert any(run.bold for para in output_doc.paragraphs for run in para.runs)
 
+SOURCE_SECTION = ("בְּרֵאשִׁית בָּרָא אֱלֹהִים אֵת הַשָּׁמַיִם וְאֵת הָאָרֶץ. "
+                  "וְהָאָרֶץ הָיְתָה תֹהוּ וָבֹהוּ וְחֹשֶׁךְ עַל פְּנֵי תְהוֹם וְרוּחַ אֱלֹהִים מְרַחֶפֶת עַל פְּנֵי הַמָּיִם. "
+                  "וַיֹּאמֶר אֱלֹהִים יְהִי אוֹר וַיְהִי אוֹר.")
+TARGET_SECTION = RichText.from_tagged("פירוש על <b>בראשית ברא אלהים</b> את השמים ועל <b>מילה חדשה</b> בתורה")
+
+def test_local_nikud_vocalizes_bold_only():
+    service = NikudService(engine="local", lexicon_path=None)
+    processed, coverage = service.local_nikud(SOURCE_SECTION, TARGET_SECTION)
+
+    assert "<b>בְּרֵאשִׁית בָּרָא אֱלֹהִים</b> את השמים" in processed.to_tagged()
+    assert "<b>מילה חדשה</b>" in processed.to_tagged()
+    assert coverage == pytest.approx(3 / 5)
+
+def test_local_nikud_coverage_counts_only_vocalized_words(monkeypatch):
+    service = NikudService(engine="local", lexicon_path=None)
+    # אותיות שלא התיישרו: _transfer_nikud מחזיר את מילת היעד כמות שהיא
+    monkeypatch.setattr(service.mapper, "_transfer_nikud", lambda vocalized, word: word)
+    processed, coverage = service.local_nikud(SOURCE_SECTION, TARGET_SECTION)
+
+    assert processed.to_tagged() == TARGET_SECTION.to_tagged()
+    assert coverage == 0
+
+def sheva_on_first_letter(content):
+    """A valid answer: a sheva on the first letter of the section, or of every span"""
+    if 'spans' in content:
+        return json.dumps({i: span[:1] + "\u05b0" + span[1:] for i, span in enumerate(content['spans'], 1)})
+    text = content['target_content']
+    return text[:1] + "\u05b0" + text[1:]
+
+class FakeGemini:
+    def __init__(self, delay=0.0, failures=0, respond=None, max_output_tokens=8192):
+        self.calls = []
+        self.max_output_tokens = max_output_tokens
+        self.counted = []
+        self.delay = delay
+        self.respond = respond or sheva_on_first_letter
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def cached_response(self, content):
+        return None
+
+    def discard_cached(self, content):
+        pass
+
+    async def count_tokens_async(self, text):
+        self.counted.append(text)
+        return len(text) // 2
+
+    async def add_nikud_async(self, content, check_cache=True, on_partial=None):
+        return await self._answer(content, on_partial)
+
+    async def vocalize_spans_async(self, content, check_cache=True, on_partial=None):
+        return await self._answer(content, on_partial)
+
+    async def aclose(self):
+        pass
+
+    async def _answer(self, content, on_partial=None):
+        self.calls.append(content)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay / len(self.calls))  # later calls finish first
+            if self.failures:
+                self.failures -= 1
+                raise google_exceptions.ServiceUnavailable("overloaded")
+            answer = self.respond(content)
+            if on_partial:
+                # Streamed in two pieces
+                on_partial(answer[:len(answer) // 2])
+                on_partial(answer)
+            return answer
+        finally:
+            self.in_flight -= 1
+
+def process_section(service, source_section, target_section):
+    return asyncio.run(service._process_section(source_section, target_section, asyncio.Semaphore(1)))
+
+@pytest.mark.parametrize("engine, threshold, expected_calls", [
+    ("local", 0.9, 0),
+    ("hybrid", 0.5, 0),
+    ("hybrid", 0.9, 1),
+    ("gemini", 0.0, 1),
+])
+def test_engine_falls_back_to_gemini_below_threshold(engine, threshold, expected_calls):
+    service = NikudService(engine=engine, coverage_threshold=threshold, lexicon_path=None, payload="section")
+    service._gemini = FakeGemini()
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+
+    assert len(service._gemini.calls) == expected_calls
+    assert result.text.startswith("פ\u05b0") == bool(expected_calls)
+
+def test_transient_errors_are_retried_per_section():
+    service = NikudService(lexicon_path=None, max_retries=2, retry_delay=0, payload="section")
+    service._gemini = FakeGemini(failures=2)
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+    assert result.text.startswith("פ\u05b0") and len(service._gemini.calls) == 3
+
+    # Out of retries: the section is left as it was
+    service._gemini = FakeGemini(failures=3)
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+    assert result == TARGET_SECTION and len(service._gemini.calls) == 3
+
+def test_sections_run_concurrently_in_order(tmp_path):
+    headers = ["א", "ב", "ג", "ד", "ה", "ו"]
+    source = Document()
+    target = Document()
+    for header in headers:
+        for doc in (source, target):
+            doc.add_paragraph(header)
+        source.add_paragraph(f"{header} {SOURCE_SECTION} {SOURCE_SECTION}")
+        target.add_paragraph(f"{header} " + NikudService().remove_nikud(f"{SOURCE_SECTION} {SOURCE_SECTION}"))
+    source.save(tmp_path / "source.docx")
+    target.save(tmp_path / "target.docx")
+
+    service = NikudService(lexicon_path=None, concurrency=3, requests_per_minute=None, payload="section")
+    # Each answer puts a sheva on the first letter of its own section's body
+    service._gemini = FakeGemini(delay=0.1, respond=lambda content: content['target_content'].replace(
+        f"{content['target_header']} ", f"{content['target_header']}\u05b0 ", 1))
+    service.process_files(str(tmp_path / "source.docx"), str(tmp_path / "target.docx"), str(tmp_path / "output.docx"))
+
+    assert service._gemini.max_in_flight == 3
+    paragraphs = [p.text for p in Document(tmp_path / "output.docx").paragraphs]
+    assert [paragraph[:2] for paragraph in paragraphs] == [
+        text for header in headers for text in (header, f"{header}\u05b0")]
+
+def test_progress_is_reported_per_section(tmp_path):
+    source = Document()
+    target = Document()
+    for header in ["א", "ב"]:
+        for doc in (source, target):
+            doc.add_paragraph(header)
+        source.add_paragraph(f"{header} {SOURCE_SECTION} {SOURCE_SECTION}")
+        target.add_paragraph(f"{header} " + NikudService().remove_nikud(f"{SOURCE_SECTION} {SOURCE_SECTION}"))
+    source.save(tmp_path / "source.docx")
+    target.save(tmp_path / "target.docx")
+
+    service = NikudService(lexicon_path=None, requests_per_minute=None, payload="section")
+    service._gemini = FakeGemini()
+    events = []
+    service.on_progress = events.append
+    service.process_files(str(tmp_path / "source.docx"), str(tmp_path / "target.docx"), str(tmp_path / "output.docx"))
+
+    # Both sections are queued before any answer arrives
+    assert events[:2] == [SectionProgress(0, 2, "א"), SectionProgress(1, 2, "ב")]
+    for index in range(2):
+        section_events = [event for event in events[2:] if event.index == index]
+        answer = sheva_on_first_letter(service._gemini.calls[index])
+        # The streamed answer grows piece by piece, then the section's final text
+        assert [event.done for event in section_events] == [False, False, True]
+        assert answer.startswith(section_events[0].text) and section_events[1].text == answer
+        assert section_events[2].text.startswith(f"{section_events[2].header}\u05b0")
+
+class LoopBoundClient:
+    """Like a grpc.aio client: unusable from any event loop but the one it was made on"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.transport = SimpleNamespace(close=self.close)
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    def check(self):
+        if self.closed or asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError("Event loop is closed")
+
+
+class LoopBoundModel:
+    def __init__(self, system_instruction=None, **kwargs):
+        self._async_client = None
+
+    async def generate_content_async(self, contents, stream=False):
+        self._async_client.check()
+        answer = sheva_on_first_letter({"target_content": contents.split("במדויק עם ניקוד בחלקים המודגשים בלבד]:\n")[1]
+                                        .split("\n\nהנחיות חשובות")[0]})
+        return LoopBoundStream(answer)
+
+
+class LoopBoundStream:
+    usage_metadata = SimpleNamespace(prompt_token_count=1, candidates_token_count=1)
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    async def __aiter__(self):
+        yield SimpleNamespace(text=self.answer)
+
+
+def test_process_files_runs_repeatedly_on_one_service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # gemini_service.log
+    clients = []
+    monkeypatch.setattr(llm_backend, "genai", SimpleNamespace(configure=lambda **kwargs: None,
+                                                              GenerativeModel=LoopBoundModel))
+    monkeypatch.setattr(llm_backend, "genai_client", SimpleNamespace(_client_manager=SimpleNamespace(
+        make_client=lambda name: clients.append(LoopBoundClient()) or clients[-1])))
+    source = Document()
+    target = Document()
+    for doc in (source, target):
+        doc.add_paragraph("א")
+    source.add_paragraph(f"{SOURCE_SECTION} {SOURCE_SECTION}")
+    target.add_paragraph(NikudService().remove_nikud(f"{SOURCE_SECTION} {SOURCE_SECTION}"))
+    source.save(tmp_path / "source.docx")
+    target.save(tmp_path / "target.docx")
+
+    service = NikudService(lexicon_path=None, requests_per_minute=None, payload="section", max_retries=0,
+                           backend=GeminiBackend(api_key="test"), cache_path=None)
+    for run in range(2):
+        output = tmp_path / f"output{run}.docx"
+        service.process_files(str(tmp_path / "source.docx"), str(tmp_path / "target.docx"), str(output))
+        assert Document(output).paragraphs[1].text.startswith("ב\u05b0")
+
+    # One client per run, closed before its loop
+    assert len(clients) == 2 and all(client.closed for client in clients)
+
+def test_span_payload_is_spliced_back_locally():
+    service = NikudService(lexicon_path=None)
+    # The first answer changes the letters of span 2 and is asked again
+    answers = iter(['{"1": "בְּרֵאשִׁית בָּרָא אֱלֹהִים", "2": "מִלָּה אַחֶרֶת"}',
+                    '```json\n{"1": "בְּרֵאשִׁית בָּרָא אֱלֹהִים"}\n```'])
+    service._gemini = FakeGemini(respond=lambda content: next(answers))
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+
+    assert service._gemini.calls[0]["spans"] == ["בראשית ברא אלהים", "מילה חדשה"]
+    assert len(service._gemini.calls) == 2
+    # Span 2 was left out of the valid answer and stays as it was
+    assert result.to_tagged() == "פירוש על <b>בְּרֵאשִׁית בָּרָא אֱלֹהִים</b> את השמים ועל <b>מילה חדשה</b> בתורה"
+
+def test_span_payload_fills_gaps_of_local_engine():
+    service = NikudService(engine="hybrid", lexicon_path=None)
+    service._gemini = FakeGemini(respond=lambda content: '{"2": "מִילָּה חֲדָשָׁה"}')
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+
+    assert result.to_tagged() == "פירוש על <b>בְּרֵאשִׁית בָּרָא אֱלֹהִים</b> את השמים ועל <b>מִילָּה חֲדָשָׁה</b> בתורה"
+
+def test_invalid_answers_are_retried_within_budget():
+    good = "פירוש על <b>בְּרֵאשִׁית בָּרָא אֱלֹהִים</b> את השמים ועל <b>מילה חדשה</b> בתורה"
+    answers = iter(["פירוש על <b>בְּרֵאשִׁית בָּרָא</b> אֱלֹהִים את השמים", good])
+    service = NikudService(lexicon_path=None, payload="section")
+    service._gemini = FakeGemini(respond=lambda content: next(answers))
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+    assert result.to_tagged() == good and len(service._gemini.calls) == 2
+
+    # No budget left: the bad answer is not used and not retried
+    service = NikudService(lexicon_path=None, payload="section", retry_budget=0)
+    service._gemini = FakeGemini(respond=lambda content: "פירוש על <b>בְּרֵאשִׁית</b>")
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", TARGET_SECTION))
+    assert result == TARGET_SECTION and len(service._gemini.calls) == 1
+
+def test_oversized_section_is_chunked_and_stitched():
+    target = RichText.from_tagged("\n".join(f"שורה {i} עם <b>מילה {i}</b> מודגשת." for i in range(30)))
+    # A sheva on the first letter of every line of the chunk
+    service = NikudService(lexicon_path=None, payload="section")
+    service._gemini = FakeGemini(max_output_tokens=300, respond=lambda content: "\n".join(
+        line[:1] + "\u05b0" * bool(line) + line[1:] for line in content['target_content'].split("\n")))
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", target))
+
+    calls = service._gemini.calls
+    # 300 // 3 answer tokens per chunk at 2 characters per token
+    assert len(calls) > 1 and all(len(RichText.from_tagged(call['target_content'])) <= 200 for call in calls)
+    assert all(call['source_content'] in SOURCE_SECTION for call in calls)
+    assert calls[0]['source_content'] != calls[-1]['source_content']
+    assert service._gemini.counted == [target.to_tagged()]
+    assert service.remove_nikud(result.text) == target.text and list(result.iter_spans()) != []
+    assert result.text.count("\u05b0") == 30
+
+def test_oversized_span_list_is_chunked():
+    spans = NikudService().remove_nikud(SOURCE_SECTION).split()
+    target = RichText.from_tagged(" ".join(f"<b>{word}</b>" for word in spans))
+    service = NikudService(lexicon_path=None)
+    # Answers by chunk-local id; the last letter gets a dagesh to show which ids landed where
+    service._gemini = FakeGemini(max_output_tokens=90, respond=lambda content: json.dumps(
+        {i: span + "\u05bc" for i, span in enumerate(content['spans'], 1)}))
+    result = process_section(service, Section("א", SOURCE_SECTION), Section("א", target))
+
+    assert len(service._gemini.calls) > 1
+    assert [span for call in service._gemini.calls for span in call['spans']] == list(dict.fromkeys(spans))
+    assert result.text.split() == [span + "\u05bc" for span in spans]
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        NikudService(engine="offline")
+    with pytest.raises(ValueError):
+        NikudService(payload="words")
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from services.nikud_lexicon import NikudLexicon, harvest
+from services.nikud_mapper import NikudMapper
+
+TOOLS_DIR = Path(__file__).parent.parent / "tools" / "nikud"
+
+
+def test_harvest_and_lookup(tmp_path):
+    path = str(tmp_path / "lexicon.bin")
+    words = "אֲשֶׁר הַחָכְמָה אֲשֶׁר אֹשֶׁר".split()
+
+    assert harvest(path, words)
+    assert not harvest(path, words)  # אותו מקור לא נספר פעמיים
+
+    lexicon = NikudLexicon(path)
+    assert len(lexicon) == 2
+    assert lexicon.forms("אשר") == [("אֲשֶׁר", 2), ("אֹשֶׁר", 1)]
+    assert lexicon.lookup("החכמה") == "הַחָכְמָה"
+    assert lexicon.lookup("שלום") is None
+    lexicon.close()
+
+
+def test_missing_lexicon_is_empty(tmp_path):
+    lexicon = NikudLexicon(str(tmp_path / "missing.bin"))
+    assert len(lexicon) == 0
+    assert lexicon.lookup("שלום") is None
+
+
+def test_mapper_falls_back_to_lexicon(tmp_path):
+    source_text = (TOOLS_DIR / "source_nikud.txt").read_text(encoding="utf-8")
+    path = str(tmp_path / "lexicon.bin")
+    harvest(path, source_text.split())
+
+    # טקסט קצר מדי לחפיפה - מנוקד רק לפי המילון
+    mapper = NikudMapper(lexicon_path=path)
+    expected = f"{mapper.lexicon.lookup('החכמה')}, {mapper.lexicon.lookup('אשר')}!"
+    assert mapper.add_nikud_to_text(source_text, "החכמה, אשר!") == expected
+    assert mapper._has_nikud(expected)
+    assert NikudMapper().add_nikud_to_text(source_text, "החכמה, אשר!") == "החכמה, אשר!"
+
+
+def test_concurrent_harvests_keep_every_source(tmp_path):
+    path = str(tmp_path / "lexicon.bin")
+    sources = [[f"אֲשֶׁר{'א' * i}"] for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(lambda words: harvest(path, words), sources))
+
+    lexicon = NikudLexicon(path)
+    assert len(lexicon) == len(lexicon.sources()) == 8
+    lexicon.close()
+    assert sorted(os.listdir(tmp_path)) == ["lexicon.bin", "lexicon.bin.lock"]
+
+
+def test_harvest_source_matches_index_harvest(tmp_path):
+    source_text = (TOOLS_DIR / "source_nikud.txt").read_text(encoding="utf-8")
+    path = str(tmp_path / "lexicon.bin")
+    mapper = NikudMapper(lexicon_path=path)
+    mapper.harvest_source(source_text)
+
+    # אותו מקור דרך האינדקס - כבר במילון
+    assert not harvest(path, mapper.build_index(source_text).nikud_words)
+    assert mapper.lexicon.lookup("החכמה") is not None
@@ -0,0 +1,177 @@
+from pathlib import Path
+import re
+
+import pytest
+
+from services import source_index
+from services.nikud_mapper import NikudMapper
+from services.source_index import SourceIndex
+
+TOOLS_DIR = Path(__file__).parent.parent / "tools" / "nikud"
+
+
+@pytest.fixture
+def mapper():
+    return NikudMapper()
+
+
+@pytest.fixture
+def texts():
+    source_text = (TOOLS_DIR / "source_nikud.txt").read_text(encoding="utf-8")
+    target_text = (TOOLS_DIR / "source_plain.txt").read_text(encoding="utf-8")
+    return source_text, target_text
+
+
+def test_find_overlap_uses_anchors(mapper, texts):
+    source_text, target_text = texts
+    _, source_clean = mapper._create_virtual_copy(source_text)
+
+    start_s, end_s, start_t, end_t = mapper._find_overlap(source_clean, target_text)
+
+    assert end_s - start_s == end_t - start_t >= mapper.min_size
+    # החפיפה נמצאת באותו אלכסון בתחילת הטקסט
+    assert (start_s, start_t) == (0, 0)
+    target_words = re.findall(r"[֐-׿]+", target_text)
+    assert mapper._skeleton(source_clean[start_s + 5]) == mapper._skeleton(target_words[start_t + 5])
+
+
+def test_find_overlap_short_target(mapper, texts):
+    source_text, _ = texts
+    _, source_clean = mapper._create_virtual_copy(source_text)
+
+    assert mapper._find_overlap(source_clean, "הקודש העצמי") == (0, 0, 0, 0)
+
+
+def test_anchor_index_is_built_once(mapper, texts):
+    source_text, target_text = texts
+    _, source_clean = mapper._create_virtual_copy(source_text)
+
+    mapper._find_overlap(source_clean, target_text)
+    cached = mapper._anchor_cache
+    mapper._find_overlap(source_clean, target_text)
+
+    assert mapper._anchor_cache is cached
+
+
+def test_align_mode_vocalizes_whole_text(texts):
+    source_text, target_text = texts
+    window = NikudMapper().add_nikud_to_text(source_text, target_text)
+    aligned = NikudMapper(mode="align").add_nikud_to_text(source_text, target_text)
+
+    def vocalized_words(text):
+        return sum(NikudMapper()._has_nikud(w) for w in re.findall(r"[֐-׿]+", text))
+
+    assert vocalized_words(aligned) > vocalized_words(window)
+    # הטקסט של היעד נשמר במלואו, כולל פיסוק ורווחים
+    assert NikudMapper()._strip_nikud(aligned) == target_text
+
+
+def test_transfer_nikud_keeps_target_spelling(mapper):
+    assert mapper._transfer_nikud("הַקֹּדֶשׁ", "הקודש") == "הַקּוֹדֶשׁ"
+    assert mapper._transfer_nikud("וּמֻגְבָּל", "ומוגבל") == "וּמוּגְבָּל"
+    assert mapper._transfer_nikud("בְּרוּם", "ברום") == "בְּרוּם"
+    assert mapper._transfer_nikud("שָׁלוֹם", "ברום") == "ברום"
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        NikudMapper(mode="fast")
+
+
+def test_source_index_reused_and_persisted(tmp_path, texts):
+    source_text, target_text = texts
+    mapper = NikudMapper(mode="align", persist_index=True)
+    index = mapper.build_index(source_text)
+
+    assert mapper.add_nikud_to_text(index, target_text) == mapper.add_nikud_to_text(source_text, target_text)
+    start, end = index.word_span(0)
+    assert source_text[start:end] == index.nikud_words[0]
+
+    source_path = tmp_path / "source.docx"
+    source_path.write_bytes(b"placeholder")
+    index.save(str(source_path))
+    loaded = mapper.load_source_index(str(source_path))
+    assert loaded.nikud_words == index.nikud_words
+    assert loaded.anchors == index.anchors
+    assert len({index, loaded}) == 2  # hashable, by identity
+
+
+def test_source_index_stale_after_normalization_change(tmp_path, texts, monkeypatch):
+    source_text, _ = texts
+    source_path = tmp_path / "source.docx"
+    source_path.write_bytes(b"placeholder")
+    NikudMapper().build_index(source_text).save(str(source_path))
+    assert SourceIndex.load(str(source_path), 3) is not None
+
+    # טבלאות הנרמול השתנו - האינדקס השמור אינו תקף
+    monkeypatch.setattr(source_index, "normalization_digest", lambda: "changed")
+    assert SourceIndex.load(str(source_path), 3) is None
+
+
+def test_scan_windows_batched(texts):
+    source_text, target_text = texts
+    mapper = NikudMapper(workers=1)
+    _, source_clean = mapper._create_virtual_copy(source_text)
+    target_words = re.findall(r"[֐-׿]+", target_text)
+
+    # היעד מוזז בעשר מילים ביחס למקור
+    assert mapper._scan_windows(source_clean[:60], target_words[10:70]) == (10, 60, 0, 50)
+
+
+def test_parallel_paragraphs_match_serial(tmp_path):
+    from docx import Document
+
+    source_path = str(Path(__file__).parent.parent / "temp_source.docx")
+    input_path = str(TOOLS_DIR / "input.docx")
+    serial_path, parallel_path = tmp_path / "serial.docx", tmp_path / "parallel.docx"
+
+    NikudMapper().process_docx(input_path, str(serial_path), source_path)
+    NikudMapper(processes=2, chunk_size=1, parallel_min_paragraphs=1).process_docx(
+        input_path, str(parallel_path), source_path)
+
+    serial = [p.text for p in Document(serial_path).paragraphs]
+    parallel = [p.text for p in Document(parallel_path).paragraphs]
+    assert parallel == serial
+    assert any(NikudMapper()._has_nikud(text) for text in parallel)
+
+
+def test_banded_search_widens_from_cursor(texts):
+    source_text, target_text = texts
+    mapper = NikudMapper(band_size=20)
+    index = mapper.build_index(source_text)
+
+    # הסמן בתחילת המקור והחפיפה רחוקה ממנו - הרצועה מתרחבת עד שנמצאת
+    target_text = " ".join(re.findall(r"[֐-׿]+", target_text)[400:700])
+    match = mapper._find_overlap_near(index, target_text, cursor=0)
+    assert match[0] > 4 * mapper.band_size
+    assert match == mapper._find_overlap(index, target_text)
+    assert mapper._align_cursors(index, match, 0) == match[1]
+    assert mapper._align_cursors(index, (0, 0, 0, 0), 7) == 7
+
+
+def test_banded_search_falls_back_to_full_fuzzy_scan(texts, monkeypatch):
+    source_text, target_text = texts
+    mapper = NikudMapper(band_size=20)
+    index = mapper.build_index(source_text)
+    # העוגנים מחטיאים - רק הסריקה העמומה יכולה למצוא את החפיפה, רחוק מהסמן
+    monkeypatch.setattr(mapper, "_find_anchor_overlap", lambda *args: None)
+
+    target_text = " ".join(re.findall(r"[֐-׿]+", target_text)[400:700])
+    match = mapper._find_overlap_near(index, target_text, cursor=0)
+    assert match[0] > mapper.band_size
+    assert match == mapper._find_overlap(index, target_text)
+
+
+def test_banded_search_skips_full_scan_without_anchor_hits(texts, monkeypatch):
+    source_text, _ = texts
+    mapper = NikudMapper(band_size=20)
+    index = mapper.build_index(source_text)
+    scanned = []
+    scan_windows = mapper._scan_windows
+    monkeypatch.setattr(mapper, "_scan_windows", lambda source, target, regions=None: scanned.append(len(source)) or
+                        scan_windows(source, target, regions))
+
+    # פסקה שאינה במקור - סריקה עמומה ברצועה ההתחלתית בלבד
+    target_text = " ".join(["אבגד", "הוזח", "טיכל", "מנסע", "פצקר", "שתאב"] * 10)
+    assert mapper._find_overlap_near(index, target_text, cursor=0) == (0, 0, 0, 0)
+    assert scanned == [mapper.band_size]
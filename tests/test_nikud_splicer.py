@@ -0,0 +1,32 @@
+from services.nikud_splicer import splice_runs, splice_words
+
+
+def test_splice_words_keeps_punctuation_and_spacing():
+    text = "שלום,  עולם! 123 (ברום)"
+    spans = [(0, 4), (7, 11), (18, 22)]
+    result = splice_words(text, spans, ["שָׁלוֹם", None, "בְּרוּם"])
+
+    assert result == "שָׁלוֹם,  עולם! 123 (בְּרוּם)"
+
+
+def test_splice_words_rejects_different_letters():
+    assert splice_words("שלום עולם", [(0, 4)], ["שָׁלֵם"]) == "שלום עולם"
+
+
+def test_splice_paths_agree_on_cantillation():
+    # מקור עם טעמים (טיפחא, אתנחתא): שני המסלולים מקבלים אותה החלפה
+    replacements = ["בְּרֵאשִׁ֖ית", "בָּרָ֑א"]
+    spans = [(0, 6), (7, 10)]
+
+    assert splice_words("בראשית ברא", spans, replacements) == "בְּרֵאשִׁ֖ית בָּרָ֑א"
+    assert splice_runs(["בראשית ", "ברא"], spans, replacements) == ["בְּרֵאשִׁ֖ית ", "בָּרָ֑א"]
+
+
+def test_splice_runs_word_across_runs():
+    # "בראשית" מפוצלת בין ריצה מודגשת לריצה רגילה
+    runs = ["על ב", "ראשית", " ברא."]
+    spans = [(0, 2), (3, 9), (10, 13)]
+    replacements = [None, "בְּרֵאשִׁית", "בָּרָא"]
+
+    assert splice_runs(runs, spans, replacements) == ["על בְּ", "רֵאשִׁית", " בָּרָא."]
+    assert splice_runs(runs, spans, replacements, writable=[True, False, True]) == ["על בְּ", "ראשית", " בָּרָא."]
@@ -0,0 +1,30 @@
+import asyncio
+import time
+
+import pytest
+
+from services.rate_limiter import RateLimiter, with_retries
+
+
+def test_rate_limiter_spreads_requests_over_the_window():
+    limiter = RateLimiter(requests_per_minute=3, period=0.2)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(7)))
+        return time.monotonic() - started
+
+    # 3 now, 3 after one window, 1 after two
+    assert 0.4 <= asyncio.run(run()) < 0.6
+
+
+def test_with_retries_raises_other_errors_at_once():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(with_retries(call, (ConnectionError,), retries=3, base_delay=0))
+    assert len(calls) == 1
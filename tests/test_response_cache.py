@@ -0,0 +1,25 @@
+from services.response_cache import ResponseCache
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    key = ResponseCache.key("model", {"temperature": 1}, "מקור", "יעד")
+
+    assert cache.get(key) is None
+    cache.put(key, "תשובה")
+    assert cache.get(key) == "תשובה"
+    assert key == ResponseCache.key("model", {"temperature": 1}, "מקור", "יעד")
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": len("תשובה".encode('utf-8'))}
+    cache.delete(key)
+    assert cache.get(key) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+    for key in "abc":
+        cache.put(key, key * 10)
+    # c evicted a; reading b makes c the oldest
+    assert cache.get("b") == "b" * 10
+    cache.put("d", "d" * 10)
+
+    assert [cache.get(key) is not None for key in "abcd"] == [False, True, False, True]
@@ -0,0 +1,19 @@
+from services.response_validator import validate_section_response, validate_span_response
+
+ORIGINAL = "פרק א\nפירוש על <b>בראשית</b> ועל <b>ברא</b> בתורה\n"
+
+
+def test_section_answer_may_only_add_marks():
+    assert validate_section_response(ORIGINAL, "פרק א\nפירוש על <b>בְּרֵאשִׁית</b> ועל <b>בָּרָא</b> בתורה") is None
+    assert "תגיות" in validate_section_response(ORIGINAL, "פרק א\nפירוש על <b>בְּרֵאשִׁית ועל בָּרָא</b> בתורה")
+    assert "קטועה" in validate_section_response(ORIGINAL, "פרק א\nפירוש על <b>בְּרֵאשִׁית</b> ועל")
+    assert validate_section_response(ORIGINAL, "פרק א\nפירוש על <b>בְּרֵאשִׁית</b> ועוד <b>בָּרָא</b> בתורה") \
+        == 'הטקסט השתנה (מתו 31: "וד <b>בָּרָא</b> בתו")'
+
+
+def test_span_answer_letters_and_json():
+    spans = ["בראשית", "ברא אלהים"]
+
+    assert validate_span_response(spans, '{"2": "בָּרָא אֱלֹהִים"}') is None
+    assert validate_span_response(spans, '{"1": "בְּרֵאשִׁית", "2": "בָּרָא') == "התשובה אינה JSON תקין"
+    assert validate_span_response(spans, '{"1": "בָּרָא", "3": "אֱלֹהִים"}') == "2 קטעים חזרו עם אותיות שונות"
@@ -0,0 +1,45 @@
+import re
+from array import array
+
+from services.rich_text import BOLD, RichText, coalesce_bold_runs
+
+TAGGED = "פירוש על ב<b>ראשית ברא</b> אלהים <b>את</b>"
+
+
+def test_tagged_round_trip():
+    rich = RichText.from_tagged(TAGGED)
+
+    assert rich.text == "פירוש על בראשית ברא אלהים את"
+    assert list(rich.iter_spans(BOLD)) == [(10, 19), (26, 28)]
+    assert rich.to_tagged() == TAGGED
+    # Unbalanced and empty tags carry no span
+    assert RichText.from_tagged("א</b>ב<b></b>ג<b>ד").to_tagged() == "אבגד"
+
+
+def test_slice_and_concat():
+    rich = RichText.from_tagged(TAGGED)
+
+    assert rich.slice(12, 22).to_tagged() == "<b>שית ברא</b> אל"
+    # Spans cut by the slice boundary are joined back
+    assert RichText.concat([rich.slice(0, 14), rich.slice(14, len(rich))]) == rich
+
+
+def test_splice_moves_spans_with_letters():
+    rich = RichText.from_tagged(TAGGED)
+    words = [match.span() for match in re.finditer(r"[֐-׿]+", rich.text)]
+
+    spliced = rich.splice(words, [None, None, "בְּרֵאשִׁית", "בָּרָא", "אֱלֹהִים", "שָׁלוֹם"])
+
+    # The span starting inside בראשית stays after its first letter; שלום does not fit את
+    assert spliced.to_tagged() == "פירוש על בְּ<b>רֵאשִׁית בָּרָא</b> אֱלֹהִים <b>את</b>"
+    assert rich.splice(words, [None] * len(words)) is rich
+    assert spliced.spans.typecode == array("I").typecode
+
+
+def test_coalesce_bold_runs():
+    runs = [("", False), (" ", True), ("פירוש ", False), ("ברא", True), ("שית", True), (" ", False),
+            ("\t", True), ("ברא", True), ("", True), (" ", True), ("על ", False), ("פי", False), (" ", False)]
+
+    assert coalesce_bold_runs(runs) == [(" פירוש ", False), ("בראשית \tברא", True), (" על פי ", False)]
+    assert coalesce_bold_runs([("א", True), (" ", False)]) == [("א", True), (" ", False)]
+    assert coalesce_bold_runs([]) == []
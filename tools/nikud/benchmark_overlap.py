@@ -0,0 +1,85 @@
+"""Benchmark NikudMapper._find_overlap (anchor index) against the fixed-window scans.
+
+Usage: python tools/nikud/benchmark_overlap.py [repeat] [--legacy]
+
+The fixed-window fallback is timed both batched (`_scan_windows`, rapidfuzz cdist)
+and as the original one-`fuzz.ratio`-per-pair loop. The small case aligns
+source_plain.txt against source_nikud.txt. The large case
+pads the vocalized source with `repeat` copies of the vocalized book in
+temp_source.docx, so the source grows while the target stays the same. The
+fixed-window scan only runs on the large case with --legacy (it takes minutes).
+"""
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+from docx import Document  # noqa: E402
+from rapidfuzz import fuzz  # noqa: E402
+from services.nikud_mapper import NikudMapper  # noqa: E402
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def pairwise_scan(mapper: NikudMapper, source_words, target_words):
+    """The original fallback: one fuzz.ratio call per window pair"""
+    best_match, best_score = None, 0
+    max_size = min(mapper.max_window, len(target_words))
+    for size in range(mapper.min_size, max_size + 1, 10):
+        for j in range(0, len(target_words) - size + 1, 10):
+            target_slice = ' '.join(target_words[j:j + size])
+            for i in range(0, len(source_words) - size + 1, 10):
+                ratio = fuzz.ratio(' '.join(source_words[i:i + size]), target_slice)
+                if ratio < mapper.similarity_threshold:
+                    continue
+                score = mapper._score_overlap(size, ratio, j, len(target_words), max_size)
+                if score > best_score:
+                    best_score, best_match = score, (i, i + size, j, j + size)
+                    if score > 0.85:
+                        return best_match
+    return best_match
+
+
+def run_case(mapper: NikudMapper, name: str, source_text: str, target_text: str, legacy: bool = True):
+    _, source_clean = mapper._create_virtual_copy(source_text)
+    target_words = [mapper._strip_nikud(w) for w in re.findall(r'[֐-׿]+', target_text)]
+
+    anchor_result, anchor_time = _timed(mapper._find_overlap, source_clean, target_text)
+    print(f"{name}: {len(source_clean)} source words, {len(target_words)} target words")
+    print(f"  anchors: {anchor_time:8.3f}s  -> {anchor_result}")
+
+    if legacy:
+        batched_result, batched_time = _timed(mapper._scan_windows, source_clean, target_words)
+        print(f"  cdist:   {batched_time:8.3f}s  -> {batched_result}")
+        scan_result, scan_time = _timed(pairwise_scan, mapper, source_clean, target_words)
+        print(f"  scan:    {scan_time:8.3f}s  -> {scan_result}")
+        print(f"  speedup: {scan_time / max(anchor_time, 1e-9):8.0f}x anchors, "
+              f"{scan_time / max(batched_time, 1e-9):.1f}x cdist")
+
+
+def main():
+    numbers = [arg for arg in sys.argv[1:] if arg.isdigit()]
+    repeat = int(numbers[0]) if numbers else 5
+    here = os.path.dirname(__file__)
+    with open(os.path.join(here, 'source_nikud.txt'), encoding='utf-8') as f:
+        source_text = f.read()
+    with open(os.path.join(here, 'source_plain.txt'), encoding='utf-8') as f:
+        target_text = f.read()
+
+    run_case(NikudMapper(), "tools/nikud", source_text, target_text)
+
+    book = '\n'.join(p.text for p in Document(os.path.join(ROOT, 'temp_source.docx')).paragraphs)
+    padded = '\n'.join([book] * repeat + [source_text] + [book] * repeat)
+    run_case(NikudMapper(), f"tools/nikud inside {2 * repeat} book copies", padded, target_text,
+             legacy='--legacy' in sys.argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark the whole nikud pipeline offline, with recorded LLM responses.
+
+Usage: python tools/nikud/benchmark_pipeline.py [recordings.jsonl] [--record]
+           [--latency S] [--chunk-latency S] [--concurrency N ...]
+
+Processes temp_source.docx / temp_target.docx with engine="gemini" through a ReplayBackend,
+once per concurrency level, without the response cache or the requests-per-minute quota.
+--record sends requests with no recording to Gemini (GEMINI_API_KEY from the environment
+or the Streamlit secrets) and appends them to the recordings; record once, then every run
+is offline and reproducible. --latency is the synthetic time to the first piece of each
+response, --chunk-latency the time between replayed pieces.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+from services.llm_backend import GeminiBackend, ReplayBackend  # noqa: E402
+from services.nikud_service import NikudService  # noqa: E402
+
+
+def run(backend: ReplayBackend, concurrency: int) -> None:
+    service = NikudService(engine="gemini", lexicon_path=None, concurrency=concurrency,
+                           requests_per_minute=None, backend=backend, cache_path=None)
+    requests_before = backend.usage["requests"]
+    output_path = os.path.join(tempfile.gettempdir(), 'benchmark_output.docx')
+    start = time.perf_counter()
+    service.process_files(os.path.join(ROOT, 'temp_source.docx'), os.path.join(ROOT, 'temp_target.docx'),
+                          output_path)
+    elapsed = time.perf_counter() - start
+    requests = backend.usage["requests"] - requests_before
+    print(f"concurrency {concurrency:3}: {elapsed:8.2f}s, {requests} requests, "
+          f"{requests / max(elapsed, 1e-9):6.1f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recordings', nargs='?', default=os.path.join(os.path.dirname(__file__), 'recordings.jsonl'))
+    parser.add_argument('--record', action='store_true')
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--chunk-latency', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    record_from = GeminiBackend(api_key=os.environ.get("GEMINI_API_KEY")) if args.record else None
+    backend = ReplayBackend(args.recordings, record_from=record_from, latency=args.latency,
+                            seconds_per_chunk=args.chunk_latency)
+    print(f"{len(backend.recordings)} recorded responses in {args.recordings}")
+    for concurrency in args.concurrency:
+        run(backend, concurrency)
+
+
+if __name__ == '__main__':
+    main()
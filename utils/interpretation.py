@@ -1,36 +1,31 @@
 import streamlit as st
-import anthropic
 import json
 import re
+from typing import Optional
+from services.llm_backend import AnthropicBackend, LLMBackend
 from services.usage_logger import UsageLogger
 from prompt_template import SYSTEM_PROMPT, PROMPT_TEMPLATE
 
-def get_interpretation(text):
-    api_key = st.secrets["ANTHROPIC_API_KEY"]
-    model_name = "claude-sonnet-4-6"
-    client = anthropic.Anthropic(api_key=api_key)
+def get_interpretation(text, backend: Optional[LLMBackend] = None):
+    """Interpretation of text as a dict, or None; backend defaults to AnthropicBackend"""
+    backend = backend or AnthropicBackend()
     
-    message = client.messages.create(
-        model=model_name,
-        max_tokens=4096,
-        system=SYSTEM_PROMPT,
-        messages=[{
-            "role": "user", 
-            "content": PROMPT_TEMPLATE.format(
-                text_to_analyze=text
-            )
-        }]
+    completion = backend.generate(
+        PROMPT_TEMPLATE.format(
+            text_to_analyze=text
+        ),
+        system=SYSTEM_PROMPT
     )
     
     # Log usage
     try:
         usage = {
-            "input_tokens": message.usage.input_tokens,
-            "output_tokens": message.usage.output_tokens
+            "input_tokens": completion.usage.prompt_tokens,
+            "output_tokens": completion.usage.output_tokens
         }
         usage_logger = UsageLogger()
         usage_logger.log_usage(
-            model_name=message.model,
+            model_name=backend.model_name,
             usage=usage
         )
     except Exception as e:
@@ -38,7 +33,7 @@ def get_interpretation(text):
     
     # Parse response
     try:
-        response_text = message.content[0].text
+        response_text = completion.text
         
         # Extract JSON from code block
         json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL | re.MULTILINE)